@@ -0,0 +1,92 @@
+# Ranking de lotes: la rúbrica de N animales como matriz (N, 11) y todo en NumPy
+# (score ponderado por categoría, percentiles, z-scores, outliers y top-K) en una pasada.
+import warnings
+
+import numpy as np
+
+import rubric
+
+# pesos por métrica en orden rubric.ORDER:
+# BCS, conformación, línea dorsal, angulación costillar, profundidad de pecho, aplomos,
+# lomo, grupo/muscling, balance, ancho torácico, inserción de cola
+WEIGHTS = {
+    # levante: estructura y capacidad de crecer; la condición actual pesa poco
+    "levante":    [0.6, 1.5, 1.2, 1.0, 1.2, 1.5, 1.0, 1.0, 1.2, 1.0, 0.5],
+    # vaca flaca: se compra delgada; importan aplomos y capacidad para recuperar
+    "vaca_flaca": [0.5, 1.2, 1.0, 1.2, 1.3, 1.5, 0.8, 0.8, 1.0, 1.3, 0.5],
+    # engorde: acabado y musculatura
+    "engorde":    [1.5, 1.0, 0.8, 0.8, 1.2, 0.8, 1.4, 1.6, 0.8, 1.3, 0.4],
+}
+
+def weights_for(category):
+    return np.asarray(WEIGHTS.get((category or "").strip().lower(), [1.0] * rubric.N), dtype=np.float64)
+
+def _robust_scale(M, med):
+    # MAD escalado; con puntuaciones en pasos de 0.5 la MAD suele ser 0: se usa la desviación media absoluta
+    dev = np.abs(M - med)
+    mad = np.nanmedian(dev, axis=0) / 0.6745
+    mean_ad = np.nanmean(dev, axis=0) * 1.2533
+    scale = np.where(mad > 0, mad, mean_ad)
+    return np.where(scale > 0, scale, np.nan)
+
+def analyze(M, weights, k=20, outlier_z=3.5):
+    # M: (n, 11) con NaN donde falta la métrica. Devuelve arrays por animal y agregados del lote.
+    M = np.asarray(M, dtype=np.float64)
+    n = M.shape[0]
+    if n == 0:
+        return {"n": 0, "score": np.zeros(0), "percentile": np.zeros(0), "z": np.zeros(0), "metric_z": np.zeros((0, rubric.N)),
+                "outlier": np.zeros(0, bool), "robust_z": np.zeros((0, rubric.N)), "top": np.zeros(0, int),
+                "metric_mean": np.full(rubric.N, np.nan), "metric_std": np.full(rubric.N, np.nan), "score_percentiles": {}}
+    w = np.asarray(weights, dtype=np.float64)
+    valid = ~np.isnan(M)
+    X = np.where(valid, M, 0.0)
+    # media ponderada sobre las métricas presentes de cada animal
+    wsum = valid @ w
+    score = np.divide(X @ w, wsum, out=np.full(n, np.nan), where=wsum > 0)
+    # columnas enteras sin datos (p.ej. métrica nunca devuelta) dan NaN sin avisos
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mu, sd = np.nanmean(M, axis=0), np.nanstd(M, axis=0)
+        metric_z = (M - mu) / np.where(sd > 0, sd, np.nan)
+        s_sd = np.nanstd(score)
+        z = (score - np.nanmean(score)) / (s_sd if s_sd > 0 else np.nan)
+        med = np.nanmedian(M, axis=0)
+        robust_z = (M - med) / _robust_scale(M, med)
+    filled = np.where(np.isnan(score), -np.inf, score)
+    # percentil por rango dentro del lote (0 = peor, 100 = mejor); empates con el rango medio,
+    # así el mismo score da el mismo percentil sin importar el orden de entrada
+    _, inv, counts = np.unique(filled, return_inverse=True, return_counts=True)
+    mid = np.cumsum(counts) - (counts + 1) / 2.0
+    pct = mid[inv.reshape(-1)] * (100.0 / max(n - 1, 1))
+    outlier = np.nanmax(np.where(np.isnan(robust_z), 0.0, np.abs(robust_z)), axis=1) > outlier_z
+    k = max(0, min(int(k), n))
+    top = np.argpartition(-filled, k - 1)[:k] if k else np.zeros(0, int)
+    top = top[np.argsort(-filled[top], kind="stable")]
+    qs = np.nanpercentile(score, [10, 25, 50, 75, 90]) if np.isfinite(score).any() else [np.nan] * 5
+    return {"n": n, "score": score, "percentile": pct, "z": z, "metric_z": metric_z, "outlier": outlier, "robust_z": robust_z,
+            "top": top, "metric_mean": mu, "metric_std": sd, "score_percentiles": dict(zip(("p10", "p25", "p50", "p75", "p90"), qs))}
+
+def _num(x, nd=3):
+    x = float(x)
+    return round(x, nd) if np.isfinite(x) else None
+
+def ranking(rows, M, category=None, k=20, outlier_z=3.5, max_outliers=100):
+    # rows: (id, animal_id, sid, category, created, global_score) alineadas con M (ver store.matrix)
+    w = weights_for(category)
+    a = analyze(M, w, k, outlier_z)
+    def animal(i):
+        r = rows[i]
+        return {"id": r[0], "animal_id": r[1], "sid": r[2], "category": r[3], "created": r[4], "global_score": r[5],
+                "score": _num(a["score"][i]), "percentile": _num(a["percentile"][i], 1), "z": _num(a["z"][i])}
+    outliers = []
+    for i in np.flatnonzero(a["outlier"])[:max_outliers]:
+        flagged = np.flatnonzero(np.abs(np.nan_to_num(a["robust_z"][i])) > outlier_z)
+        outliers.append({**animal(i), "metrics": {rubric.ORDER[j]: {"value": _num(M[i, j], 1), "robust_z": _num(a["robust_z"][i, j], 2)} for j in flagged}})
+    return {
+        "count": a["n"], "category": category, "weights": dict(zip(rubric.ORDER, w.tolist())),
+        "score_percentiles": {p: _num(v) for p, v in a["score_percentiles"].items()},
+        "metric_mean": {m: _num(v, 2) for m, v in zip(rubric.ORDER, a["metric_mean"])},
+        "metric_std": {m: _num(v, 2) for m, v in zip(rubric.ORDER, a["metric_std"])},
+        "top": [animal(i) for i in a["top"]],
+        "outliers_count": int(a["outlier"].sum()), "outliers": outliers,
+    }
@@ -0,0 +1,178 @@
+# Front-end: static/index.html se parte en un shell HTML mínimo + CSS/JS minificados con hash de
+# contenido en el nombre (static/dist), precomprimidos en gzip/brotli y servidos con caché inmutable.
+#   python assets.py    # compila a mano (el servidor también compila al arrancar si hace falta)
+import gzip, hashlib, json, os, re, sys
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+SRC = os.getenv("GB_ASSETS_SRC", "static/index.html")
+OUT = os.getenv("GB_ASSETS_DIR", "static/dist")
+PREFIX = "/static/dist/"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_RE_BLOCK = re.compile(r"<(style|script)>(.*?)</\1>", re.S)
+_RE_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_RE_CSS_PUNCT = re.compile(r"\s*([{};,>])\s*")
+_TYPES = {".css": "text/css; charset=utf-8", ".js": "text/javascript; charset=utf-8", ".html": "text/html; charset=utf-8"}
+
+def minify_css(css):
+    css = re.sub(r"\s+", " ", _RE_CSS_COMMENT.sub("", css))
+    return _RE_CSS_PUNCT.sub(r"\1", css).replace(";}", "}").strip()
+
+_REGEX_PREV = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+def _template_lines(js):
+    # Para cada línea: (empieza dentro de un template literal, termina dentro). Escáner léxico mínimo:
+    # cadenas, comentarios, regex literales y `${...}` anidados, lo justo para no confundir un ` suelto.
+    lines, mode, depth, i, n, prev, start = [], ["code"], [0], 0, len(js), "", False
+    while i < n:
+        c = js[i]
+        if c == "\n":
+            inside = mode[-1] == "tpl"
+            lines.append((start, inside)); start = inside; i += 1; continue
+        if mode[-1] == "tpl":
+            if c == "\\": i += 2; continue
+            if c == "`": mode.pop(); prev = "`"
+            elif js.startswith("${", i): mode.append("code"); depth.append(0); i += 1
+            i += 1; continue
+        if c in "'\"":
+            j = i + 1
+            while j < n and js[j] not in (c, "\n"): j += 2 if js[j] == "\\" else 1
+            i, prev = j + (j < n and js[j] == c), c; continue
+        if js.startswith("//", i):
+            while i < n and js[i] != "\n": i += 1
+            continue
+        if js.startswith("/*", i):
+            j = js.find("*/", i + 2); j = n if j < 0 else j + 2
+            for _ in range(js.count("\n", i, j)): lines.append((start, False)); start = False
+            i = j; continue
+        if c == "/" and prev in _REGEX_PREV:
+            j, cls = i + 1, False
+            while j < n and js[j] != "\n" and (cls or js[j] != "/"):
+                if js[j] == "\\": j += 1
+                elif js[j] == "[": cls = True
+                elif js[j] == "]": cls = False
+                j += 1
+            i, prev = j + (j < n and js[j] == "/"), "/"; continue
+        if c == "`": mode.append("tpl")
+        elif c == "{": depth[-1] += 1
+        elif c == "}":
+            if depth[-1] == 0 and len(mode) > 1: mode.pop(); depth.pop(); prev = "`"; i += 1; continue
+            depth[-1] -= 1
+        if not c.isspace(): prev = c
+        i += 1
+    lines.append((start, mode[-1] == "tpl"))
+    return lines
+
+def minify_js(js):
+    # conservador (sin parser): se quitan sangrías, líneas vacías y comentarios de línea completa;
+    # los saltos de línea se mantienen para no depender de la inserción automática de ';'.
+    # El contenido de los template literals (`...`) se deja intacto: ahí sangría y "//" son texto.
+    out = []
+    for line, (start, end) in zip(js.split("\n"), _template_lines(js)):
+        if not start: line = line.lstrip()
+        if not end: line = line.rstrip()
+        if start or end or (line and not line.startswith("//")): out.append(line)
+    return "\n".join(out)
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def _write(path, data):
+    # escritura atómica: varios workers pueden compilar a la vez
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f: f.write(data)
+    os.replace(tmp, path)
+
+def _emit(out, name, data):
+    _write(os.path.join(out, name), data)
+    _write(os.path.join(out, name + ".gz"), gzip.compress(data, 9, mtime=0))
+    if brotli is not None: _write(os.path.join(out, name + ".br"), brotli.compress(data, quality=11))
+
+def build(src=SRC, out=OUT):
+    # Cada <style>/<script> en línea pasa a un archivo propio en su misma posición: el orden de
+    # ejecución de los scripts (síncronos, sin defer) no cambia.
+    with open(src, "rb") as f: raw = f.read()
+    os.makedirs(out, exist_ok=True)
+    files, n = [], 0
+    def repl(m):
+        nonlocal n
+        kind, body = m.group(1), m.group(2)
+        data = (minify_css(body) if kind == "style" else minify_js(body)).encode("utf-8")
+        name = f"{'style' if kind == 'style' else 'app'}-{n}.{_digest(data)}.{'css' if kind == 'style' else 'js'}"
+        n += 1
+        _emit(out, name, data); files.append(name)
+        return f'<link rel="stylesheet" href="{PREFIX}{name}"/>' if kind == "style" else f'<script src="{PREFIX}{name}"></script>'
+    shell = _RE_BLOCK.sub(repl, raw.decode("utf-8")).encode("utf-8")
+    _emit(out, "index.html", shell)
+    manifest = {"source": _digest(raw), "shell": "index.html", "files": files}
+    _write(os.path.join(out, "manifest.json"), json.dumps(manifest, indent=1).encode("utf-8"))
+    # versiones antiguas: los hashes que ya no están en el manifiesto sobran
+    keep = set(files) | {"index.html", "manifest.json"}
+    for f in os.listdir(out):
+        if f.removesuffix(".gz").removesuffix(".br") not in keep and not f.endswith(".tmp"):
+            try: os.unlink(os.path.join(out, f))
+            except OSError: pass
+    return manifest
+
+def _fresh(src, out):
+    try:
+        with open(os.path.join(out, "manifest.json")) as f: m = json.load(f)
+        with open(src, "rb") as f: return m["source"] == _digest(f.read()) and all(os.path.exists(os.path.join(out, n)) for n in m["files"])
+    except (OSError, ValueError, KeyError):
+        return False
+
+def _accepts(request, coding):
+    # Accept-Encoding simple: "br;q=0" cuenta como rechazo
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, q = part.strip().partition(";")
+        if name.strip() == coding: return q.strip().replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+class Assets:
+    # Archivos de static/dist en memoria (pocos KB) con su ETag; negocia br > gzip > identidad.
+    def __init__(self, out=OUT):
+        self.out, self.files = out, {}
+        for name in os.listdir(out):
+            base, ext = os.path.splitext(name)
+            if ext in (".gz", ".br") or name.endswith(".tmp") or name == "manifest.json": continue
+            entry = {"type": _TYPES.get(ext, "application/octet-stream"), "etag": None, "identity": None}
+            for coding, suffix in (("identity", ""), ("gzip", ".gz"), ("br", ".br")):
+                p = os.path.join(out, name + suffix)
+                if os.path.exists(p):
+                    with open(p, "rb") as f: entry[coding] = f.read()
+            entry["etag"] = _digest(entry["identity"])
+            self.files[name] = entry
+
+    def response(self, request, name, cache_control=IMMUTABLE):
+        entry = self.files.get(name)
+        if entry is None: return Response("no encontrado", status_code=404, media_type="text/plain")
+        coding = next((c for c in ("br", "gzip") if entry.get(c) is not None and _accepts(request, c)), "identity")
+        etag = f'"{entry["etag"]}-{coding}"' if coding != "identity" else f'"{entry["etag"]}"'
+        headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+        if coding != "identity": headers["Content-Encoding"] = coding
+        inm = request.headers.get("if-none-match", "")
+        if inm and (inm.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in inm.split(",")]):
+            return Response(status_code=304, headers=headers)
+        body = entry[coding] if request.method != "HEAD" else b""
+        resp = Response(body, media_type=entry["type"], headers=headers)
+        if request.method == "HEAD": resp.headers["Content-Length"] = str(len(entry[coding]))
+        return resp
+
+    def shell(self, request):
+        # el HTML se revalida siempre (no-cache + ETag → 304); lo pesado va con hash e inmutable
+        return self.response(request, "index.html", "no-cache")
+
+def from_env():
+    if os.getenv("GB_ASSETS", "1").strip() in ("0", "", "false", "False"): return None
+    if not _fresh(SRC, OUT): build()
+    return Assets()
+
+if __name__ == "__main__":
+    m = build(*sys.argv[1:3])
+    print(json.dumps(m, indent=1))
@@ -0,0 +1,48 @@
+# Stub de AsyncOpenAI para benchmarks: devuelve respuestas grabadas (bench/fixtures) con
+# latencia y tasa de error configurables. Solo implementa lo que usa main.py (chat.completions).
+import asyncio, json, os, random
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name + ".json"), encoding="utf-8") as f:
+        return json.dumps(json.load(f), ensure_ascii=False)
+
+def _completion(txt):
+    msg = SimpleNamespace(role="assistant", content=txt)
+    usage = SimpleNamespace(prompt_tokens=900, completion_tokens=len(txt) // 4, total_tokens=900 + len(txt) // 4)
+    return SimpleNamespace(id="chatcmpl-bench", choices=[SimpleNamespace(index=0, message=msg, finish_reason="stop")], usage=usage)
+
+def _rate_limit():
+    req = httpx.Request("POST", "http://mock/v1/chat/completions")
+    resp = httpx.Response(429, request=req, headers={"retry-after-ms": "5"})
+    return openai.RateLimitError("mock 429", response=resp, body=None)
+
+class _Completions:
+    def __init__(self, owner): self.owner = owner
+
+    async def create(self, **kw):
+        o = self.owner
+        o.calls += 1
+        await asyncio.sleep(max(0.0, o.rng.gauss(o.latency_s, o.jitter_s)))
+        if o.rng.random() < o.error_rate:
+            o.errors += 1
+            raise _rate_limit()
+        msgs = kw.get("messages") or []
+        # turno de seguimiento (transcript con respuesta previa) o llamada con imagen
+        if any(m.get("role") == "assistant" for m in msgs): return _completion(o.followup)
+        return _completion(o.partial if o.rng.random() < o.partial_rate else o.full)
+
+class MockAsyncOpenAI:
+    # latency_s/jitter_s: latencia gaussiana por llamada; error_rate: probabilidad de 429;
+    # partial_rate: probabilidad de devolver una rúbrica incompleta (dispara el seguimiento).
+    def __init__(self, latency_s=0.05, jitter_s=0.01, error_rate=0.0, partial_rate=0.0, seed=0):
+        self.latency_s, self.jitter_s, self.error_rate, self.partial_rate = latency_s, jitter_s, error_rate, partial_rate
+        self.rng = random.Random(seed)
+        self.calls = self.errors = 0
+        self.full, self.partial, self.followup = load_fixture("evaluation_ok"), load_fixture("evaluation_missing"), load_fixture("followup")
+        self.chat = SimpleNamespace(completions=_Completions(self))
@@ -0,0 +1,236 @@
+# Benchmarks de los caminos calientes: canonize/extract_relaxed, ensure_rubric, /api/evaluate
+# (con AsyncOpenAI simulado) y extract_lidar_metrics sobre nubes sintéticas de 10k/100k/1M puntos.
+# Cada escenario corre en un subproceso propio para que el pico de RSS sea el suyo.
+#
+#   python bench/run.py                      # corre todo y compara con bench/baseline.json
+#   python bench/run.py -s evaluate -c 32    # un escenario, otra concurrencia
+#   python bench/run.py --update-baseline    # guarda la corrida actual como referencia
+import argparse, asyncio, io, json, os, platform, resource, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE = os.path.join(HERE, "baseline.json")
+SCENARIOS = ["parse", "rubric", "evaluate", "lidar_10k", "lidar_100k", "lidar_1m"]
+LIDAR_POINTS = {"lidar_10k": 10_000, "lidar_100k": 100_000, "lidar_1m": 1_000_000}
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    if not xs: return None
+    k = (len(xs) - 1) * p / 100.0
+    lo = int(k); hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+def _peak_rss_mb():
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024  # macOS en bytes, Linux en KiB
+
+def _summary(lat_s, wall_s, **extra):
+    return {"n": len(lat_s), "p50_ms": round(_pct(lat_s, 50) * 1000, 3), "p95_ms": round(_pct(lat_s, 95) * 1000, 3),
+            "throughput_per_s": round(len(lat_s) / wall_s, 2) if wall_s > 0 else None, **extra}
+
+def _config(args, name):
+    if name in ("rubric", "evaluate"):
+        return {"concurrency": args.concurrency, "requests": args.requests, "latency_ms": args.latency_ms,
+                "error_rate": args.error_rate, "partial_rate": args.partial_rate}
+    if name == "parse": return {"iterations": args.iterations}
+    return {"points": LIDAR_POINTS[name], "repeats": args.lidar_repeats}
+
+# ---------------- escenarios (se ejecutan en el subproceso) ----------------
+
+def _load_main():
+    # main crea el cliente al importarse: hace falta una clave (nunca se usa, el cliente se sustituye)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    sys.path.insert(0, ROOT); sys.path.insert(0, HERE)
+    import main
+    return main
+
+def _import_main(args):
+    main = _load_main()
+    from mock_openai import MockAsyncOpenAI
+    main.client = MockAsyncOpenAI(latency_s=args.latency_ms / 1000.0, jitter_s=args.latency_ms / 5000.0,
+                                  error_rate=args.error_rate, partial_rate=args.partial_rate)
+    return main
+
+def bench_parse(args):
+    main = _load_main()
+    from mock_openai import load_fixture
+    texts = [load_fixture("evaluation_ok"), "```json\n" + load_fixture("evaluation_missing").replace("}\n}", "},\n}") + "\n```"]
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(args.iterations):
+        s = time.perf_counter()
+        main.canonize(main.extract_relaxed(texts[i % 2]).get("rubric"))
+        lat.append(time.perf_counter() - s)
+    return _summary(lat, time.perf_counter() - t0)
+
+async def _gather_limited(n, concurrency, fn, prepare=None):
+    # prepare(i) (en un hilo, fuera de la medida) genera la entrada de la petición i
+    sem, lat = asyncio.Semaphore(concurrency), []
+    async def one(i):
+        async with sem:
+            arg = await asyncio.to_thread(prepare, i) if prepare else i
+            s = time.perf_counter()
+            await fn(arg)
+            lat.append(time.perf_counter() - s)
+    t0 = time.perf_counter()
+    res = await asyncio.gather(*(one(i) for i in range(n)), return_exceptions=True)
+    return lat, time.perf_counter() - t0, sum(isinstance(r, BaseException) for r in res)
+
+def bench_rubric(args):
+    main = _import_main(args)
+    from mock_openai import load_fixture
+    data = json.loads(load_fixture("evaluation_missing"))
+    ctx = {"api": "chat", "transcript": main._transcript("bench", json.dumps(data))}
+    async def run():
+        return await _gather_limited(args.requests, args.concurrency,
+                                     lambda i: main.ensure_rubric(f"img{i}", json.loads(json.dumps(data)), "image/jpeg", ctx))
+    lat, wall, failed = asyncio.run(run())
+    return _summary(lat, wall, failed=failed, llm_calls=main.client.calls, llm_errors=main.client.errors)
+
+def _sample_pixels():
+    import numpy as np
+    rng = np.random.default_rng(0)
+    return (rng.random((1200, 1600, 3)) * 64 + np.linspace(60, 190, 1600)[None, :, None]).astype("uint8")
+
+def _jpeg(arr):
+    from PIL import Image
+    buf = io.BytesIO(); Image.fromarray(arr).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+def bench_evaluate(args):
+    main = _import_main(args)
+    import httpx
+    import numpy as np
+    base = _sample_pixels()
+    def image(i):
+        # píxeles distintos por petición: tras normalizar siguen siendo imágenes distintas, así que ni la
+        # caché ni el single-flight las juntan y se mide el coste de cada petición
+        return i, _jpeg(np.roll(base, 7 * (i + 1), axis=1))
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+            async def one(arg):
+                i, img = arg
+                r = await http.post("/api/evaluate", data={"category": "levante", "pro": "0"},
+                                    files={"file": (f"{i}.jpg", img, "image/jpeg")})
+                if r.status_code != 200 or "error" in r.json(): raise RuntimeError(r.text[:200])
+            return await _gather_limited(args.requests, args.concurrency, one, prepare=image)
+    lat, wall, failed = asyncio.run(run())
+    return _summary(lat, wall, failed=failed, llm_calls=main.client.calls, llm_errors=main.client.errors)
+
+def bench_lidar(args, path):
+    sys.path.insert(0, ROOT)
+    import lidar
+    lat = []
+    t0 = time.perf_counter()
+    for _ in range(args.lidar_repeats):
+        s = time.perf_counter()
+        m = lidar.extract_lidar_metrics_from_path(path, "bench.ply", {})
+        lat.append(time.perf_counter() - s)
+        if "error" in m: raise RuntimeError(m["error"])
+    _check_accuracy(m)
+    return _summary(lat, time.perf_counter() - t0, points_used=m["quality"].get("points_used"))
+
+def _check_accuracy(m):
+    # medidas frente a la geometría de synthetic.cattle_cloud: un escaneo rápido pero mal medido es un fallo
+    sys.path.insert(0, HERE)
+    from synthetic import cattle_truth
+    bad = [f"{k}={m.get(k)} (esperado {v:.3f} ±{tol:.0%})" for k, (v, tol) in cattle_truth().items()
+           if not (isinstance(m.get(k), float) and abs(m[k] - v) <= tol * v)]
+    if bad: raise RuntimeError("medidas fuera de tolerancia: " + ", ".join(bad))
+
+def child(args):
+    name = args.child
+    if name.startswith("lidar_"): res = bench_lidar(args, args.ply)
+    else: res = {"parse": bench_parse, "rubric": bench_rubric, "evaluate": bench_evaluate}[name](args)
+    res["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    print(json.dumps(res))
+
+# ---------------- orquestación y comparación ----------------
+
+def _passthrough(args):
+    out = []
+    for k in ("concurrency", "requests", "latency_ms", "error_rate", "partial_rate", "iterations", "lidar_repeats"):
+        out += ["--" + k.replace("_", "-"), str(getattr(args, k))]
+    return out
+
+def run_scenario(args, name, tmpdir):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", name] + _passthrough(args)
+    if name in LIDAR_POINTS:
+        sys.path.insert(0, HERE)
+        from synthetic import cattle_cloud, write_ply
+        path = os.path.join(tmpdir, name + ".ply")
+        write_ply(cattle_cloud(LIDAR_POINTS[name], seed=1), path)
+        cmd += ["--ply", path]
+    p = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if p.returncode != 0:
+        return {"error": (p.stderr or p.stdout).strip().splitlines()[-1:] or ["falló"]}
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline, tol):
+    # p95 y RSS no pueden crecer más de tol; el throughput no puede caer más de tol.
+    problems = []
+    for name, cur in results.items():
+        ref = baseline.get("scenarios", {}).get(name)
+        if not ref or "error" in cur: continue
+        if ref.get("config") != cur.get("config"):
+            problems.append(f"{name}: configuración distinta a la del baseline, no se compara")
+            continue
+        for k, worse in (("p95_ms", lambda c, r: c > r * (1 + tol)), ("peak_rss_mb", lambda c, r: c > r * (1 + tol)),
+                         ("throughput_per_s", lambda c, r: c < r / (1 + tol))):
+            if cur.get(k) is not None and ref.get(k) and worse(cur[k], ref[k]):
+                problems.append(f"REGRESIÓN {name}.{k}: {cur[k]} vs baseline {ref[k]} (tolerancia {tol:.0%})")
+    return problems
+
+def fmt_table(results):
+    cols = ["n", "p50_ms", "p95_ms", "throughput_per_s", "peak_rss_mb"]
+    lines = [f"{'escenario':<12}" + "".join(f"{c:>18}" for c in cols)]
+    for name, r in results.items():
+        if "error" in r: lines.append(f"{name:<12}  ERROR: {r['error']}"); continue
+        lines.append(f"{name:<12}" + "".join(f"{str(r.get(c)):>18}" for c in cols))
+    return "\n".join(lines)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks de GanadoBravo")
+    ap.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, help="repetible; por defecto todos")
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    ap.add_argument("-n", "--requests", type=int, default=100)
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="latencia media del modelo simulado")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="probabilidad de 429 por llamada")
+    ap.add_argument("--partial-rate", type=float, default=0.2, help="probabilidad de rúbrica incompleta")
+    ap.add_argument("--iterations", type=int, default=5000)
+    ap.add_argument("--lidar-repeats", type=int, default=5)
+    ap.add_argument("--tolerance", type=float, default=0.3)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--no-check", action="store_true")
+    ap.add_argument("--out", default=os.path.join(ROOT, "bench_output.txt"))
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--ply", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.child: return child(args)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="gb-bench-") as tmp:
+        for name in args.scenario or SCENARIOS:
+            print(f"… {name}", file=sys.stderr, flush=True)
+            results[name] = {**run_scenario(args, name, tmp), "config": _config(args, name)}
+    report = [f"python {platform.python_version()} · {platform.machine()} · {os.cpu_count()} CPUs", fmt_table(results)]
+    failed = any("error" in r for r in results.values())
+    if args.update_baseline:
+        base = json.load(open(BASELINE)) if os.path.exists(BASELINE) else {"scenarios": {}}
+        base["scenarios"].update({k: v for k, v in results.items() if "error" not in v})
+        base["machine"] = report[0]
+        with open(BASELINE, "w") as f: json.dump(base, f, indent=2, ensure_ascii=False); f.write("\n")
+        report.append(f"baseline actualizado: {BASELINE}")
+    elif not args.no_check and os.path.exists(BASELINE):
+        problems = compare(results, json.load(open(BASELINE)), args.tolerance)
+        report += problems or ["sin regresiones respecto al baseline"]
+        failed = failed or any(p.startswith("REGRESIÓN") for p in problems)
+    text = "\n".join(report)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f: f.write(text + "\n" + json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+# Nubes de puntos sintéticas con forma de bovino (tronco, patas, cuello/cabeza y suelo) para benchmarks.
+import numpy as np
+
+# semiejes del tronco (ancho, alto)
+TRUNK_B, TRUNK_C = 0.32, 0.38
+
+def cattle_cloud(n, seed=0, length=1.9, withers=1.35, noise=0.004, ground_frac=0.25, outliers=0.001):
+    rng = np.random.default_rng(seed)
+    n_ground = int(n * ground_frac); n_out = int(n * outliers)
+    n_body = n - n_ground - n_out
+    parts = []
+    # tronco: elipsoide alargado sobre las patas
+    nb = int(n_body * 0.70)
+    u = rng.uniform(0, 2*np.pi, nb); v = np.arccos(rng.uniform(-1, 1, nb))
+    a, b, c = length/2, TRUNK_B, TRUNK_C
+    cy = withers - c
+    parts.append(np.c_[a*np.sin(v)*np.cos(u), cy + c*np.cos(v), b*np.sin(v)*np.sin(u)])
+    # patas: 4 cilindros
+    nl = int(n_body * 0.18); leg_h = cy - 0.15
+    t = rng.uniform(0, 2*np.pi, nl); h = rng.uniform(0, leg_h, nl); k = rng.integers(0, 4, nl)
+    lx = np.where(k < 2, -0.6, 0.6) * a; lz = np.where(k % 2 == 0, -0.18, 0.18)
+    parts.append(np.c_[lx + 0.06*np.cos(t), h, lz + 0.06*np.sin(t)])
+    # cuello + cabeza
+    nh = n_body - nb - nl
+    s = rng.uniform(0, 1, nh); t = rng.uniform(0, 2*np.pi, nh); r = 0.16 - 0.06*s
+    parts.append(np.c_[a + 0.45*s, cy + 0.15 + 0.25*s + r*np.cos(t), r*np.sin(t)])
+    # suelo
+    parts.append(np.c_[rng.uniform(-1.8, 1.8, n_ground), rng.normal(0, 0.003, n_ground), rng.uniform(-1.2, 1.2, n_ground)])
+    P = np.vstack(parts)
+    P[:P.shape[0]-n_ground] += rng.normal(0, noise, (P.shape[0]-n_ground, 3))
+    if n_out: P = np.vstack([P, rng.uniform(-3, 3, (n_out, 3))])
+    return P[rng.permutation(P.shape[0])].astype(np.float32)
+
+def cattle_truth(length=1.9, withers=1.35):
+    # medida -> (valor real, tolerancia relativa). El largo del tronco medido queda algo por debajo
+    # del eje del elipsoide: sus extremos tienen sección demasiado pequeña para contar como tronco.
+    b, c = TRUNK_B, TRUNK_C
+    girth = np.pi * (3*(b + c) - np.sqrt((3*b + c) * (b + 3*c)))  # perímetro de la elipse (Ramanujan)
+    return {"withers_height_m": (withers, 0.05), "body_length_m": (length, 0.10), "heart_girth_m": (girth, 0.05),
+            "chest_depth_m": (2*c, 0.05)}
+
+def write_ply(P, path, binary=True):
+    head = (f"ply\nformat {'binary_little_endian' if binary else 'ascii'} 1.0\nelement vertex {len(P)}\n"
+            "property float x\nproperty float y\nproperty float z\nend_header\n")
+    with open(path, "wb") as f:
+        f.write(head.encode("ascii"))
+        if binary: f.write(np.ascontiguousarray(P, dtype="<f4").tobytes())
+        else: np.savetxt(f, P, fmt="%.5f")
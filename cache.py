@@ -0,0 +1,163 @@
+# Caché de resultados direccionada por contenido: LRU+TTL en memoria y SQLite opcional en disco.
+import asyncio, copy, hashlib, json, os, threading, time
+from collections import OrderedDict
+
+import metrics, shared_state
+
+metrics.describe("gb_cache_requests_total", "Consultas a la caché de resultados por nivel y resultado.")
+
+def cache_key(*parts):
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode("utf-8")); h.update(b"\x1f")
+    return h.hexdigest()
+
+class ResultCache:
+    # Nivel 1 en memoria del proceso; nivel 2 opcional en un backend de shared_state (SQLite o Redis),
+    # visible para todos los workers. namespace separa cachés que comparten backend.
+    def __init__(self, max_items=512, ttl=86400.0, shared=None, namespace="result"):
+        self.max_items, self.ttl = int(max_items), float(ttl)
+        self.shared, self.prefix = shared, namespace + ":"
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        hit = self._get_mem(key)
+        return hit if hit is not None or self.shared is None else self._get_shared(key)
+
+    async def aget(self, key):
+        # get() desde el event loop: el nivel compartido (SQLite/Redis) se consulta en un hilo
+        hit = self._get_mem(key)
+        if hit is not None or self.shared is None: return hit
+        return self._get_shared(key) if self.shared.local else await asyncio.to_thread(self._get_shared, key)
+
+    def peek(self, key):
+        # como get() pero sin contar en gb_cache_requests_total (sondeos del single-flight)
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None and item[0] > time.time(): return json.loads(item[1])
+        blob = self.shared.get(self.prefix + key) if self.shared is not None else None
+        return json.loads(blob) if blob is not None else None
+
+    def _get_mem(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._mem.move_to_end(key)
+                    metrics.inc("gb_cache_requests_total", tier="memory", result="hit")
+                    return json.loads(item[1])
+                del self._mem[key]
+        metrics.inc("gb_cache_requests_total", tier="memory", result="miss")
+        return None
+
+    def _get_shared(self, key):
+        blob = self.shared.get(self.prefix + key)
+        metrics.inc("gb_cache_requests_total", tier=self.shared.name, result="miss" if blob is None else "hit")
+        if blob is None: return None
+        # el TTL restante no se conoce: en memoria vive como mucho el TTL completo
+        with self._lock: self._remember(key, blob, time.time() + self.ttl)
+        return json.loads(blob)
+
+    def put(self, key, value):
+        blob = self._put_mem(key, value)
+        if self.shared is not None: self.shared.set(self.prefix + key, blob, self.ttl, evictable=True)
+
+    async def aput(self, key, value):
+        blob = self._put_mem(key, value)
+        if self.shared is not None: await shared_state.call(self.shared, "set", self.prefix + key, blob, self.ttl, evictable=True)
+
+    def _put_mem(self, key, value):
+        blob = json.dumps(value, ensure_ascii=False)
+        with self._lock: self._remember(key, blob, time.time() + self.ttl)
+        return blob
+
+    def _remember(self, key, blob, expires):
+        self._mem[key] = (expires, blob)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def stats(self):
+        tiers = ("memory",) + ((self.shared.name,) if self.shared is not None else ())
+        hits = sum(metrics.value("gb_cache_requests_total", tier=t, result="hit") for t in tiers)
+        misses = metrics.value("gb_cache_requests_total", tier=tiers[-1], result="miss")
+        return {"memory_items": len(self._mem), "shared": self.shared.name if self.shared is not None else None, "hits": hits, "misses": misses}
+
+def shared_tier():
+    # GB_CACHE_DB (SQLite propio de la caché) tiene prioridad; si no, el backend compartido del proceso
+    # salvo que sea el de memoria, que ya es el nivel 1.
+    if os.getenv("GB_CACHE_DB"): return shared_state.SQLiteBackend(os.getenv("GB_CACHE_DB"))
+    backend = shared_state.default()
+    return None if backend.local else backend
+
+def from_env():
+    if os.getenv("GB_CACHE_ENABLED", "1").strip() in ("0", "", "false", "False"): return None
+    return ResultCache(
+        max_items=int(os.getenv("GB_CACHE_SIZE", "512")),
+        ttl=float(os.getenv("GB_CACHE_TTL_S", "86400")),
+        shared=shared_tier(),
+    )
+
+metrics.describe("gb_inflight_coalesced_total", "Llamadas idénticas concurrentes que esperaron una tarea ya en curso.")
+
+class SingleFlight:
+    # Las llamadas concurrentes con la misma clave comparten una sola tarea; la tarea
+    # sigue aunque el primer cliente se desconecte, así los demás reciben el resultado.
+    # Con shared + lookup también entre workers: quien consigue el lease calcula y el resto
+    # espera a que el resultado aparezca en la caché compartida (lookup(key), sin contar en las
+    # métricas de la caché). El lease se renueva mientras dura el cálculo: una evaluación con
+    # reintentos puede durar más que lease_s, y solo caduca si el worker muere.
+    def __init__(self, scope, shared=None, lookup=None, lease_s=30.0, poll_s=0.25):
+        self.scope, self.shared, self.lookup, self.lease_s, self.poll_s = scope, shared, lookup, lease_s, poll_s
+        self._tasks = {}
+
+    async def do(self, key, factory):
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(self._run(key, factory) if self.shared is not None and self.lookup is not None else factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            metrics.inc("gb_inflight_coalesced_total", scope=self.scope)
+        # cada llamador recibe su copia, también el primero: los resultados se completan después
+        # (sid, LiDAR, peso) y esos cambios no deben verse en las respuestas de los demás
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _lookup(self, key):
+        return self.lookup(key) if self.shared.local else await asyncio.to_thread(self.lookup, key)
+
+    async def _run(self, key, factory):
+        lease, me = f"flight:{self.scope}:{key}", shared_state.WORKER_ID
+        waited = False
+        while not await shared_state.call(self.shared, "add", lease, me, self.lease_s):
+            if not waited: metrics.inc("gb_inflight_coalesced_total", scope=self.scope + "_shared"); waited = True
+            await asyncio.sleep(self.poll_s)
+            hit = await self._lookup(key)
+            if hit is not None: return hit
+            # si el otro worker falla o muere, su lease se borra o caduca y add() lo consigue este
+        renew = asyncio.ensure_future(self._renew(lease, me))
+        try:
+            # el resultado pudo llegar entre el último sondeo y el add()
+            hit = await self._lookup(key) if waited else None
+            return hit if hit is not None else await factory()
+        finally:
+            renew.cancel()
+            await shared_state.call(self.shared, "release", lease, me)
+
+    async def _renew(self, lease, me):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                if not await shared_state.call(self.shared, "renew", lease, me, self.lease_s): return
+            except Exception as e:
+                metrics.inc("gb_errors_total", type=type(e).__name__, route="single_flight")
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task: del self._tasks[key]
+        if not task.cancelled(): task.exception()
+
+    def __len__(self):
+        return len(self._tasks)
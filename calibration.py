@@ -0,0 +1,160 @@
+# Calibración escaneo -> peso con pesadas reales de báscula. Modelo log-lineal por raza
+#   ln(peso) = b0 + b1·ln(perímetro) + b2·ln(largo) + b3·ln(alzada) + offsets por categoría
+# ajustado con mínimos cuadrados recursivos (RLS): cada pesada actualiza los coeficientes en O(d²),
+# sin reentrenar. El prior es la fórmula de perímetro²·largo/11877 (cm), así que con pocas pesadas
+# el modelo parte de ella. Las muestras quedan en SQLite; los coeficientes se guardan como
+# instantánea y cada worker aplica en orden (por id) las muestras nuevas que añadan los demás,
+# en un hilo (run_syncer) que publica un dict de modelos nuevo: estimate() solo lee esa instantánea.
+import asyncio, copy, json, math, os, sqlite3, threading, time
+
+import numpy as np
+
+import metrics, rubric
+
+DATA_DIR = os.getenv("GB_DATA_DIR", "data")
+MIN_N = int(os.getenv("GB_CALIB_MIN_N", "5"))
+FORGET = float(os.getenv("GB_CALIB_FORGET", "1.0"))
+SYNC_S = float(os.getenv("GB_CALIB_SYNC_S", "5"))
+
+FEATURES = ("intercepto", "ln_perimetro_m", "ln_largo_m", "ln_alzada_m", "vaca_flaca", "engorde")
+# perímetro y largo en m: 1e6/11877 reproduce la fórmula en cm
+PRIOR = np.array([math.log(1e6 / 11877.0), 2.0, 1.0, 0.0, 0.0, 0.0])
+PRIOR_VAR = np.array([1.0, 0.25, 0.25, 0.25, 0.04, 0.04])
+GLOBAL = "_global"
+
+def features(m, category=None):
+    g, L, H = (m or {}).get("heart_girth_m"), (m or {}).get("body_length_m"), (m or {}).get("withers_height_m")
+    if not all(isinstance(v, (int, float)) and math.isfinite(v) and v > 0 for v in (g, L, H)): return None
+    c = (category or "").strip().lower()
+    return np.array([1.0, math.log(g), math.log(L), math.log(H), float(c == "vaca_flaca"), float(c == "engorde")])
+
+def breed_key(breed):
+    k = rubric.norm(breed) if isinstance(breed, str) else ""
+    return k if k and k != "indeterminado" else None
+
+class RLS:
+    # Estadísticas con el error a priori (predicción antes de ver la pesada): error fuera de muestra.
+    def __init__(self):
+        self.theta, self.P = PRIOR.copy(), np.diag(PRIOR_VAR)
+        self.n, self.log_ss, self.abs_pct, self.sq_kg = 0, 0.0, 0.0, 0.0
+
+    def update(self, x, weight_kg):
+        pred = float(x @ self.theta)
+        e = math.log(weight_kg) - pred
+        self.n += 1
+        self.log_ss += e * e
+        self.abs_pct += abs(math.exp(pred) - weight_kg) / weight_kg
+        self.sq_kg += (math.exp(pred) - weight_kg) ** 2
+        Px = self.P @ x
+        k = Px / (FORGET + x @ Px)
+        self.theta = self.theta + k * e
+        self.P = (self.P - np.outer(k, Px)) / FORGET
+
+    def stats(self):
+        if not self.n: return {"n": 0}
+        return {"n": self.n, "rmse_log": round(math.sqrt(self.log_ss / self.n), 4), "mape_pct": round(100 * self.abs_pct / self.n, 2),
+                "rmse_kg": round(math.sqrt(self.sq_kg / self.n), 1)}
+
+    def estimate(self, x):
+        pred = float(x @ self.theta)
+        out = {"weight_kg": round(math.exp(pred), 1), **self.stats()}
+        if self.n >= 2:
+            # intervalo ~95 % con la dispersión a priori en escala log
+            s = 1.96 * math.sqrt(self.log_ss / self.n)
+            out["interval_kg"] = [round(math.exp(pred - s), 1), round(math.exp(pred + s), 1)]
+        return out
+
+    def to_json(self):
+        return {"theta": self.theta.tolist(), "P": self.P.tolist(), "n": self.n, "log_ss": self.log_ss, "abs_pct": self.abs_pct, "sq_kg": self.sq_kg}
+
+    @classmethod
+    def from_json(cls, d):
+        m = cls()
+        m.theta, m.P = np.asarray(d["theta"], dtype=np.float64), np.asarray(d["P"], dtype=np.float64)
+        m.n, m.log_ss, m.abs_pct, m.sq_kg = d["n"], d["log_ss"], d["abs_pct"], d["sq_kg"]
+        return m
+
+class Calibrator:
+    def __init__(self, db_path):
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS calibration_samples (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL,
+            breed TEXT, category TEXT, weight_kg REAL NOT NULL, lidar_metrics TEXT NOT NULL, animal_id TEXT, sid TEXT, eval_id INTEGER)""")
+        self._db.execute("CREATE TABLE IF NOT EXISTS calibration_state (id INTEGER PRIMARY KEY CHECK (id=1), last_id INTEGER NOT NULL, models TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self.models, self.last_id, self._synced = {}, 0, 0.0
+        row = self._db.execute("SELECT last_id, models FROM calibration_state WHERE id=1").fetchone()
+        if row: self.last_id, self.models = row[0], {k: RLS.from_json(v) for k, v in json.loads(row[1]).items()}
+        self.sync(force=True)
+
+    def sync(self, force=False):
+        # Aplica en orden las muestras con id > last_id (de este u otro worker) sobre copias de los
+        # modelos afectados y cambia self.models de una vez: quien lo lea sin lock ve el dict anterior
+        # completo o el nuevo. Sin forzar, como mucho una consulta cada SYNC_S.
+        if not force and time.monotonic() - self._synced < SYNC_S: return
+        with self._lock:
+            self._synced = time.monotonic()
+            rows = self._db.execute("SELECT id, breed, category, weight_kg, lidar_metrics FROM calibration_samples WHERE id>? ORDER BY id",
+                                    (self.last_id,)).fetchall()
+            if not rows: return
+            models, copied = dict(self.models), set()
+            for _, breed, category, weight_kg, lidar_json in rows:
+                x = features(json.loads(lidar_json), category)
+                if x is not None:
+                    for key in {GLOBAL, breed_key(breed)} - {None}:
+                        if key not in copied:
+                            models[key] = copy.deepcopy(models[key]) if key in models else RLS()
+                            copied.add(key)
+                        models[key].update(x, weight_kg)
+            self.models, self.last_id = models, rows[-1][0]
+            self._save()
+
+    async def run_syncer(self):
+        # Pesadas de otros workers: la consulta y las actualizaciones RLS no corren en el event loop.
+        while True:
+            await asyncio.sleep(SYNC_S)
+            try: await asyncio.to_thread(self.sync, True)
+            except Exception as e: metrics.inc("gb_errors_total", type=type(e).__name__, route="calibration")
+
+    def _save(self):
+        # gana la instantánea más avanzada: los workers aplican las mismas muestras en el mismo orden
+        self._db.execute("""INSERT INTO calibration_state (id, last_id, models) VALUES (1, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET last_id=excluded.last_id, models=excluded.models WHERE excluded.last_id > calibration_state.last_id""",
+                         (self.last_id, json.dumps({k: m.to_json() for k, m in self.models.items()})))
+
+    def add(self, lidar_metrics, weight_kg, breed=None, category=None, animal_id=None, sid=None, eval_id=None):
+        # -> (id, estimación previa a esta pesada); ValueError si faltan medidas o el peso no es válido
+        if not (isinstance(weight_kg, (int, float)) and 20 <= weight_kg <= 2000): raise ValueError("peso fuera de rango (20–2000 kg)")
+        if features(lidar_metrics, category) is None: raise ValueError("faltan perímetro torácico, largo o alzada en las métricas LiDAR")
+        before = self.estimate(lidar_metrics, breed, category)
+        with self._lock:
+            sample_id = self._db.execute("""INSERT INTO calibration_samples (created, breed, category, weight_kg, lidar_metrics, animal_id, sid, eval_id)
+                VALUES (?,?,?,?,?,?,?,?)""", (time.time(), breed, category, float(weight_kg), json.dumps(lidar_metrics, ensure_ascii=False),
+                                               animal_id, sid, eval_id)).lastrowid
+        self.sync(force=True)
+        return sample_id, before
+
+    def estimate(self, lidar_metrics, breed=None, category=None):
+        # Microsegundos: producto escalar de 6 términos con la instantánea de modelos, sin base de datos.
+        x = features(lidar_metrics, category)
+        if x is None: return None
+        models = self.models
+        for key, source in ((breed_key(breed), "raza"), (GLOBAL, "global")):
+            m = models.get(key) if key else None
+            if m is not None and m.n >= MIN_N: return {"model": source, "breed": key if source == "raza" else None, **m.estimate(x)}
+        # sin pesadas suficientes: la fórmula (el prior), sin estadísticas de error
+        return {"model": "formula", "breed": None, "weight_kg": round(math.exp(float(x @ PRIOR)), 1), "n": 0}
+
+    def summary(self):
+        self.sync()
+        models = self.models
+        return {"min_n": MIN_N, "samples": self._db.execute("SELECT COUNT(*) FROM calibration_samples").fetchone()[0],
+                "models": {k: {"coefficients": dict(zip(FEATURES, np.round(m.theta, 4).tolist())), **m.stats()} for k, m in sorted(models.items())}}
+
+def from_env():
+    if os.getenv("GB_CALIB_ENABLED", "1").strip() in ("0", "", "false", "False"): return None
+    path = os.getenv("GB_CALIB_DB")
+    if not path:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        path = os.path.join(DATA_DIR, "calibration.sqlite")
+    return Calibrator(path)
@@ -0,0 +1,16 @@
+# Modo multi-worker (opcional): gunicorn main:app -c gunicorn.conf.py con GB_WORKERS > 1.
+# El Procfile arranca un solo proceso uvicorn: la cola de trabajos, /metrics, /healthz y el
+# AIMD/breaker son por proceso. GB_WORKERS y no WEB_CONCURRENCY, que algunas plataformas fijan solas.
+# Sin preload_app: cada worker abre sus propias conexiones SQLite, pools y cliente HTTP.
+import os
+
+workers = int(os.getenv("GB_WORKERS", "1"))
+# los workers heredan el entorno: shared_state elige SQLite compartido si GB_WORKERS > 1
+os.environ.setdefault("GB_WORKERS", str(workers))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# evaluaciones en streaming (SSE) y lotes pueden durar minutos
+timeout = int(os.getenv("GB_WORKER_TIMEOUT_S", "300"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
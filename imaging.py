@@ -0,0 +1,117 @@
+# Normalización de imágenes antes de enviarlas al modelo: orientación EXIF, reescalado y recompresión.
+import base64, hashlib, io, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+
+import metrics
+
+MAX_EDGE = int(os.getenv("GB_IMG_MAX_EDGE", "1280"))
+QUALITY = int(os.getenv("GB_IMG_QUALITY", "85"))
+FORMAT = os.getenv("GB_IMG_FORMAT", "JPEG").upper()
+CONFIG_TAG = f"{MAX_EDGE}:{QUALITY}:{FORMAT}:{int(Image is not None)}"
+WORKERS = int(os.getenv("GB_IMG_WORKERS", "2"))
+POOL = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="gb-img")
+PREPARED_SIZE = int(os.getenv("GB_IMG_CACHE_SIZE", "32"))
+
+metrics.describe("gb_img_prepared_total", "Imágenes preparadas (normalizada + base64) por resultado de la caché.")
+
+_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def sniff_mime(raw):
+    head = bytes(raw[:16])
+    if head.startswith(b"\xff\xd8"): return "image/jpeg"
+    if head.startswith(b"\x89PNG"): return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP": return "image/webp"
+    if head[:4] in (b"GIF8",): return "image/gif"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"): return "image/heic"
+    return "image/jpeg"
+
+def _measure(raw):
+    # bytes o archivo (subida en disco): tamaño y cabecera sin leerlo entero
+    if isinstance(raw, (bytes, bytearray, memoryview)): return len(raw), bytes(raw[:16])
+    raw.seek(0, 2); size = raw.tell(); raw.seek(0)
+    head = raw.read(16); raw.seek(0)
+    return size, head
+
+def normalize_image(raw, max_edge=MAX_EDGE, quality=QUALITY, fmt=FORMAT):
+    # raw: bytes o archivo binario con seek. Si no hace falta recomprimir devuelve raw tal cual (el
+    # archivo no se lee entero: b64encode lo codifica por bloques); si no, los bytes recomprimidos.
+    t0 = time.perf_counter()
+    size, head = _measure(raw)
+    info = {"orig_bytes": size, "out_bytes": size, "orig_size": None, "out_size": None, "processed": False}
+    mime = sniff_mime(head)
+    if Image is None:
+        info.update(format=mime, ms=round((time.perf_counter()-t0)*1000, 1))
+        return raw, mime, info
+    try:
+        im = Image.open(io.BytesIO(raw) if isinstance(raw, (bytes, bytearray, memoryview)) else raw)
+        info["orig_size"] = list(im.size)
+        oriented = im.getexif().get(0x0112, 1) not in (0, 1)
+        # draft() deja que libjpeg decodifique directamente a 1/2, 1/4 u 1/8 de resolución
+        if im.format == "JPEG": im.draft("RGB", (max_edge, max_edge))
+        im = ImageOps.exif_transpose(im)
+        too_big = max(im.size) > max_edge
+        if too_big: im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if im.mode not in ("RGB", "L"):
+            if fmt == "JPEG" and "A" in im.getbands():
+                bg = Image.new("RGB", im.size, (255, 255, 255)); bg.paste(im, mask=im.getchannel("A")); im = bg
+            else:
+                im = im.convert("RGB")
+        buf = io.BytesIO()
+        im.save(buf, format=fmt, quality=quality, optimize=fmt == "JPEG")
+        out = buf.getvalue()
+    except Exception as e:
+        info.update(format=mime, error=str(e), ms=round((time.perf_counter()-t0)*1000, 1))
+        return raw, mime, info
+    processed = too_big or oriented or len(out) < size or mime not in _MIME.values()
+    if processed: out_mime = _MIME.get(fmt, "image/jpeg")
+    else: out, out_mime = raw, mime
+    info.update(out_bytes=len(out) if processed else size, out_size=list(im.size), format=out_mime, processed=processed,
+                ms=round((time.perf_counter()-t0)*1000, 1))
+    return out, out_mime, info
+
+def sample_jpeg():
+    # imagen mínima para precalentar el pool y los decodificadores al arrancar
+    if Image is None: return b"\xff\xd8"
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (128, 96, 64)).save(buf, "JPEG")
+    return buf.getvalue()
+
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+def b64encode(data, chunk=3 * 256 * 1024):
+    # bytes o archivo; el archivo se codifica por bloques múltiplos de 3 (sin padding intermedio)
+    # y nunca se junta entero en memoria junto a su base64
+    if isinstance(data, (bytes, bytearray, memoryview)): return base64.b64encode(data).decode("ascii")
+    data.seek(0)
+    parts = []
+    while True:
+        block = data.read(chunk)
+        if not block: return "".join(parts)
+        parts.append(base64.b64encode(block).decode("ascii"))
+
+def prepare(raw, digest=None):
+    # normalize_image + base64, memoizado por contenido: la misma foto (reintentos, vistas repetidas,
+    # lotes) se reescala una sola vez. raw: bytes o archivo (digest = su sha256). Devuelve (b64, mime, info).
+    t0 = time.perf_counter()
+    key = digest or hashlib.sha256(raw).hexdigest()
+    with _prepared_lock:
+        hit = _prepared.get(key)
+        if hit is not None: _prepared.move_to_end(key)
+    if hit is not None:
+        metrics.inc("gb_img_prepared_total", result="hit")
+        # ms de esta petición, no los de la normalización que se hizo la primera vez
+        return hit[0], hit[1], {**hit[2], "cached": True, "ms": round((time.perf_counter()-t0)*1000, 1)}
+    out, mime, info = normalize_image(raw)
+    b64 = b64encode(out)
+    metrics.inc("gb_img_prepared_total", result="miss")
+    if PREPARED_SIZE > 0:
+        with _prepared_lock:
+            _prepared[key] = (b64, mime, info)
+            while len(_prepared) > PREPARED_SIZE: _prepared.popitem(last=False)
+    return b64, mime, dict(info)
@@ -0,0 +1,260 @@
+# Modo trabajo: la evaluación se encola y se responde al instante con un id; un pool acotado de
+# workers asyncio la procesa. Cola en SQLite + imágenes en disco: un reinicio no pierde trabajos.
+import asyncio, hashlib, hmac, ipaddress, json, os, shutil, socket, sqlite3, threading, time, urllib.parse, uuid
+
+import httpx
+
+import metrics
+
+DATA_DIR = os.getenv("GB_DATA_DIR", "data")
+WORKERS = int(os.getenv("GB_JOBS_WORKERS", "2"))
+MAX_QUEUED = int(os.getenv("GB_JOBS_MAX_QUEUED", "1000"))
+TTL_S = float(os.getenv("GB_JOBS_TTL_S", str(7 * 86400)))
+WEBHOOK_SECRET = os.getenv("GB_JOBS_WEBHOOK_SECRET") or None
+# con lista, solo esos hosts (pueden ser internos); sin ella, cualquier host que resuelva a IPs públicas
+WEBHOOK_HOSTS = {h.strip().lower() for h in os.getenv("GB_JOBS_WEBHOOK_HOSTS", "").split(",") if h.strip()}
+MAX_ATTEMPTS = 3
+# varios workers comparten jobs.sqlite: cada trabajo en curso lleva el proceso que lo ejecuta y un
+# latido; sin latido en LEASE_S se da por muerto (también en otra máquina o con el PID reutilizado)
+LEASE_S = float(os.getenv("GB_JOBS_LEASE_S", "60"))
+HOST, PID = socket.gethostname(), os.getpid()
+
+metrics.describe("gb_jobs_total", "Trabajos por estado final (done, error) y encolados (queued).")
+metrics.describe("gb_jobs_webhooks_total", "Entregas de webhook por resultado.")
+
+class QueueFull(Exception):
+    pass
+
+class WebhookRejected(ValueError):
+    pass
+
+_COLS = ("id", "status", "priority", "created", "started", "finished", "category", "mode", "sid", "webhook_url", "attempts", "result", "error", "owner")
+
+class JobQueue:
+    # El SQLite (timeout=5: hasta 5 s esperando un bloqueo) nunca se toca desde el event loop:
+    # los métodos síncronos (_exec, _change, _get, _recover) se llaman con asyncio.to_thread.
+    def __init__(self, db_path, spool_dir, workers=WORKERS, max_queued=MAX_QUEUED, ttl=TTL_S, webhook_secret=WEBHOOK_SECRET, lease_s=LEASE_S):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir, self.workers, self.max_queued, self.ttl, self.webhook_secret = spool_dir, workers, max_queued, ttl, webhook_secret
+        self.lease_s = lease_s
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL,
+            created REAL NOT NULL, started REAL, finished REAL, category TEXT, mode TEXT, sid TEXT, webhook_url TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, owner TEXT)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, priority, created)")
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(jobs)")}
+        for col, decl in (("owner", "TEXT"), ("heartbeat", "REAL")):
+            if col not in cols: self._db.execute(f"ALTER TABLE jobs ADD COLUMN {col} {decl}")
+        self._lock = threading.Lock()
+        self._queue = None
+        self._tasks = []
+        self._run = None
+        self._seq = 0
+        self._hooks = set()
+        self._active = set()
+
+    def _exec(self, sql, args=()):
+        with self._lock: return self._db.execute(sql, args).fetchall()
+
+    def _change(self, sql, args=()):
+        with self._lock: return self._db.execute(sql, args).rowcount
+
+    def _path(self, job_id):
+        return os.path.join(self.spool_dir, job_id + ".img")
+
+    def _push(self, job_id, priority, created):
+        # PriorityQueue saca el menor: prioridad alta primero y, a igual prioridad, el más antiguo
+        self._seq += 1
+        self._queue.put_nowait((-priority, created, self._seq, job_id))
+
+    async def start(self, run):
+        # run(job, img_bytes) -> dict; los trabajos que quedaron a medias en un reinicio se reencolan
+        self._run, self._queue = run, asyncio.PriorityQueue()
+        await asyncio.to_thread(self._recover)
+        for job_id, priority, created in await asyncio.to_thread(self._exec, "SELECT id, priority, created FROM jobs WHERE status='queued'"):
+            self._push(job_id, priority, created)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)] + [asyncio.create_task(self._reaper())]
+
+    def _recover(self):
+        # Solo se recuperan los de procesos muertos: con varios workers, los demás siguen con los suyos.
+        # Un trabajo que ya tumbó el proceso MAX_ATTEMPTS veces no se reintenta más. owner en el WHERE:
+        # si otro proceso lo reclamó entre medias, no se toca. Devuelve los reencolados.
+        now, out = time.time(), []
+        for job_id, owner, attempts, beat, priority, created in self._exec(
+                "SELECT id, owner, attempts, heartbeat, priority, created FROM jobs WHERE status='running'"):
+            if job_id in self._active or ((beat or 0) > now - self.lease_s and _alive(owner)): continue
+            if attempts >= MAX_ATTEMPTS:
+                self._change("UPDATE jobs SET status='error', finished=?, error='interrumpido repetidamente' WHERE id=? AND status='running' AND owner IS ?",
+                             (now, job_id, owner))
+            elif self._change("UPDATE jobs SET status='queued' WHERE id=? AND status='running' AND owner IS ?", (job_id, owner)):
+                out.append((job_id, priority, created))
+        return out
+
+    async def _reaper(self):
+        # trabajos de workers caídos mientras este sigue vivo (otra réplica, OOM, kill -9)
+        while True:
+            await asyncio.sleep(self.lease_s / 2)
+            try:
+                for job_id, priority, created in await asyncio.to_thread(self._recover): self._push(job_id, priority, created)
+            except sqlite3.Error as e:
+                metrics.inc("gb_errors_total", type=type(e).__name__, route="jobs")
+
+    async def stop(self):
+        for t in self._tasks: t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, img_bytes, category, mode, priority=0, webhook_url=None, sid=None):
+        if self._queue is not None and self._queue.qsize() >= self.max_queued: raise QueueFull(f"más de {self.max_queued} trabajos en cola")
+        if webhook_url: await check_webhook(webhook_url)
+        job_id, now = uuid.uuid4().hex, time.time()
+        await asyncio.to_thread(_write, self._path(job_id), img_bytes)
+        await asyncio.to_thread(self._exec, "INSERT INTO jobs (id, status, priority, created, category, mode, sid, webhook_url) VALUES (?,?,?,?,?,?,?,?)",
+                                (job_id, "queued", int(priority), now, category, mode, sid, webhook_url))
+        self._push(job_id, int(priority), now)
+        metrics.inc("gb_jobs_total", status="queued")
+        if self._seq % 100 == 0: await asyncio.to_thread(self.purge)
+        return await self.get(job_id)
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._get, job_id)
+
+    def _get(self, job_id):
+        rows = self._exec(f"SELECT {','.join(_COLS)} FROM jobs WHERE id=?", (job_id,))
+        if not rows: return None
+        job = dict(zip(_COLS, rows[0]))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if job["status"] == "queued": job["queue_position"] = self._position(job)
+        return job
+
+    def _position(self, job):
+        return self._exec("SELECT COUNT(*) FROM jobs WHERE status='queued' AND (priority>? OR (priority=? AND created<?))",
+                          (job["priority"], job["priority"], job["created"]))[0][0]
+
+    def stats(self):
+        return dict(self._exec("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def purge(self):
+        self._exec("DELETE FROM jobs WHERE status IN ('done','error') AND finished<?", (time.time() - self.ttl,))
+
+    async def _worker(self):
+        while True:
+            _, _, _, job_id = await self._queue.get()
+            try: await self._process(job_id)
+            except Exception as e:
+                # un fallo de la base de datos no puede matar al worker: la cola se pararía sin avisar
+                metrics.inc("gb_errors_total", type=type(e).__name__, route="jobs")
+            finally: self._queue.task_done()
+
+    async def _process(self, job_id):
+        # reclamo atómico: al arrancar todos los workers encolan los pendientes, solo uno lo ejecuta
+        now = time.time()
+        claimed = await asyncio.to_thread(self._change, "UPDATE jobs SET status='running', started=?, heartbeat=?, attempts=attempts+1, owner=? WHERE id=? AND status='queued'",
+                                          (now, now, f"{HOST}:{PID}", job_id))
+        if not claimed: return
+        self._active.add(job_id)
+        beat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            job = await self.get(job_id)
+            try:
+                img_bytes = await asyncio.to_thread(_read, self._path(job_id))
+                result = await self._run(job, img_bytes)
+                status, result_json, error = "done", json.dumps(result, ensure_ascii=False), None
+            except asyncio.CancelledError:
+                # apagado: se queda en 'running' y start() lo reencola en el próximo arranque
+                raise
+            except Exception as e:
+                status, result_json, error = "error", None, f"{type(e).__name__}: {e}"
+            for i in range(3):
+                # SQLite bloqueado o disco lleno: reintento breve; si sigue fallando el trabajo queda en
+                # 'running', sin latido, y se recupera como los interrumpidos
+                try:
+                    await asyncio.to_thread(self._exec, "UPDATE jobs SET status=?, finished=?, result=?, error=? WHERE id=?",
+                                            (status, time.time(), result_json, error, job_id))
+                    break
+                except sqlite3.Error:
+                    if i == 2: raise
+                    await asyncio.sleep(0.5 * 2 ** i)
+        finally:
+            beat.cancel()
+            self._active.discard(job_id)
+        metrics.inc("gb_jobs_total", status=status)
+        try: os.unlink(self._path(job_id))
+        except OSError: pass
+        if job["webhook_url"]:
+            # la entrega (con reintentos) no ocupa al worker
+            t = asyncio.create_task(self._notify(await self.get(job_id)))
+            self._hooks.add(t); t.add_done_callback(self._hooks.discard)
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try: await asyncio.to_thread(self._exec, "UPDATE jobs SET heartbeat=? WHERE id=? AND status='running'", (time.time(), job_id))
+            except sqlite3.Error as e: metrics.inc("gb_errors_total", type=type(e).__name__, route="jobs")
+
+    async def _notify(self, job, attempts=3):
+        body = json.dumps(job, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-GB-Signature"] = "sha256=" + hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        try: await check_webhook(job["webhook_url"])
+        except WebhookRejected:
+            # el host puede resolver distinto que al encolar
+            metrics.inc("gb_jobs_webhooks_total", result="blocked")
+            return
+        async with httpx.AsyncClient(timeout=10) as http:
+            for i in range(attempts):
+                try:
+                    r = await http.post(job["webhook_url"], content=body, headers=headers)
+                    if r.status_code < 500:
+                        metrics.inc("gb_jobs_webhooks_total", result="ok" if r.is_success else "rejected")
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(2 ** i)
+        metrics.inc("gb_jobs_webhooks_total", result="failed")
+
+async def check_webhook(url):
+    # Contra SSRF: el servidor no debe poder usarse para hacer POST a la red interna (metadatos de
+    # la nube, localhost, servicios privados). Se resuelve el host y se exigen IPs públicas.
+    try:
+        u = urllib.parse.urlsplit(url)
+        host, port = (u.hostname or "").lower(), u.port or (443 if u.scheme == "https" else 80)
+    except ValueError:
+        raise WebhookRejected("webhook_url mal formada") from None
+    if u.scheme not in ("http", "https") or not host: raise WebhookRejected("webhook_url debe ser http(s)://host/...")
+    if WEBHOOK_HOSTS:
+        if host not in WEBHOOK_HOSTS: raise WebhookRejected(f"host no permitido: {host}")
+        return
+    try: infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise WebhookRejected(f"no se puede resolver {host}") from None
+    for *_, addr in infos:
+        ip = ipaddress.ip_address(addr[0].split("%")[0])
+        if ip.version == 6 and ip.ipv4_mapped: ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast: raise WebhookRejected(f"{host} resuelve a una dirección no pública ({ip})")
+
+def _alive(owner):
+    # owner "host:pid"; de otra máquina no se puede saber: decide el latido
+    host, _, pid = (owner or "").rpartition(":")
+    if not pid.isdigit(): return False
+    if host != HOST: return True
+    if int(pid) == PID: return False
+    try: os.kill(int(pid), 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
+
+def _write(path, data):
+    # bytes o archivo subido (se copia por bloques)
+    with open(path, "wb") as f:
+        if isinstance(data, (bytes, bytearray)): f.write(data)
+        else: data.seek(0); shutil.copyfileobj(data, f, 1 << 20)
+
+def _read(path):
+    with open(path, "rb") as f: return f.read()
+
+def from_env():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return JobQueue(os.getenv("GB_JOBS_DB") or os.path.join(DATA_DIR, "jobs.sqlite"), os.path.join(DATA_DIR, "jobs"))
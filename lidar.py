@@ -1,117 +1,314 @@
 from __future__ import annotations
-import io, math, numpy as np
+import io, math, os, signal, numpy as np
 from typing import Any, Dict
+import ply
 try:
     import trimesh
 except Exception:
     trimesh = None
+try:
+    from scipy.spatial import cKDTree
+except Exception:
+    cKDTree = None
+
+# Preprocesado de la nube (equivalente a PointCloudFusion.fuse en el dispositivo)
+VOXEL_M = float(os.getenv("GB_SCAN_VOXEL_M", "0.01"))
+MAX_POINTS = int(os.getenv("GB_SCAN_MAX_POINTS", "150000"))
+OUTLIER_RADIUS_M = float(os.getenv("GB_SCAN_OUTLIER_RADIUS_M", "0.05"))
+OUTLIER_MIN_NEIGHBORS = int(os.getenv("GB_SCAN_OUTLIER_MIN_NEIGHBORS", "8"))
+OUTLIER_STD_RATIO = float(os.getenv("GB_SCAN_OUTLIER_STD_RATIO", "2.5"))
 
-def _fit_plane_ransac(points: np.ndarray, max_iters: int = 800, thresh: float = 0.02):
-    import random
+def _fit_plane_ransac(points: np.ndarray, max_iters: int = 800, thresh: float = 0.02,
+                      sample_size: int = 20_000, batch: int = 64, confidence: float = 0.999, seed: int = 42):
     N = points.shape[0]
     if N < 50:
         n0 = np.array([0,1,0], float); d0 = 0.0
         return n0, d0, np.zeros(N, dtype=bool), float("nan")
-    best_inliers = None; best_n=None; best_d=None
-    rng = random.Random(42); idx = list(range(N))
-    for _ in range(max_iters):
-        i1,i2,i3 = rng.sample(idx,3)
-        p1,p2,p3 = points[i1],points[i2],points[i3]
-        v1,v2 = p2-p1, p3-p1
-        n = np.cross(v1,v2); norm = np.linalg.norm(n)
-        if norm < 1e-6: continue
-        n = n/norm; d = -float(n @ p1)
-        dist = np.abs(points @ n + d)
-        inl = dist <= thresh
-        if best_inliers is None or inl.sum() > best_inliers.sum():
-            best_inliers, best_n, best_d = inl, n, d
-    if best_inliers is None:
+    rng = np.random.default_rng(seed)
+    # Las hipótesis se puntúan contra una submuestra fija; el plano ganador se refina con todos los puntos.
+    sub = points if N <= sample_size else points[rng.choice(N, sample_size, replace=False)]
+    M = sub.shape[0]
+    best_count, best_n, best_d = -1, None, None
+    needed, done = max_iters, 0
+    while done < min(max_iters, needed):
+        k = min(batch, max_iters - done); done += k
+        idx = rng.integers(0, M, size=(k, 3))
+        p1, p2, p3 = sub[idx[:,0]], sub[idx[:,1]], sub[idx[:,2]]
+        n = np.cross(p2-p1, p3-p1); norm = np.linalg.norm(n, axis=1)
+        ok = norm >= 1e-6
+        if not ok.any(): continue
+        n = n[ok] / norm[ok,None]; d = -np.einsum("ij,ij->i", n, p1[ok])
+        counts = np.count_nonzero(np.abs(sub @ n.T + d) <= thresh, axis=0)
+        j = int(np.argmax(counts))
+        if counts[j] > best_count:
+            best_count, best_n, best_d = int(counts[j]), n[j], float(d[j])
+            # nº de iteraciones adaptativo: prob. de haber muestreado ya 3 inliers >= confidence
+            w = best_count / M
+            if w >= 1.0: needed = 0
+            elif w > 0: needed = int(np.ceil(np.log(1-confidence) / np.log(1 - w**3)))
+    if best_n is None:
         n0 = np.array([0,1,0], float); d0 = 0.0
         return n0, d0, np.zeros(N, dtype=bool), float("nan")
+    # Refinado por mínimos cuadrados (normal = autovector menor de la covarianza de los inliers)
+    inl = np.abs(points @ best_n + best_d) <= thresh
+    if inl.sum() >= 3:
+        P = points[inl]; c = P.mean(0)
+        w_, V_ = np.linalg.eigh((P-c).T @ (P-c))
+        n_ref = V_[:,0] * (1.0 if V_[:,0] @ best_n >= 0 else -1.0)
+        best_n, best_d = n_ref, -float(n_ref @ c)
+        inl = np.abs(points @ best_n + best_d) <= thresh
     dist = np.abs(points @ best_n + best_d)
-    rmse = float(np.sqrt(np.mean(dist[best_inliers]**2))) if best_inliers.any() else float("nan")
-    return best_n, float(best_d), best_inliers, rmse
+    rmse = float(np.sqrt(np.mean(dist[inl]**2))) if inl.any() else float("nan")
+    return best_n, float(best_d), inl, rmse
+
+def _voxel_downsample(V: np.ndarray, voxel: float) -> np.ndarray:
+    # Centroide por vóxel, todo vectorizado (np.unique + bincount)
+    if voxel <= 0 or V.shape[0] == 0: return V
+    k = np.floor((V - V.min(0)) / voxel).astype(np.int64)
+    dims = k.max(0) + 1
+    if float(dims[0]) * float(dims[1]) * float(dims[2]) < 2**62:
+        lin = (k[:,0] * dims[1] + k[:,1]) * dims[2] + k[:,2]
+        _, inv, counts = np.unique(lin, return_inverse=True, return_counts=True)
+    else:
+        _, inv, counts = np.unique(k, axis=0, return_inverse=True, return_counts=True)
+    inv = inv.ravel()
+    out = np.empty((counts.shape[0], 3))
+    for i in range(3): out[:,i] = np.bincount(inv, weights=V[:,i], minlength=counts.shape[0]) / counts
+    return out
+
+def _downsample_to_budget(V: np.ndarray, voxel: float = VOXEL_M, max_points: int = MAX_POINTS):
+    # La superficie escala ~1/voxel²: se agranda el vóxel hasta entrar en el presupuesto de puntos
+    out = _voxel_downsample(V, voxel)
+    for _ in range(6):
+        if max_points <= 0 or out.shape[0] <= max_points: break
+        voxel *= math.sqrt(out.shape[0] / max_points) * 1.05
+        out = _voxel_downsample(V, voxel)
+    return out, voxel
+
+def _remove_outliers(V: np.ndarray, radius: float = OUTLIER_RADIUS_M, min_neighbors: int = OUTLIER_MIN_NEIGHBORS,
+                     std_ratio: float = OUTLIER_STD_RATIO) -> np.ndarray:
+    n = V.shape[0]
+    if n < max(50, min_neighbors + 2): return np.ones(n, dtype=bool)
+    if cKDTree is None:
+        # sin scipy: vecinos aproximados = puntos en la misma celda de lado `radius`
+        k = np.floor((V - V.min(0)) / radius).astype(np.int64)
+        _, inv, counts = np.unique(k, axis=0, return_inverse=True, return_counts=True)
+        return counts[inv.ravel()] > max(1, min_neighbors // 2)
+    # Una sola consulta k-NN sirve para ambos filtros (la columna 0 es el propio punto)
+    dist, _ = cKDTree(V).query(V, k=min_neighbors + 1, workers=-1)
+    # radio: el k-ésimo vecino a <= radius  <=>  al menos min_neighbors vecinos dentro del radio.
+    # En nubes más ralas que lo previsto el radio se adapta a la densidad típica (mediana).
+    keep = dist[:,-1] <= max(radius, 2.0 * float(np.median(dist[:,-1])))
+    # estadístico: distancia media a los k vecinos dentro de media + std_ratio·σ
+    md = dist[:,1:].mean(1)
+    keep &= md <= md.mean() + std_ratio * md.std()
+    return keep
+
+def preprocess_points(V: np.ndarray):
+    n_raw = V.shape[0]
+    D, voxel = _downsample_to_budget(V)
+    keep = _remove_outliers(D)
+    D = D[keep]
+    return D, {"points_raw": int(n_raw), "points_used": int(D.shape[0]), "outliers_removed": int((~keep).sum()),
+               "voxel_m": round(voxel, 4)}
+
+GIRTH_SLABS = int(os.getenv("GB_SCAN_GIRTH_SLABS", "40"))
+GROUND_THRESH_M = 0.02
+# vientre de un bovino adulto ~45–55 % de la alzada: por debajo del 40 % casi todo son patas
+LEG_FRAC = 0.4
+TRUNK_FRAC = 0.4
+GIRTH_DIRS = 128  # múltiplo de 4: incluye 0, π/2, π y 3π/2 (anchura y altura exactas)
+
+def _half_dirs(k: int = GIRTH_DIRS) -> np.ndarray:
+    t = np.arange(k // 2) * (2*np.pi/k)
+    return np.stack([np.cos(t), np.sin(t)], axis=1).astype(np.float32)
+
+# Envolvente convexa 2D vía función soporte h(θ) = max p·u(θ): el perímetro de la envolvente es
+# ∫h(θ)dθ (fórmula de Cauchy), así que basta un max por dirección, sin construir el polígono.
+# Sólo se proyecta sobre medio círculo: h(θ+π) = -min p·u(θ).
+def _support(P: np.ndarray, min_pts: int = 50):
+    if P.shape[0] < min_pts: return None
+    M = _half_dirs() @ np.ascontiguousarray(P.T, dtype=np.float32)
+    return np.concatenate([M.max(1), -M.min(1)]).astype(float)
+
+def _perimeter(h: np.ndarray):
+    return h.sum(-1) * (2*np.pi/h.shape[-1])
+
+def _extent(h: np.ndarray, axis: int):
+    # anchura (axis=0) o alto (axis=1) de la sección: h(θ) + h(θ+π)
+    k = h.shape[-1]; i = axis * k // 4
+    return h[..., i] + h[..., i + k//2]
+
+def girth_profile(x: np.ndarray, yz: np.ndarray, n_slabs: int = GIRTH_SLABS, min_pts: int = 50):
+    # Todas las rodajas en una pasada: puntos ordenados por rodaja y np.maximum/minimum.reduceat
+    # sobre la matriz (direcciones × puntos) contigua.
+    x0 = float(x.min()); span = max(float(x.max()) - x0, 1e-9)
+    b = np.minimum(((x - x0) / span * n_slabs).astype(np.int64), n_slabs - 1)
+    order = np.argsort(b, kind="stable")
+    counts = np.bincount(b, minlength=n_slabs)
+    ne = np.flatnonzero(counts)
+    starts = (np.cumsum(counts) - counts)[ne]
+    M = _half_dirs() @ np.ascontiguousarray(yz[order].T, dtype=np.float32)
+    h = np.full((n_slabs, GIRTH_DIRS), np.nan)
+    h[ne] = np.concatenate([np.maximum.reduceat(M, starts, axis=1), -np.minimum.reduceat(M, starts, axis=1)]).T
+    h[counts < min_pts] = np.nan
+    return {"pos": (np.arange(n_slabs) + 0.5) / n_slabs, "girth": _perimeter(h),
+            "width": _extent(h, 0), "depth": _extent(h, 1), "count": counts}
 
 def _to_numpy_vertices(mesh) -> np.ndarray:
     if hasattr(mesh, 'vertices'):
         return np.asarray(mesh.vertices, dtype=float)
     return np.asarray(mesh.get('vertices', []), dtype=float)
 
-def extract_lidar_metrics(file_bytes: bytes, filename: str, meta: Dict[str, Any]) -> Dict[str, Any]:
-    if trimesh is None:
-        return {"error": "trimesh no disponible"}
-    file_obj = io.BytesIO(file_bytes)
+def load_vertices(src, filename: str):
+    # src: ruta o bytes. Devuelve (V, volumen estimado). Las nubes PLY se leen con ply.py
+    # directamente a NumPy; trimesh sólo se usa para mallas con caras u otros formatos.
     ft = filename.split('.')[-1].lower()
+    ply_error = None
+    if ft == "ply":
+        try:
+            V, faces = ply.read_ply_vertices(src)
+            if faces == 0 or trimesh is None: return V, float('nan')
+        except ply.PLYError as e:
+            ply_error = e
+    if trimesh is None:
+        if ply_error is not None: raise ply_error
+        return None, float('nan')
+    file_obj = io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else open(src, "rb")
+    with file_obj:
+        # sin force='mesh': un PLY de sólo vértices (PLYWriter de la app) se convertiría en malla vacía
+        try:
+            try:
+                mesh = trimesh.load(file_obj, file_type=ft)
+            except Exception:
+                file_obj.seek(0); mesh = trimesh.load(file_obj, file_type=ft, force='mesh')
+        except Exception:
+            # si tampoco trimesh lo entiende, el error del lector PLY es el que explica el problema
+            if ply_error is not None: raise ply_error
+            raise
+    if isinstance(mesh, trimesh.Scene):
+        mesh = mesh.dump().sum()
     try:
-        mesh = trimesh.load(file_obj, file_type=ft, force='mesh')
+        est_vol = float(mesh.volume if mesh.is_volume else mesh.convex_hull.volume)
     except Exception:
-        file_obj.seek(0); mesh = trimesh.load(file_obj, force='mesh')
-    if not isinstance(mesh, trimesh.Trimesh):
-        if hasattr(mesh, 'dump'):
-            mesh = mesh.dump().sum()
+        est_vol = float('nan')
+    return _to_numpy_vertices(mesh), est_vol
 
-    V = _to_numpy_vertices(mesh).astype(float)
-    V = V[np.isfinite(V).all(axis=1)]
+def extract_lidar_metrics(file_bytes: bytes, filename: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return _metrics_from_source(file_bytes, filename, meta)
+
+def extract_lidar_metrics_from_path(path: str, filename: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return _metrics_from_source(path, filename, meta)
+
+def _metrics_from_source(src, filename, meta):
+    V, est_vol = load_vertices(src, filename)
+    if V is None:
+        return {"error": "trimesh no disponible"}
+    V = np.asarray(V, dtype=float)
+    finite = np.isfinite(V).all(axis=1)
+    if not finite.all(): V = V[finite]
     if V.size == 0:
         return {"error": "Malla vacía o no soportada"}
+    return _metrics_from_vertices(V, est_vol)
 
-    # Ground plane + crop
-    n, d, inliers, rmse = _fit_plane_ransac(V, max_iters=800, thresh=0.02)
-    dist_signed = V @ n + d
-    keep = dist_signed >= -0.01
-    V = V[keep]
-
-    # PCA axes
-    C = V.mean(0, keepdims=True)
-    X = V - C
-    U,S,Vt = np.linalg.svd(X, full_matrices=False)
-    axes = Vt
-    Xp = X @ axes.T
-    L = float(Xp[:,0].ptp())
-    W = float(Xp[:,1].ptp())
-    H = float(Xp[:,2].ptp())
-
-    # Heart girth approx by slab hull at 40% length
-    x_min, x_max = float(Xp[:,0].min()), float(Xp[:,0].max())
-    slab = (Xp[:,0] >= x_min + 0.37*(x_max-x_min)) & (Xp[:,0] <= x_min + 0.43*(x_max-x_min))
-    yz = Xp[slab][:,1:3]
-    heart_girth = float('nan')
-    if yz.shape[0] >= 50:
-        pts = yz[np.lexsort((yz[:,1], yz[:,0]))]
-        def cross(o,a,b): return (a[0]-o[0])*(b[1]-o[1])-(a[1]-o[1])*(b[0]-o[0])
-        lower=[]; upper=[]
-        for p in pts:
-            while len(lower)>=2 and cross(lower[-2], lower[-1], p) <= 0: lower.pop()
-            lower.append(tuple(p))
-        for p in reversed(pts):
-            while len(upper)>=2 and cross(upper[-2], upper[-1], p) <= 0: upper.pop()
-            upper.append(tuple(p))
-        hull = np.array(lower[:-1]+upper[:-1])
-        per=0.0
-        for i in range(len(hull)):
-            a=hull[i]; b=hull[(i+1)%len(hull)]
-            per += float(np.linalg.norm(np.array(b)-np.array(a)))
-        heart_girth = float(per)
-
-    # Volume/peso aprox
-    try:
-        est_vol = float(mesh.volume if mesh.is_volume else mesh.convex_hull.volume)
-    except Exception:
-        est_vol = float('nan')
-    weight_est = (heart_girth**2 * L)/11877.0 if np.isfinite(heart_girth) and heart_girth>0 else float('nan')
+def _metrics_from_vertices(V: np.ndarray, est_vol: float) -> Dict[str, Any]:
+    # Coste acotado por MAX_POINTS, no por la densidad del escaneo
+    n_raw = V.shape[0]
+    V, prep = preprocess_points(V)
+    if V.shape[0] == 0:
+        return {"error": "Malla vacía o no soportada"}
+
+    # Suelo + recorte: fuera los inliers del plano y lo que quede por debajo
+    n, d, inliers, rmse = _fit_plane_ransac(V, max_iters=800, thresh=GROUND_THRESH_M)
+    z = V @ n + d
+    # el signo de la normal es arbitrario: el animal queda del lado donde está la mayoría de no-inliers
+    if (~inliers).any() and np.median(z[~inliers]) < 0: n, z = -n, -z
+    keep = (z > GROUND_THRESH_M) & ~inliers
+    V, z = V[keep], z[keep]
+    if V.shape[0] < 50:
+        return {"error": "Sin puntos por encima del suelo"}
+
+    # Ejes: vertical = normal del suelo (z = altura); largo y ancho = PCA de la proyección horizontal
+    P = V - np.outer(z, n)
+    P -= P.mean(0)
+    e1 = np.linalg.svd(P, full_matrices=False)[2][0]
+    e1 = e1 - (e1 @ n) * n; e1 /= max(np.linalg.norm(e1), 1e-12)
+    x, y = P @ e1, P @ np.cross(n, e1)
+
+    # Perfil de perímetros sin patas (solo por encima de LEG_FRAC de la altura). El tronco es el tramo
+    # contiguo de rodajas alrededor del máximo con perímetro >= TRUNK_FRAC del máximo: cuello, cabeza
+    # y cola quedan fuera del largo, de la alzada y del perímetro torácico.
+    upper = z >= LEG_FRAC * float(np.percentile(z, 99.5))
+    xu = x[upper]
+    prof = girth_profile(xu, np.c_[y[upper], z[upper]])
+    g = np.nan_to_num(prof["girth"])
+    k = prof["girth"].shape[0]
+    gmax = int(np.argmax(g)) if g.any() else None
+    lo = hi = gmax if gmax is not None else 0
+    if gmax is None: lo, hi = 0, k - 1
+    while lo > 0 and g[lo - 1] >= TRUNK_FRAC * g[gmax]: lo -= 1
+    while hi < k - 1 and g[hi + 1] >= TRUNK_FRAC * g[gmax]: hi += 1
+    x0, span = float(xu.min()), max(float(np.ptp(xu)), 1e-9)
+    xa, xb = x0 + lo / k * span, x0 + (hi + 1) / k * span
+    L = xb - xa
+    trunk = (x >= xa) & (x <= xb)
+    H = float(np.percentile(z[trunk], 99.5))
+    W = float(np.ptp(y[trunk & upper])) if (trunk & upper).any() else float('nan')
+    # delante = el extremo con más puntos fuera del tronco (cuello y cabeza); rel 0 = delante
+    front_max = (xu > xb).sum() >= (xu < xa).sum()
+    to_rel = lambda v: (xb - v) / L if front_max else (v - xa) / L
+    rel = to_rel(x)
+    heart = _support(np.c_[y, z][upper & (rel >= 0.37) & (rel <= 0.43)])
+    heart_girth = float(_perimeter(heart)) if heart is not None else float('nan')
+    chest_depth = float(_extent(heart, 1)) if heart is not None else float('nan')
+    slab_rel = to_rel(x0 + prof["pos"] * span)
+    rump = (slab_rel >= 0.80) & (slab_rel <= 0.95) & np.isfinite(prof["width"])
+    rump_width = float(prof["width"][rump].max()) if rump.any() else float('nan')
+
+    # Peso aprox: perímetro²·largo/11877 con ambos en cm -> kg (las medidas están en m)
+    weight_est = ((heart_girth*100)**2 * (L*100))/11877.0 if np.isfinite(heart_girth) and heart_girth>0 else float('nan')
 
     quality = {
-        "coverage_pct": 80.0 if V.shape[0] > 5_000 else 50.0,
-        "noise_level": 0.08 if V.shape[0] > 5_000 else 0.2,
+        "coverage_pct": 80.0 if n_raw > 5_000 else 50.0,
+        "noise_level": 0.08 if n_raw > 5_000 else 0.2,
         "ground_plane_fit_rmse": rmse,
         "scale_warning": not (0.9 <= H <= 1.9),
+        **prep,
     }
 
-    return {{
+    return {
         "quality": quality,
         "withers_height_m": H, "body_length_m": L, "heart_girth_m": heart_girth,
-        "chest_depth_m": float(np.ptp(yz[:,1])) if isinstance(yz, np.ndarray) and yz.size else float('nan'),
+        "chest_depth_m": chest_depth, "rump_width_m": rump_width,
+        "girth_max_m": float(prof["girth"][gmax]) if gmax is not None else float('nan'),
+        "girth_max_pos": float(slab_rel[gmax]) if gmax is not None else float('nan'),
+        "girth_profile_m": [round(float(g), 4) for g in prof["girth"]],
         "hip_width_m": W, "rump_angle_deg": float('nan'),
         "estimated_volume_m3": est_vol, "stance_asymmetry_idx": float('nan'),
         "weight_est_kg": weight_est,
-    }}
+    }
+
+def _json_safe(x):
+    if isinstance(x, dict): return {k: _json_safe(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)): return [_json_safe(v) for v in x]
+    if isinstance(x, (float, np.floating)): return float(x) if math.isfinite(x) else None
+    if isinstance(x, np.integer): return int(x)
+    if isinstance(x, np.bool_): return bool(x)
+    return x
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("tiempo de procesamiento del escaneo agotado")
+
+def extract_lidar_metrics_job(path: str, filename: str, meta: Dict[str, Any], timeout_s: float = 0) -> Dict[str, Any]:
+    # Punto de entrada para el ProcessPoolExecutor: límite de tiempo por trabajo (SIGALRM en el
+    # proceso hijo) y salida serializable a JSON (NaN -> None).
+    if timeout_s and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    try:
+        return _json_safe(extract_lidar_metrics_from_path(path, filename, meta))
+    except TimeoutError as e:
+        return {"error": str(e)}
+    finally:
+        if timeout_s and hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
@@ -0,0 +1,243 @@
+# Capa de resiliencia para las llamadas al modelo: límite de concurrencia AIMD,
+# reintentos con backoff exponencial + jitter (respetando Retry-After) y circuit breaker.
+import asyncio, os, random, time
+
+import openai
+
+import metrics
+
+metrics.describe("gb_llm_retries_total", "Reintentos de llamadas al modelo por tipo de error.")
+metrics.describe("gb_llm_circuit_open_total", "Veces que el circuit breaker se abrió.")
+metrics.describe("gb_llm_rejected_total", "Llamadas rechazadas sin salir porque el circuito estaba abierto.")
+
+# Errores transitorios del proveedor: se reintentan aquí, nunca disparan el fallback de API.
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError, openai.ConflictError)
+# Errores de forma (SDK sin responses, kwargs no soportados, 400/404/422, salida no-JSON):
+# son los únicos que justifican probar la otra API.
+FALLBACK_ERRORS = (AttributeError, TypeError, ValueError, openai.BadRequestError, openai.NotFoundError,
+                   openai.UnprocessableEntityError, openai.APIResponseValidationError)
+
+# Subconjunto que indica que el endpoint/SDK no soporta la API (no un fallo puntual de parseo).
+CAPABILITY_ERRORS = (AttributeError, TypeError, openai.BadRequestError, openai.NotFoundError,
+                     openai.UnprocessableEntityError, openai.APIResponseValidationError)
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+def _is_throttle(e):
+    return isinstance(e, openai.RateLimitError) or getattr(e, "status_code", None) == 429
+
+def _retry_after(e):
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"): return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"): return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+class AIMDLimiter:
+    # Aumento aditivo (≈ +1 por ventana completa sin errores), reducción multiplicativa ante 429
+    # (como mucho una reducción por segundo: una ráfaga de 429 simultáneos es una sola señal).
+    def __init__(self, initial=8, min_limit=1, max_limit=64, decrease=0.5):
+        self.limit, self.min_limit, self.max_limit, self.decrease = float(initial), min_limit, max_limit, decrease
+        self.inflight = 0
+        self._last_cut = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def release(self, throttled=False):
+        async with self._cond:
+            self.inflight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_cut >= 1.0:
+                    self.limit, self._last_cut = max(self.min_limit, self.limit * self.decrease), now
+            else: self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            self._cond.notify_all()
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold, self.cooldown = threshold, cooldown
+        self.failures, self.opened_at, self._probing = 0, None, False
+
+    @property
+    def state(self):
+        if self.opened_at is None: return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        st = self.state
+        if st == "closed": return True
+        if st == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures, self.opened_at, self._probing = 0, None, False
+
+    def abandon(self):
+        # la sonda acabó sin veredicto (cancelada o error nuestro): otra llamada puede sondear
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.state != "open": metrics.inc("gb_llm_circuit_open_total")
+            self.opened_at, self._probing = time.monotonic(), False
+
+class ResilientCaller:
+    # budget: shared_state.RateBudget opcional, común a todos los workers (el AIMD y el breaker son por proceso)
+    def __init__(self, limiter, breaker, max_retries=4, base_delay=0.5, max_delay=20.0, budget=None):
+        self.limiter, self.breaker, self.budget = limiter, breaker, budget
+        self.max_retries, self.base_delay, self.max_delay = max_retries, base_delay, max_delay
+
+    async def call(self, make_call):
+        # make_call: fábrica sin argumentos que devuelve la corrutina del SDK (se recrea en cada intento)
+        attempt = 0
+        while True:
+            probe = await self._enter()
+            throttled = False
+            try:
+                res = await make_call()
+            except RETRYABLE_ERRORS as e:
+                throttled = _is_throttle(e)
+                err = e
+            except FALLBACK_ERRORS:
+                # no es culpa del proveedor: no cuenta para el breaker ni para el límite
+                if probe: self.breaker.abandon()
+                raise
+            except Exception:
+                self.breaker.failure()
+                raise
+            except asyncio.CancelledError:
+                if probe: self.breaker.abandon()
+                raise
+            else:
+                self.breaker.success()
+                return res
+            finally:
+                await self.limiter.release(throttled)
+            attempt += 1
+            await self._backoff(err, throttled, attempt, probe)
+
+    async def stream(self, make_call):
+        # Como call() para stream=True, pero generador de fragmentos: el hueco del limitador se
+        # mantiene hasta leer el último y los errores a mitad de stream cuentan para el breaker y el
+        # AIMD. Solo se reintenta si aún no se entregó ningún fragmento (no se puede deshacer lo enviado).
+        attempt = 0
+        while True:
+            probe = await self._enter()
+            throttled = started = False
+            try:
+                async for chunk in await make_call():
+                    started = True
+                    yield chunk
+            except RETRYABLE_ERRORS as e:
+                throttled = _is_throttle(e)
+                err = e
+            except FALLBACK_ERRORS:
+                if probe: self.breaker.abandon()
+                raise
+            except Exception:
+                self.breaker.failure()
+                raise
+            except (asyncio.CancelledError, GeneratorExit):
+                # cliente desconectado o lector que deja el stream a medias: sin veredicto
+                if probe: self.breaker.abandon()
+                raise
+            else:
+                self.breaker.success()
+                return
+            finally:
+                await self.limiter.release(throttled)
+            attempt += 1
+            if started:
+                self.breaker.failure()
+                raise err
+            await self._backoff(err, throttled, attempt, probe)
+
+    async def _enter(self):
+        # antes de cada intento: si el circuito se abrió durante el backoff, no se insiste.
+        # Devuelve si este intento es la sonda de half_open.
+        if not self.breaker.allow():
+            metrics.inc("gb_llm_rejected_total")
+            raise CircuitOpenError("modelo no disponible temporalmente (circuit breaker abierto)")
+        probe = self.breaker.state != "closed"
+        try:
+            if self.budget is not None: await self.budget.acquire()
+            await self.limiter.acquire()
+        except BaseException:
+            if probe: self.breaker.abandon()
+            raise
+        return probe
+
+    async def _backoff(self, err, throttled, attempt, probe):
+        # tras un error reintentable: espera antes del siguiente intento o propaga err
+        # la sonda de half_open es un único intento: si falla, el circuito vuelve a abrirse
+        if probe:
+            self.breaker.failure()
+            raise err
+        metrics.inc("gb_llm_retries_total", reason=type(err).__name__)
+        if attempt > self.max_retries:
+            self.breaker.failure()
+            raise err
+        delay = _retry_after(err)
+        # un 429 con Retry-After frena a todos los workers, no solo a este
+        if throttled and delay is not None and self.budget is not None: await self.budget.cooldown(min(delay, self.max_delay))
+        if delay is None: delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        await asyncio.sleep(min(delay, self.max_delay))
+
+    def state(self):
+        return {"limit": round(self.limiter.limit, 2), "inflight": self.limiter.inflight,
+                "circuit": self.breaker.state, "consecutive_failures": self.breaker.failures}
+
+class ApiPathCache:
+    # Recuerda por (base_url, modelo) qué API funciona; si es "chat", vuelve a sondear
+    # "responses" cada reprobe_s segundos con una única petición a la vez. "since" es el último
+    # cambio de camino y "probed" el último sondeo (o confirmación) del camino actual.
+    def __init__(self, reprobe_s=1800.0):
+        self.reprobe_s = reprobe_s
+        self._paths = {}
+        self._probing = {}
+
+    def choose(self, base_url, model):
+        key = (base_url or "default", model)
+        ent = self._paths.get(key)
+        if ent is None or ent["path"] == "responses": return "responses"
+        now = time.time()
+        # un sondeo que acabó en error transitorio no llega a record(): caduca a los 120 s
+        if now - ent["probed"] >= self.reprobe_s and now - self._probing.get(key, 0.0) > 120.0:
+            self._probing[key] = now
+            return "responses"
+        return "chat"
+
+    def record(self, base_url, model, path, reason=None):
+        key = (base_url or "default", model)
+        self._probing.pop(key, None)
+        ent, now = self._paths.get(key), time.time()
+        if ent is None or ent["path"] != path:
+            self._paths[key] = {"path": path, "since": now, "probed": now, "reason": reason}
+            metrics.inc("gb_llm_api_path_changes_total", path=path)
+        else:
+            # mismo camino (p. ej. el sondeo de responses volvió a fallar): no es un cambio,
+            # solo se reinicia el reloj del próximo sondeo
+            ent["probed"] = now
+            if reason: ent["reason"] = reason
+
+    def state(self):
+        return [{"base_url": k[0], "model": k[1], **v} for k, v in self._paths.items()]
+
+metrics.describe("gb_llm_api_path_changes_total", "Cambios de la API elegida (responses/chat) por modelo y endpoint.")
+
+def from_env(budget=None):
+    return ResilientCaller(
+        AIMDLimiter(initial=int(os.getenv("GB_LLM_CONCURRENCY", "8")), max_limit=int(os.getenv("GB_LLM_MAX_CONCURRENCY", "64"))),
+        CircuitBreaker(threshold=int(os.getenv("GB_LLM_BREAKER_THRESHOLD", "5")), cooldown=float(os.getenv("GB_LLM_BREAKER_COOLDOWN_S", "30"))),
+        max_retries=int(os.getenv("GB_LLM_MAX_RETRIES", "4")), budget=budget,
+    )
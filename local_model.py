@@ -0,0 +1,85 @@
+# Estimación rápida en CPU con ONNX Runtime: rúbrica (11 métricas) + confianza a partir de la foto,
+# sin red. Si la confianza llega a GB_LOCAL_MIN_CONF (y no es modo pro) no se llama al modelo remoto.
+# Contrato del .onnx: entrada float32 (1, 3, S, S) RGB normalizada ImageNet; salidas "rubric" (1, 11)
+# en 0–10 (orden rubric.ORDER) y "confidence" (1, 11) o (1, 1) en 0–1. Sin nombres: primera y segunda salida.
+import hashlib, io, os, time
+
+import numpy as np
+
+import analytics, rubric
+
+try:
+    import onnxruntime as ort
+except Exception:
+    ort = None
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+
+MODEL_PATH = os.getenv("GB_LOCAL_MODEL") or None
+MIN_CONF = float(os.getenv("GB_LOCAL_MIN_CONF", "0.75"))
+THREADS = int(os.getenv("GB_LOCAL_THREADS", "1"))
+
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+# global_score -> decision_level (mismos niveles que pide el prompt)
+LEVELS = ((7.0, "CONSIDERAR_ALTO"), (5.0, "CONSIDERAR_BAJO"), (float("-inf"), "DESCARTAR"))
+
+class LocalModel:
+    def __init__(self, path, min_conf=MIN_CONF, threads=THREADS):
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads, opts.inter_op_num_threads = threads, 1
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.min_conf = min_conf
+        self.name = os.path.basename(path)
+        with open(path, "rb") as f: self.tag = hashlib.sha256(f.read()).hexdigest()[:12]
+        inp = self.session.get_inputs()[0]
+        self.input = inp.name
+        self.size = next((d for d in inp.shape[2:] if isinstance(d, int)), 224)
+        outs = [o.name for o in self.session.get_outputs()]
+        self.outputs = ["rubric" if "rubric" in outs else outs[0], "confidence" if "confidence" in outs else outs[min(1, len(outs) - 1)]]
+
+    def _pixels(self, raw):
+        # raw: bytes o archivo (subida); draft() decodifica el JPEG ya reducido
+        im = Image.open(io.BytesIO(raw) if isinstance(raw, (bytes, bytearray, memoryview)) else raw)
+        if im.format == "JPEG": im.draft("RGB", (self.size * 2, self.size * 2))
+        im = ImageOps.exif_transpose(im).convert("RGB").resize((self.size, self.size), Image.BILINEAR)
+        x = (np.asarray(im, dtype=np.float32) / 255.0 - _MEAN) / _STD
+        return x.transpose(2, 0, 1)[None]
+
+    def predict(self, raw):
+        # -> (vector (11,) 0–10 con NaN si no es finito, confianza (11,) 0–1); síncrono, para el pool de imagen
+        if hasattr(raw, "seek"): raw.seek(0)
+        score, conf = self.session.run(self.outputs, {self.input: self._pixels(raw)})
+        vec = np.clip(np.asarray(score, dtype=np.float64).reshape(-1)[:rubric.N], 0.0, 10.0)
+        conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+        conf = np.full(rubric.N, conf[0]) if conf.size == 1 else conf[:rubric.N]
+        return np.where(np.isfinite(vec), vec, np.nan), np.clip(np.nan_to_num(conf), 0.0, 1.0)
+
+    def estimate(self, views):
+        # Varias vistas: se combinan como las del modelo remoto (media ponderada por confianza).
+        t0 = time.perf_counter()
+        preds = [self.predict(v) for v in views]
+        if len(preds) == 1: vec, conf = np.round(preds[0][0] * 2) / 2, preds[0][1]
+        else:
+            vec, conf = rubric.merge_views([{"rubric": rubric.as_dict(v), "confidence": dict(zip(rubric.ORDER, c.tolist()))} for v, c in preds])
+        confidence = float(np.mean(np.where(np.isnan(vec), 0.0, conf)))
+        return {"model": self.name, "rubric": {k: float(x) for k, x in zip(rubric.ORDER, vec) if not np.isnan(x)},
+                "rubric_confidence": {k: round(float(c), 2) for k, c in zip(rubric.ORDER, conf)},
+                "confidence": round(confidence, 3), "confident": confidence >= self.min_conf, "threshold": self.min_conf,
+                "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+def decision(rub, category):
+    # Decisión sin modelo remoto: score ponderado por categoría (mismos pesos que el ranking del lote)
+    vec = rubric.vector(rub)
+    w = analytics.weights_for(category)
+    valid = ~np.isnan(vec)
+    score = round(float(np.dot(vec[valid], w[valid]) / w[valid].sum()), 1) if valid.any() else 0.0
+    level = next(name for lo, name in LEVELS if score >= lo)
+    return {"global_score": score, "decision_level": level, "decision_text": "", "rationale": ""}
+
+def from_env():
+    if not MODEL_PATH: return None
+    if ort is None or Image is None: raise RuntimeError("GB_LOCAL_MODEL requiere onnxruntime y Pillow")
+    return LocalModel(MODEL_PATH)
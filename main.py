@@ -1,28 +1,75 @@
-import os, base64, json, re, statistics, unicodedata
-from typing import Optional
+import os, asyncio, hashlib, io, json, resource, zipfile
+from collections import Counter
+from contextlib import aclosing
+from typing import List, Optional
 
-from fastapi import FastAPI, File, Form, UploadFile
+from fastapi import FastAPI, File, Form, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 
+import numpy as np
 from openai import AsyncOpenAI
+import analytics, assets, cache, calibration, imaging, jobs, llm_client, local_model, metrics, rubric, scans, shared_state, store, streaming, tracing, uploads
+from rubric import ORDER, canonize, extract_relaxed
 from prompts import (
-    JSON_GUARD,EVALUATION_PROMPT_ES,EVALUATION_SCHEMA,
-    RUBRIC_ONLY_PROMPT_ES,STRICT_RUBRIC_PROMPT_ES,STRICT_RUBRIC_SCHEMA
+    JSON_GUARD,EVALUATION_PROMPT_ES,EVALUATION_SCHEMA,MULTIVIEW_PROMPT_ES,MULTIVIEW_SCHEMA,
+    RUBRIC_ONLY_PROMPT_ES,STRICT_RUBRIC_PROMPT_ES,STRICT_RUBRIC_SCHEMA,PROMPT_VERSION,MULTIVIEW_PROMPT_VERSION
 )
 
+metrics.describe("gb_rubric_repairs_total", "Reparaciones de rúbrica por nivel (none, fuzzy, followup, vision, zero_fill).")
+metrics.describe("gb_llm_fallback_total", "Caídas de responses.create a chat.completions por tipo de error.")
+metrics.describe("gb_llm_tokens_total", "Tokens consumidos según el campo usage de la respuesta, por API y tipo.")
+metrics.describe("gb_errors_total", "Errores por tipo de excepción y ruta.")
+metrics.describe("gb_local_total", "Estimaciones del modelo local: aceptadas, escaladas al modelo remoto o usadas sin conexión.")
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 MODEL = os.getenv("MODEL_NAME","gpt-4o-mini")
-client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL) if OPENAI_BASE_URL else AsyncOpenAI(api_key=OPENAI_API_KEY)
+# max_retries=0: los reintentos los gestiona llm_client (backoff, límite AIMD y breaker compartidos)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0) if OPENAI_BASE_URL else AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+# estado común a todos los workers (GB_SHARED_STATE): caché, leases del single-flight y presupuesto del modelo
+SHARED = shared_state.default()
+LLM = llm_client.from_env(budget=shared_state.RateBudget(SHARED, int(os.getenv("GB_LLM_RPM","0"))))
+API_PATHS = llm_client.ApiPathCache(reprobe_s=float(os.getenv("GB_API_REPROBE_S","1800")))
+# SDK sin client.responses: no hace falta gastar una llamada para descubrirlo
+if not hasattr(client, "responses"): API_PATHS.record(OPENAI_BASE_URL, MODEL, "chat", reason="sdk_sin_responses")
+RESULTS = cache.from_env()
+PROMPT_FLIGHTS = cache.SingleFlight("prompt")
+EVAL_FLIGHTS = cache.SingleFlight("evaluate", shared=RESULTS.shared if RESULTS else None, lookup=RESULTS.peek if RESULTS else None)
+BATCH_CONCURRENCY = int(os.getenv("GB_BATCH_CONCURRENCY","4"))
+BATCH_MAX_ITEMS = int(os.getenv("GB_BATCH_MAX_ITEMS","300"))
+IMAGE_EXTS = (".jpg",".jpeg",".png",".webp",".heic",".heif")
+# fotos del mismo animal (lateral, frente, atrás...) por evaluación
+MAX_VIEWS = int(os.getenv("GB_MAX_VIEWS","4"))
+JOBS = jobs.from_env()
+STORE = store.from_env()
+# modelo ONNX local opcional (GB_LOCAL_MODEL): primera pasada sin red; el remoto solo si duda o en modo pro
+LOCAL = local_model.from_env()
+# calibración escaneo -> peso con pesadas reales (GB_CALIB_*): coeficientes por raza en memoria
+CALIB = calibration.from_env()
+# proveedor inalcanzable o saturado: se sirve la estimación local aunque tenga poca confianza
+OFFLINE_ERRORS = llm_client.RETRYABLE_ERRORS + (llm_client.CircuitOpenError,)
+# secciones de la respuesta que el modo SSE envía en cuanto el modelo las termina
+SECTIONS = ("rubric","rubric_notes","decision","health","breed")
 
 app = FastAPI(title="GanadoBravo v4.3.7")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 413 en cuanto el cuerpo pasa del límite de la ruta, antes de parsear el multipart
+app.add_middleware(uploads.BodyLimitMiddleware, limits={
+    "/api/evaluate": MAX_VIEWS * uploads.IMAGE_MAX_BYTES + (scans.MAX_BYTES if scans.ALLOW_3D else 0) + uploads.FORM_SLACK,
+    "/api/jobs": uploads.IMAGE_MAX_BYTES + uploads.FORM_SLACK,
+    "/api/evaluate/batch": uploads.BATCH_MAX_BYTES + uploads.FORM_SLACK,
+    "/api/scans/upload": scans.MAX_BYTES + uploads.FORM_SLACK,
+})
+app.add_middleware(tracing.TracingMiddleware)
+# shell HTML + CSS/JS con hash en static/dist (se compila al arrancar si index.html cambió)
+ASSETS = assets.from_env()
 
-@app.get("/")
-async def root():
+@app.api_route("/", methods=["GET","HEAD"])
+async def root(request: Request):
+    if ASSETS is not None: return ASSETS.shell(request)
     resp = FileResponse("static/index.html")
     try:
         resp.headers['Cache-Control'] = 'no-store'
@@ -30,115 +77,627 @@ async def root():
         pass
     return resp
 
+# antes del mount de /static, que si no se quedaría estas rutas
+@app.api_route("/static/dist/{name}", methods=["GET","HEAD"])
+async def static_dist(request: Request, name: str):
+    if ASSETS is None: return JSONResponse({"error":"assets_deshabilitados"}, status_code=404)
+    return ASSETS.response(request, name)
+
+app.mount("/static", StaticFiles(directory="static"), name="static")
+
+_background = []
+
+@app.on_event("startup")
+async def _startup():
+    await _prewarm()
+    await JOBS.start(_run_job)
+    if STORE is not None: _background.append(asyncio.create_task(STORE.run_flusher()))
+    if CALIB is not None: _background.append(asyncio.create_task(CALIB.run_syncer()))
+
+async def _prewarm():
+    # Cada worker llega a la primera petición con lo caro ya hecho: tablas de la rúbrica, Pillow y
+    # los hilos del pool de imagen, la sesión ONNX y la conexión al backend compartido.
+    with tracing.span("prewarm"):
+        for k in ORDER: canonize({k: 0})
+        sample = imaging.sample_jpeg()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(imaging.POOL, imaging.normalize_image, sample) for _ in range(imaging.WORKERS)))
+        if LOCAL is not None: await loop.run_in_executor(imaging.POOL, LOCAL.predict, sample)
+        await asyncio.to_thread(SHARED.ping)
+    if os.getenv("GB_PREWARM_LLM","0").strip() not in ("0","","false","False"):
+        # conexión TLS al proveedor abierta antes de la primera evaluación (en segundo plano)
+        _background.append(asyncio.create_task(_warm_llm()))
+
+async def _warm_llm():
+    try: await client.models.list()
+    except Exception as e: metrics.inc("gb_errors_total", type=type(e).__name__, route="prewarm")
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await JOBS.stop()
+    for t in _background: t.cancel()
+    if STORE is not None: await asyncio.to_thread(STORE.flush)
+    scans.shutdown()
+
 @app.get("/healthz")
 async def healthz():
-    return {"ok": True}
+    # ru_maxrss en KB (Linux): pico de memoria del proceso desde el arranque
+    return {"ok": True, "worker": shared_state.WORKER_ID, "shared_state": SHARED.name, "llm": LLM.state(), "api_paths": API_PATHS.state(), "jobs": await asyncio.to_thread(JOBS.stats),
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/evaluations")
+async def list_evaluations(category: Optional[str] = None, decision_level: Optional[str] = None, animal_id: Optional[str] = None,
+                           sid: Optional[str] = None, breed: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+                           limit: int = 50, cursor: Optional[str] = None):
+    # since/until en epoch (s); cursor = next_cursor de la página anterior
+    if STORE is None: return JSONResponse({"error":"historico_deshabilitado"}, status_code=404)
+    try:
+        return await asyncio.to_thread(STORE.query, limit=max(1, min(limit, 500)), cursor=cursor, category=category, decision_level=decision_level,
+                                       animal_id=animal_id, sid=sid, breed_guess=breed, since=since, until=until)
+    except ValueError: return JSONResponse({"error":"cursor_invalido"}, status_code=400)
+
+@app.get("/api/evaluations/{eval_id}")
+async def get_evaluation(eval_id: int):
+    item = await asyncio.to_thread(STORE.get, eval_id) if STORE is not None else None
+    return item if item is not None else JSONResponse({"error":"evaluacion_no_encontrada"}, status_code=404)
+
+@app.get("/api/herd/summary")
+async def herd_summary(category: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None, breed: Optional[str] = None):
+    # resumen del rebaño desde el histórico, sin llamar al modelo
+    if STORE is None: return JSONResponse({"error":"historico_deshabilitado"}, status_code=404)
+    return await asyncio.to_thread(STORE.summary, category=category, since=since, until=until, breed_guess=breed)
+
+@app.get("/api/herd/ranking")
+async def herd_ranking(category: Optional[str] = None, k: int = 20, since: Optional[float] = None, until: Optional[float] = None,
+                       breed: Optional[str] = None, outlier_z: float = 3.5):
+    # score ponderado por categoría, percentil y z dentro del conjunto filtrado, outliers y top-K
+    if STORE is None: return JSONResponse({"error":"historico_deshabilitado"}, status_code=404)
+    with tracing.span("herd_load"):
+        rows, M = await asyncio.to_thread(STORE.matrix, category=category, since=since, until=until, breed_guess=breed)
+    with tracing.span("herd_analyze"):
+        return analytics.ranking(rows, M, category, max(0, min(k, 500)), outlier_z)
+
+def _record(result, animal_id=None, sid=None, source=None):
+    if STORE is None: return
+    try: STORE.record(result, animal_id=animal_id, sid=sid, source=source)
+    except Exception as e: metrics.inc("gb_errors_total", type=type(e).__name__, route="store")
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return RESULTS.stats() if RESULTS else {"enabled": False}
+
+def _error_response(req, exc, status):
+    route = getattr(req.scope.get("route"), "path", None) or "unmatched"
+    metrics.inc("gb_errors_total", type=type(exc).__name__, route=route)
+    return JSONResponse({"error":"server_error","detail":str(exc)}, status_code=status)
+
+@app.exception_handler(llm_client.CircuitOpenError)
+async def circuit_open(req, exc):
+    # el proveedor está caído: reintentar más tarde tiene sentido
+    return _error_response(req, exc, 503)
 
 @app.exception_handler(Exception)
 async def all_err(req, exc):
-    return JSONResponse({"error":"server_error","detail":str(exc)}, status_code=200)
-
-def _round05(x): return round(float(x)*2)/2.0
-def _norm(s):
-    s = unicodedata.normalize("NFKD", s).encode("ascii","ignore").decode().lower().strip()
-    s = re.sub(r"[^a-z0-9]+"," ",s); s = re.sub(r"\s+"," ",s).strip()
-    return s
-
-CANON = {
-    "condicion corporal bcs":"Condición corporal (BCS)",
-    "conformacion general":"Conformación general",
-    "linea dorsal":"Línea dorsal",
-    "angulacion costillar":"Angulación costillar",
-    "profundidad de pecho":"Profundidad de pecho",
-    "aplomos patas":"Aplomos (patas)",
-    "lomo":"Lomo",
-    "grupo muscling posterior":"Grupo / muscling posterior",
-    "balance anterior posterior":"Balance anterior–posterior",
-    "ancho toracico":"Ancho torácico",
-    "insercion de cola":"Inserción de cola",
-}
-ORDER = ["Condición corporal (BCS)","Conformación general","Línea dorsal","Angulación costillar","Profundidad de pecho","Aplomos (patas)","Lomo","Grupo / muscling posterior","Balance anterior–posterior","Ancho torácico","Inserción de cola"]
-
-def canonize(rub):
-    out={}
-    if not isinstance(rub, dict): return out
-    for k,v in rub.items():
-        key = CANON.get(_norm(k), None)
-        if not key: continue
-        try: out[key] = _round05(v)
-        except: out[key] = 0.0
-    return out
-
-def extract_relaxed(txt):
-    if not txt: return {}
-    t = txt.strip().replace('```json','```').strip('`')
-    m = re.search(r'\{.*\}', t, re.S)
-    if not m: return {}
-    frag = m.group(0)
-    try: return json.loads(frag)
-    except: 
-        frag = re.sub(r',\s*([}\]])', r'\1', frag)
-        return json.loads(frag)
-
-async def run_prompt(prompt, image_b64, schema=None):
+    return _error_response(req, exc, 500)
+
+async def run_prompt(prompt, image_b64, schema=None, mime="image/jpeg"):
+    return (await run_prompt_ctx(prompt, image_b64, schema, mime))[0]
+
+async def run_prompt_ctx(prompt, image_b64, schema=None, mime="image/jpeg"):
+    # Devuelve (data, ctx); ctx permite seguir la conversación sin reenviar la imagen.
+    h = hashlib.sha256()
+    for b64, m in _images(image_b64, mime): h.update(m.encode("ascii")); h.update(b64.encode("ascii"))
+    key = cache.cache_key(MODEL, prompt, json.dumps(schema, sort_keys=True), h.hexdigest())
+    return await PROMPT_FLIGHTS.do(key, lambda: _run_prompt(prompt, image_b64, schema, mime))
+
+def _images(image_b64, mime):
+    # image_b64: un base64 (mime aparte) o la lista [(base64, mime)] de las vistas
+    return image_b64 if isinstance(image_b64, list) else [(image_b64, mime)]
+
+def _image_parts(image_b64, mime, kind):
+    # con varias vistas cada imagen va precedida de su etiqueta, que el prompt usa para "views"
+    images, parts = _images(image_b64, mime), []
+    for i, (b64, m) in enumerate(images, 1):
+        if len(images) > 1: parts.append({"type":"text","text":f"Vista {i}:"})
+        parts.append({"type":kind,"image_url":{"url":f"data:{m};base64,{b64}"}})
+    return parts
+
+def _parse_json(txt):
+    try: return json.loads(txt)
+    except: return extract_relaxed(txt)
+
+async def _run_prompt(prompt, image_b64, schema=None, mime="image/jpeg"):
     content = [
         {"type":"text","text":JSON_GUARD},
         {"type":"text","text":prompt},
-        {"type":"input_image","image_url":{"url":f"data:image/jpeg;base64,{image_b64}"}},
+        *_image_parts(image_b64, mime, "input_image"),
     ]
-    # responses.create (si está)
-    try:
-        resp = await client.responses.create(
-            model=MODEL, input=[{"role":"user","content":content}],
-            temperature=0,
-            response_format={"type":"json_schema","json_schema":{"name":"gb","schema":schema or {"type":"object"},"strict":bool(schema)}}
-        )
-        txt = getattr(resp, "output_text", None) or getattr(resp, "output", None)
-        if not txt and hasattr(resp, "choices"):
-            txt = resp.choices[0].message.content
-        return json.loads(txt)
-    except Exception:
-        # fallback chat
-        resp = await client.chat.completions.create(
+    # responses.create si se sabe (o se sondea) que funciona para este endpoint/modelo
+    if API_PATHS.choose(OPENAI_BASE_URL, MODEL) == "responses":
+        try:
+            with tracing.span("llm_responses"):
+                resp = await LLM.call(lambda: client.responses.create(
+                    model=MODEL, input=[{"role":"user","content":content}],
+                    temperature=0,
+                    response_format={"type":"json_schema","json_schema":{"name":"gb","schema":schema or {"type":"object"},"strict":bool(schema)}}
+                ))
+            _count_usage(resp, "responses")
+            API_PATHS.record(OPENAI_BASE_URL, MODEL, "responses")
+            txt = getattr(resp, "output_text", None) or getattr(resp, "output", None)
+            if not txt and hasattr(resp, "choices"):
+                txt = resp.choices[0].message.content
+            return json.loads(txt), {"api":"responses","response_id":getattr(resp, "id", None),"transcript":_transcript(prompt, txt)}
+        except llm_client.FALLBACK_ERRORS as e:
+            # fallback chat: solo ante errores de forma/API; 429/5xx ya se reintentaron en LLM.call
+            metrics.inc("gb_llm_fallback_total", reason=type(e).__name__)
+            if isinstance(e, llm_client.CAPABILITY_ERRORS): API_PATHS.record(OPENAI_BASE_URL, MODEL, "chat", reason=type(e).__name__)
+    with tracing.span("llm_chat"):
+        resp = await LLM.call(lambda: client.chat.completions.create(
+            model=MODEL, temperature=0, response_format={"type":"json_object"}, messages=_chat_messages(prompt, image_b64, mime)
+        ))
+    _count_usage(resp, "chat")
+    txt = resp.choices[0].message.content
+    return _parse_json(txt), {"api":"chat","transcript":_transcript(prompt, txt)}
+
+def _chat_stream(prompt, image_b64, mime=None):
+    return LLM.stream(lambda: client.chat.completions.create(
+        model=MODEL, temperature=0, response_format={"type":"json_object"}, stream=True, messages=_chat_messages(prompt, image_b64, mime)
+    ))
+
+def _chat_messages(prompt, image_b64, mime):
+    return [{"role":"system","content":"Devuelve SOLO JSON."},{"role":"user","content":[{"type":"text","text":JSON_GUARD},{"type":"text","text":prompt},*_image_parts(image_b64, mime, "image_url")]}]
+
+def _count_usage(resp, api):
+    # responses: input/output_tokens; chat: prompt/completion_tokens
+    u = getattr(resp, "usage", None)
+    if u is None: return
+    for kind, attrs in (("input", ("input_tokens","prompt_tokens")), ("output", ("output_tokens","completion_tokens"))):
+        n = next((getattr(u, a) for a in attrs if isinstance(getattr(u, a, None), (int, float))), None)
+        if n: metrics.inc("gb_llm_tokens_total", n, api=api, kind=kind)
+
+def _transcript(prompt, txt):
+    # Conversación previa en texto (la imagen ya fue vista por el modelo en ese turno)
+    return [
+        {"role":"system","content":"Devuelve SOLO JSON."},
+        {"role":"user","content":f"{JSON_GUARD}\n{prompt}\n[imagen del animal adjunta en este turno]"},
+        {"role":"assistant","content":txt if isinstance(txt, str) else json.dumps(txt, ensure_ascii=False)},
+    ]
+
+async def run_followup(ctx, prompt, schema=None):
+    # Turno solo-texto sobre la conversación anterior: no reenvía la imagen.
+    if ctx.get("api") == "responses" and ctx.get("response_id"):
+        try:
+            with tracing.span("llm_followup"):
+                resp = await LLM.call(lambda: client.responses.create(
+                    model=MODEL, previous_response_id=ctx["response_id"], temperature=0,
+                    input=[{"role":"user","content":[{"type":"text","text":JSON_GUARD},{"type":"text","text":prompt}]}],
+                    response_format={"type":"json_schema","json_schema":{"name":"gb","schema":schema or {"type":"object"},"strict":bool(schema)}}
+                ))
+            _count_usage(resp, "responses")
+            return _parse_json(getattr(resp, "output_text", None) or "")
+        except llm_client.FALLBACK_ERRORS as e:
+            metrics.inc("gb_llm_fallback_total", reason=type(e).__name__)
+    with tracing.span("llm_followup"):
+        resp = await LLM.call(lambda: client.chat.completions.create(
             model=MODEL, temperature=0, response_format={"type":"json_object"},
-            messages=[{"role":"system","content":"Devuelve SOLO JSON."},{"role":"user","content":[{"type":"text","text":JSON_GUARD},{"type":"text","text":prompt},{"type":"image_url","image_url":{"url":f"data:image/jpeg;base64,{image_b64}"}}]}]
-        )
-        txt = resp.choices[0].message.content
-        try: return json.loads(txt)
-        except: return extract_relaxed(txt)
-
-async def ensure_rubric(image_b64, data):
-    rub = canonize(data.get("rubric") or data.get("morphological_rubric") or {})
-    if len(rub)<11 or sum(rub.values())==0:
-        r = await run_prompt("Devuelve SOLO {\"rubric\":{...}} con las 11 métricas exactas.", image_b64, None)
-        rub = canonize(r.get("rubric") or {})
-    if len(rub)<11 or sum(rub.values())==0:
-        r = await run_prompt( "Devuelve SOLO {\"rubric\":{...}} con las 11 métricas exactas.", image_b64, {"type":"object","properties":{"rubric":{"type":"object","additionalProperties":False}},"required":["rubric"]} )
-        rub = canonize(r.get("rubric") or {})
-    for k in ORDER: rub.setdefault(k, 0.0)
-    return rub
+            messages=ctx["transcript"] + [{"role":"user","content":f"{JSON_GUARD}\n{prompt}"}]
+        ))
+    _count_usage(resp, "chat")
+    return _parse_json(resp.choices[0].message.content)
+
+def _missing_schema(missing):
+    return {"type":"object","additionalProperties":False,"required":["rubric"],"properties":{"rubric":rubric.schema(missing)}}
+
+async def ensure_rubric(image_b64, data, mime="image/jpeg", ctx=None):
+    raw = data.get("rubric") or data.get("morphological_rubric") or {}
+    vec = rubric.vector(raw)  # orden ORDER, NaN = métrica ausente
+    tier = "none"
+    if np.count_nonzero(~np.isnan(vec)) > len(canonize(raw, fuzzy=False)): tier = "fuzzy"
+    missing = np.isnan(vec)
+    # 1) faltan métricas pero el resto es válido: pedir solo las faltantes, sin imagen
+    if missing.any() and ctx and np.nansum(vec) > 0:
+        tier = "followup"
+        names = [ORDER[i] for i in np.flatnonzero(missing)]
+        try:
+            r = await run_followup(ctx, f"En tu evaluación anterior faltaron estas métricas: {json.dumps(names, ensure_ascii=False)}. "
+                                        "Devuelve SOLO {\"rubric\":{...}} con esas métricas, valores 0–10 (pasos 0.5).", _missing_schema(names))
+            vec = np.where(missing, rubric.vector(r.get("rubric") or r), vec)
+        except Exception:
+            pass
+        missing = np.isnan(vec)
+    # 2) rúbrica vacía/en cero (o seguimiento fallido): una sola llamada con imagen y schema estricto
+    if missing.any() or np.nansum(vec) == 0:
+        tier = "vision"
+        r = await run_prompt(STRICT_RUBRIC_PROMPT_ES, image_b64, STRICT_RUBRIC_SCHEMA, mime)
+        fresh = rubric.vector(r.get("rubric") or {})
+        # lo nuevo manda; lo anterior solo rellena huecos si tenía algo válido
+        vec = np.where(np.isnan(fresh), vec, fresh) if np.nansum(vec) > 0 else fresh
+        missing = np.isnan(vec)
+    if missing.any(): metrics.inc("gb_rubric_repairs_total", tier="zero_fill")
+    metrics.inc("gb_rubric_repairs_total", tier=tier)
+    return rubric.as_dict(vec)
+
+def _mode(pro):
+    return "pro" if (pro and pro.strip() not in ("0","","false","False")) else "standard"
+
+def _meta(raw):
+    try: m = json.loads(raw) if raw else {}
+    except ValueError: m = {}
+    return m if isinstance(m, dict) else {}
 
 @app.post("/api/evaluate")
-async def evaluate(category: str = Form(...), file: UploadFile = File(...), pro: Optional[str] = Form(default="0"), meta_json: Optional[str] = Form(default=None)):
+async def evaluate(request: Request, category: str = Form(...), file: List[UploadFile] = File(...), pro: Optional[str] = Form(default="0"), meta_json: Optional[str] = Form(default=None),
+                   sid: Optional[str] = Form(default=None), mesh_file: Optional[UploadFile] = File(default=None), stream_format: Optional[str] = Form(default=None),
+                   animal_id: Optional[str] = Form(default=None)):
     if not OPENAI_API_KEY: return {"error":"OPENAI_API_KEY no configurada"}
-    mode = "pro" if (pro and pro.strip() not in ("0","","false","False")) else "standard"
-    img_bytes = await file.read()
-    image_b64 = base64.b64encode(img_bytes).decode("utf-8")
+    if len(file) > MAX_VIEWS: return JSONResponse({"error":"demasiadas_vistas","max_views":MAX_VIEWS}, status_code=413)
+    category = category.strip().lower()
+    # varias fotos (campo file repetido): una sola evaluación multivista del mismo animal.
+    # Se leen por bloques (tamaño + sha256) y siguen como archivo hasta la normalización.
+    try: views = await uploads.spool_all(file)
+    except uploads.TooLarge as e: return JSONResponse({"error":"imagen_demasiado_grande","detail":str(e)}, status_code=413)
+    img = views[0] if len(views) == 1 else views
+    scan = None
+    if mesh_file is not None and scans.ALLOW_3D:
+        # la app iOS manda foto + malla en la misma petición: ambas se procesan en paralelo
+        try: mesh_path = await scans.spool_upload(mesh_file)
+        except scans.ScanTooLarge as e:
+            uploads.close_all(views)
+            return JSONResponse({"error":"scan_demasiado_grande","detail":str(e)}, status_code=413)
+        scan = asyncio.ensure_future(scans.process(mesh_path, mesh_file.filename or "scan.ply", {**_meta(meta_json), "category":category}))
+    if _wants_sse(request, stream_format):
+        # limpieza como tarea de fondo: Starlette la ejecuta aunque el cliente se vaya antes de que
+        # empiece a iterar el generador (entonces su finally no llegaría a correr)
+        return StreamingResponse(_evaluate_sse(img, category, _mode(pro), scan, sid, animal_id), media_type="text/event-stream",
+                                 headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"}, background=BackgroundTask(_release, views, scan))
+    try: result = await _attach_scan(await evaluate_bytes(img, category, _mode(pro)), scan, sid)
+    finally: uploads.close_all(views)
+    _record(result, animal_id, sid, file[0].filename)
+    return result
 
-    data = await run_prompt(EVALUATION_PROMPT_ES.strip(), image_b64, EVALUATION_SCHEMA)
-    rubric = await ensure_rubric(image_b64, data)
+def _wants_sse(request, stream_format):
+    return (stream_format or "").lower() == "sse" or "text/event-stream" in request.headers.get("accept","")
 
+async def _attach_scan(result, scan, sid):
+    lidar_metrics = await scan if scan is not None else (await scans.RESULTS.aget(sid) if sid else None)
+    if lidar_metrics is not None:
+        if scan is not None and sid: await scans.RESULTS.aput(sid, lidar_metrics)
+        result["lidar_metrics"] = lidar_metrics
+        weight = _weight(lidar_metrics, (result.get("breed") or {}).get("guess"), result.get("category"))
+        if weight is not None: result["weight"] = weight
+    if sid: result["sid"] = sid
+    return result
+
+def _weight(lidar_metrics, breed=None, category=None):
+    return CALIB.estimate(lidar_metrics, breed, category) if CALIB is not None and isinstance(lidar_metrics, dict) else None
+
+async def _evaluate_sse(img_bytes, category, mode, scan, sid, animal_id=None):
+    # event: start → secciones (rubric, decision, health, breed...) según llegan → result (mismo payload que sin stream)
+    try:
+        yield streaming.sse("start", {"category":category, "mode":mode})
+        async for event, data in evaluate_bytes_stream(img_bytes, category, mode):
+            if event == "result":
+                data = await _attach_scan(data, scan, sid)
+                _record(data, animal_id, sid)
+            yield streaming.sse(event, data)
+    except Exception as e:
+        metrics.inc("gb_errors_total", type=type(e).__name__, route="/api/evaluate")
+        yield streaming.sse("error", {"error":"server_error","detail":str(e)})
+
+async def _release(views, scan):
+    # async: corre en el event loop, que es donde se puede cancelar la tarea del escaneo
+    if scan is not None and not scan.done(): scan.cancel()
+    uploads.close_all(views)
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(category: str = Form(...), file: UploadFile = File(...), pro: Optional[str] = Form(default="0"), priority: Optional[int] = Form(default=0),
+                     webhook_url: Optional[str] = Form(default=None), sid: Optional[str] = Form(default=None)):
+    # Responde al instante; el resultado se consulta en GET /api/jobs/{id} o llega al webhook.
+    if not OPENAI_API_KEY: return JSONResponse({"error":"OPENAI_API_KEY no configurada"}, status_code=503)
+    try: up = await uploads.spool(file)
+    except uploads.TooLarge as e: return JSONResponse({"error":"imagen_demasiado_grande","detail":str(e)}, status_code=413)
+    try: job = await JOBS.submit(up.file, category.strip().lower(), _mode(pro), priority or 0, webhook_url or None, sid)
+    except jobs.QueueFull as e: return JSONResponse({"error":"cola_llena","detail":str(e)}, status_code=429)
+    except jobs.WebhookRejected as e: return JSONResponse({"error":"webhook_invalido","detail":str(e)}, status_code=400)
+    finally: up.close()
+    return {**job, "poll":f"/api/jobs/{job['id']}"}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await JOBS.get(job_id)
+    return job if job is not None else JSONResponse({"error":"trabajo_no_encontrado"}, status_code=404)
+
+async def _run_job(job, img_bytes):
+    result = await _attach_scan(await evaluate_bytes(img_bytes, job["category"], job["mode"]), None, job["sid"])
+    _record(result, sid=job["sid"], source="job:" + job["id"])
+    return result
+
+@app.post("/api/scans/upload")
+async def scans_upload(sid: str = Form(...), file: UploadFile = File(...), category: Optional[str] = Form(default=None),
+                       meta: Optional[str] = Form(default=None), token: Optional[str] = Form(default=None)):
+    if not scans.ALLOW_3D: return JSONResponse({"error":"uploads_3d_deshabilitados"}, status_code=403)
+    if scans.SCAN_TOKEN and token != scans.SCAN_TOKEN: return JSONResponse({"error":"token_invalido"}, status_code=403)
+    try: path = await scans.spool_upload(file)
+    except scans.ScanTooLarge as e: return JSONResponse({"error":"scan_demasiado_grande","detail":str(e)}, status_code=413)
+    m = _meta(meta)
+    if category: m["category"] = category.strip().lower()
+    lidar_metrics = await scans.process(path, file.filename or "scan.ply", m)
+    if "error" in lidar_metrics: return JSONResponse({"sid":sid, **lidar_metrics}, status_code=422)
+    await scans.RESULTS.aput(sid, lidar_metrics)
+    if STORE is not None: await asyncio.to_thread(STORE.attach_lidar, sid, lidar_metrics)
+    return {"ok":True, "sid":sid, "lidar_metrics":lidar_metrics, "weight":_weight(lidar_metrics, m.get("breed"), m.get("category"))}
+
+@app.post("/api/calibration/samples")
+async def calibration_sample(weight_kg: float = Form(...), breed: Optional[str] = Form(default=None), category: Optional[str] = Form(default=None),
+                             sid: Optional[str] = Form(default=None), eval_id: Optional[int] = Form(default=None),
+                             lidar_json: Optional[str] = Form(default=None), animal_id: Optional[str] = Form(default=None)):
+    # Pesada de báscula para un escaneo: métricas en lidar_json, o las de una evaluación guardada
+    # (eval_id, que aporta raza y categoría) o de un escaneo reciente (sid).
+    if CALIB is None: return JSONResponse({"error":"calibracion_deshabilitada"}, status_code=404)
+    lidar_metrics = _meta(lidar_json) or None
+    if lidar_metrics is None and eval_id is not None and STORE is not None:
+        item = await asyncio.to_thread(STORE.get, eval_id)
+        if item is None: return JSONResponse({"error":"evaluacion_no_encontrada"}, status_code=404)
+        lidar_metrics = item["lidar_metrics"]
+        breed, category = breed or item["breed_guess"], category or item["category"]
+        animal_id, sid = animal_id or item["animal_id"], sid or item["sid"]
+    if lidar_metrics is None and sid: lidar_metrics = await scans.RESULTS.aget(sid)
+    if not lidar_metrics: return JSONResponse({"error":"sin_metricas_lidar"}, status_code=400)
+    category = category.strip().lower() if category else None
+    try: sample_id, before = await asyncio.to_thread(CALIB.add, lidar_metrics, weight_kg, breed, category, animal_id, sid, eval_id)
+    except ValueError as e: return JSONResponse({"error":"muestra_invalida","detail":str(e)}, status_code=422)
+    return {"id":sample_id, "weight_kg":weight_kg, "estimate_before":before, "estimate":_weight(lidar_metrics, breed, category)}
+
+@app.get("/api/calibration")
+async def calibration_summary():
+    if CALIB is None: return JSONResponse({"error":"calibracion_deshabilitada"}, status_code=404)
+    return await asyncio.to_thread(CALIB.summary)
+
+def _view_list(img_bytes):
+    # una foto o lista de vistas; cada una en bytes o uploads.Upload (archivo ya contado y con sha256)
+    return img_bytes if isinstance(img_bytes, list) else [img_bytes]
+
+def _eval_key(img_bytes, category, mode):
+    # con una sola foto la clave no cambia respecto a la versión de una vista
+    views = _view_list(img_bytes)
+    digest = "+".join(v.digest if isinstance(v, uploads.Upload) else hashlib.sha256(v).hexdigest() for v in views)
+    parts = [digest, category, mode, MODEL, PROMPT_VERSION if len(views) == 1 else MULTIVIEW_PROMPT_VERSION, imaging.CONFIG_TAG]
+    # el modelo local solo entra en la clave si está configurado: sin él, las claves no cambian
+    return cache.cache_key(*parts, LOCAL.tag) if LOCAL is not None else cache.cache_key(*parts)
+
+async def evaluate_bytes(img_bytes, category, mode):
+    key = _eval_key(img_bytes, category, mode)
+    if RESULTS is not None:
+        with tracing.span("cache_lookup"): hit = await RESULTS.aget(key)
+        if hit is not None: return hit
+    return await EVAL_FLIGHTS.do(key, lambda: _evaluate_image(key, img_bytes, category, mode))
+
+async def evaluate_bytes_stream(img_bytes, category, mode):
+    # Igual que evaluate_bytes pero como generador de (evento, datos); sin single-flight:
+    # cada cliente necesita su propio stream.
+    key = _eval_key(img_bytes, category, mode)
+    hit = await RESULTS.aget(key) if RESULTS is not None else None
+    if hit is None:
+        try:
+            async for ev in _evaluate_image_stream(key, img_bytes, category, mode): yield ev
+            return
+        except llm_client.FALLBACK_ERRORS as e:
+            # endpoint sin streaming (o salida ilegible): evaluación normal y se envía todo de una vez
+            metrics.inc("gb_llm_fallback_total", reason="stream_" + type(e).__name__)
+            hit = await evaluate_bytes(img_bytes, category, mode)
+    for k in SECTIONS: yield k, hit[k]
+    yield "result", hit
+
+def _batch_items(files):
+    # (nombre, lector async) por imagen; los zip se expanden sin descomprimir todo a memoria.
+    # FastAPI cierra los UploadFile al volver del endpoint, antes de que termine el stream:
+    # nos quedamos con el archivo temporal subyacente y lo cerramos al final del lote.
+    items, owned = [], []
+    for f in files:
+        name = f.filename or ""
+        fh, f.file = f.file, io.BytesIO()
+        owned.append(fh)
+        if name.lower().endswith(".zip") or f.content_type in ("application/zip","application/x-zip-compressed"):
+            zf = zipfile.ZipFile(fh); lock = asyncio.Lock()
+            for info in zf.infolist():
+                base = info.filename.rsplit("/",1)[-1]
+                if info.is_dir() or base.startswith(".") or not base.lower().endswith(IMAGE_EXTS): continue
+                async def read(zf=zf, info=info, lock=lock):
+                    async with lock: return await asyncio.to_thread(_zip_read, zf, info)
+                items.append((info.filename, read))
+        else:
+            async def read(fh=fh, name=name): return await asyncio.to_thread(uploads.read_capped, fh, uploads.IMAGE_MAX_BYTES, name)
+            items.append((name, read))
+    return items, owned
+
+def _zip_read(zf, info):
+    with zf.open(info) as f: return uploads.read_capped(f, uploads.IMAGE_MAX_BYTES, info.filename)
+
+def lot_summary(results, errors=0):
+    scores = np.array([float((r.get("decision") or {}).get("global_score") or 0.0) for r in results])
+    rub = rubric.matrix([r.get("rubric") for r in results])
+    levels = Counter((r.get("decision") or {}).get("decision_level") or "CONSIDERAR_BAJO" for r in results)
+    flags = Counter(f for r in results for f in set((r.get("health") or {}).get("flags") or []))
+    breeds = Counter((r.get("breed") or {}).get("guess") or "Indeterminado" for r in results)
+    n = len(results)
+    return {
+        "count": n, "errors": errors,
+        "global_score_mean": round(float(scores.mean()),2) if n else None,
+        "global_score_min": float(scores.min()) if n else None, "global_score_max": float(scores.max()) if n else None,
+        "rubric_mean": rubric.as_dict(np.round(np.nanmean(rub, axis=0), 2)) if n and not np.isnan(rub).all() else None,
+        "decision_levels": dict(levels), "health_flags": dict(flags), "breeds": dict(breeds),
+    }
+
+@app.post("/api/evaluate/batch")
+async def evaluate_batch(request: Request, category: str = Form(...), files: List[UploadFile] = File(...), pro: Optional[str] = Form(default="0"), stream_format: Optional[str] = Form(default=None)):
+    if not OPENAI_API_KEY: return {"error":"OPENAI_API_KEY no configurada"}
+    category, mode = category.strip().lower(), _mode(pro)
+    try:
+        items, owned = _batch_items(files)
+    except zipfile.BadZipFile:
+        return JSONResponse({"error":"zip_invalido"}, status_code=400)
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        for fh in owned: fh.close()
+        if not items: return JSONResponse({"error":"sin_imagenes"}, status_code=400)
+        return JSONResponse({"error":"lote_demasiado_grande","max_items":BATCH_MAX_ITEMS}, status_code=413)
+    sse = _wants_sse(request, stream_format)
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(i, name, read):
+        async with sem:
+            try:
+                result = await evaluate_bytes(await read(), category, mode)
+                _record(result, source=name)
+                return {"type":"item","index":i,"filename":name,"result":result}
+            except Exception as e:
+                metrics.inc("gb_errors_total", type=type(e).__name__, route="/api/evaluate/batch")
+                return {"type":"error","index":i,"filename":name,"error":type(e).__name__,"detail":str(e)}
+
+    def frame(obj):
+        data = json.dumps(obj, ensure_ascii=False)
+        return f"event: {obj['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    async def gen():
+        tasks = [asyncio.create_task(one(i, n, r)) for i, (n, r) in enumerate(items)]
+        ok, errors = [], 0
+        try:
+            yield frame({"type":"start","count":len(items),"category":category,"mode":mode})
+            for fut in asyncio.as_completed(tasks):
+                msg = await fut
+                if msg["type"] == "item": ok.append(msg["result"])
+                else: errors += 1
+                yield frame(msg)
+            yield frame({"type":"summary","category":category,"mode":mode,**lot_summary(ok, errors)})
+        finally:
+            for t in tasks: t.cancel()
+
+    def close_owned():
+        for fh in owned: fh.close()
+
+    # como en /api/evaluate con SSE: los archivos se cierran aunque el generador no llegue a empezar
+    return StreamingResponse(gen(), media_type="text/event-stream" if sse else "application/x-ndjson",
+                             headers={"Cache-Control":"no-cache","X-Accel-Buffering":"no"}, background=BackgroundTask(close_owned))
+
+async def _prepare_images(img_bytes):
+    # vistas en paralelo en el pool de imagen; imaging.prepare reutiliza las que ya se reescalaron.
+    # Las subidas se leen del temporal: en memoria solo queda la imagen normalizada y su base64.
+    loop = asyncio.get_running_loop()
+    with tracing.span("image_normalize"):
+        prepared = await asyncio.gather(*(loop.run_in_executor(imaging.POOL, imaging.prepare, v.file, v.digest) if isinstance(v, uploads.Upload)
+                                          else loop.run_in_executor(imaging.POOL, imaging.prepare, v) for v in _view_list(img_bytes)))
+    for v in _view_list(img_bytes): tracing.hold(v.resident() if isinstance(v, uploads.Upload) else len(v))
+    for b64, _, _ in prepared: tracing.hold(len(b64))
+    return [(b64, mime) for b64, mime, _ in prepared], [info for _, _, info in prepared]
+
+def _eval_prompt(n):
+    return (MULTIVIEW_PROMPT_ES.strip(), MULTIVIEW_SCHEMA) if n > 1 else (EVALUATION_PROMPT_ES.strip(), EVALUATION_SCHEMA)
+
+def _merge_views(data, n):
+    # Varias vistas: cada métrica sale de las fotos que mejor la muestran (media ponderada por la
+    # confianza que el modelo da a cada vista); la rúbrica combinada solo cubre las que ninguna juzgó.
+    if n < 2: return {}
+    views = [v for v in data.get("views") or [] if isinstance(v, dict)][:n] if isinstance(data.get("views"), list) else []
+    if not views: return {"views":n, "rubric_confidence":None}
+    merged, conf = rubric.merge_views(views)
+    vec = np.where(np.isnan(merged), rubric.vector(data.get("rubric") or data.get("morphological_rubric") or {}), merged)
+    data["rubric"] = {k: float(x) for k, x in zip(ORDER, vec) if not np.isnan(x)}
+    return {"views":n, "rubric_confidence":{k: round(float(c),2) for k, c in zip(ORDER, conf)}}
+
+async def _local_estimate(img_bytes, mode):
+    if LOCAL is None or mode == "pro": return None
+    views = [v.file if isinstance(v, uploads.Upload) else v for v in _view_list(img_bytes)]
+    loop = asyncio.get_running_loop()
+    with tracing.span("local_model"):
+        try: est = await loop.run_in_executor(imaging.POOL, LOCAL.estimate, views)
+        except Exception as e:
+            # imagen ilegible o modelo roto: sigue el camino remoto
+            metrics.inc("gb_errors_total", type=type(e).__name__, route="local_model")
+            return None
+    metrics.inc("gb_local_total", result="accepted" if est["confident"] else "escalated")
+    return est
+
+def _local_info(est, fallback=None):
+    info = {k: est[k] for k in ("model","confidence","threshold","ms")}
+    if fallback: info["fallback"] = fallback
+    return info
+
+async def _local_result(key, est, category, mode, fallback=None):
+    # sin conexión (fallback) no se cachea: con red se querrá la evaluación completa
+    if fallback: metrics.inc("gb_local_total", result="offline")
+    data = {"decision": local_model.decision(est["rubric"], category)}
+    extra = {"engine":"local:" + est["model"], "local":_local_info(est, fallback), "rubric_confidence":est["rubric_confidence"]}
+    return await _build_result(key, data, rubric.as_dict(rubric.vector(est["rubric"])), category, mode, [None], extra, cache_result=not fallback)
+
+async def _evaluate_image(key, img_bytes, category, mode):
+    est = await _local_estimate(img_bytes, mode)
+    if est is not None and est["confident"]: return await _local_result(key, est, category, mode)
+    images, infos = await _prepare_images(img_bytes)
+    prompt, schema = _eval_prompt(len(images))
+    try: data, ctx = await run_prompt_ctx(prompt, images, schema)
+    except OFFLINE_ERRORS as e:
+        if est is None: raise
+        return await _local_result(key, est, category, mode, type(e).__name__)
+    extra = _merge_views(data, len(images))
+    if est is not None: extra["local"] = _local_info(est)
+    with tracing.span("ensure_rubric"): rub = await ensure_rubric(images, data, ctx=ctx)
+    return await _build_result(key, data, rub, category, mode, infos, extra)
+
+async def _evaluate_image_stream(key, img_bytes, category, mode):
+    est = await _local_estimate(img_bytes, mode)
+    local = await _local_result(key, est, category, mode) if est is not None and est["confident"] else None
+    if local is None:
+        images, infos = await _prepare_images(img_bytes)
+        (prompt, _), scanner, sent = _eval_prompt(len(images)), streaming.SectionScanner(), {}
+        try:
+            # LLM.stream retiene el hueco del limitador hasta el último fragmento; un 429 o un corte a
+            # mitad cuentan para el AIMD y el breaker. aclosing: si el cliente se va, el hueco se suelta ya
+            async with aclosing(_chat_stream(prompt, images)) as chunks:
+                with tracing.span("llm_stream"):
+                    async for chunk in chunks:
+                        _count_usage(chunk, "chat")
+                        if not chunk.choices: continue
+                        for k, v in scanner.feed(chunk.choices[0].delta.content or ""):
+                            if k not in SECTIONS: continue
+                            # la rúbrica parcial sale ya canonizada; si luego se repara (o se combinan vistas) se reenvía
+                            sent[k] = canonize(v) if k == "rubric" else v
+                            yield k, sent[k]
+        except OFFLINE_ERRORS as e:
+            # sin ninguna sección enviada aún responde el modelo local; a mitad de respuesta, no
+            if est is None or sent: raise
+            local = await _local_result(key, est, category, mode, type(e).__name__)
+    if local is not None:
+        # estimación local: todas las secciones de una vez
+        for k in SECTIONS: yield k, local[k]
+        yield "result", local
+        return
+    data = _parse_json(scanner.buf)
+    if not isinstance(data, dict) or not data: raise ValueError("respuesta en streaming sin JSON")
+    ctx = {"api":"chat","transcript":_transcript(prompt, scanner.buf)}
+    extra = _merge_views(data, len(images))
+    if est is not None: extra["local"] = _local_info(est)
+    with tracing.span("ensure_rubric"): rub = await ensure_rubric(images, data, ctx=ctx)
+    if rub != sent.get("rubric"): yield "rubric", rub
+    yield "result", await _build_result(key, data, rub, category, mode, infos, extra)
+
+async def _build_result(key, data, rub, category, mode, infos, extra=None, cache_result=True):
     decision = data.get("decision") or {}
     if not decision.get("global_score"):
-        decision["global_score"] = round(statistics.mean(list(rubric.values())),1) if rubric else 0.0
+        decision["global_score"] = round(float(np.mean(list(rub.values()))),1) if rub else 0.0
     decision.setdefault("decision_level","CONSIDERAR_BAJO")
     decision.setdefault("decision_text","")
     decision.setdefault("rationale","")
 
     health = data.get("health") or {"flags":[], "notes":""}
     breed  = data.get("breed") or {"guess":"Indeterminado","confidence":0.0}
-    return {
-        "engine": MODEL, "mode":mode, "category":category.strip().lower(),
-        "rubric":rubric, "rubric_notes": data.get("rubric_notes") or {},
-        "decision":decision, "health":health, "breed":breed, "lidar_metrics":None
+    result = {
+        "engine": MODEL, "mode":mode, "category":category,
+        "rubric":rub, "rubric_notes": data.get("rubric_notes") or {},
+        "decision":decision, "health":health, "breed":breed, "lidar_metrics":None,
+        "image":infos[0] if len(infos) == 1 else infos, **(extra or {})
     }
+    if RESULTS is not None and cache_result: await RESULTS.aput(key, result)
+    return result
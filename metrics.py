@@ -0,0 +1,67 @@
+# Contadores e histogramas en proceso con exposición en formato texto de Prometheus.
+import bisect, threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_hists = {}
+_help = {}
+
+# segundos: de lecturas de caché (ms) a llamadas al modelo / escaneos (decenas de s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+def describe(name, text):
+    _help[name] = text
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, value=1.0, **labels):
+    k = _key(name, labels)
+    with _lock: _counters[k] += value
+
+def value(name, **labels):
+    return _counters.get(_key(name, labels), 0.0)
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    k = _key(name, labels)
+    with _lock:
+        h = _hists.get(k)
+        if h is None: h = _hists[k] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        i = bisect.bisect_left(h["buckets"], value)
+        if i < len(h["counts"]): h["counts"][i] += 1
+        h["sum"] += value; h["count"] += 1
+
+def histogram(name, **labels):
+    h = _hists.get(_key(name, labels))
+    return {"count": h["count"], "sum": h["sum"]} if h else {"count": 0, "sum": 0.0}
+
+def _fmt_labels(labels):
+    if not labels: return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+def _header(lines, seen, name, kind):
+    if name in seen: return
+    seen.add(name)
+    if name in _help: lines.append(f"# HELP {name} {_help[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+def render():
+    with _lock:
+        items = sorted(_counters.items())
+        hists = sorted((k, {**h, "counts": list(h["counts"])}) for k, h in _hists.items())
+    lines, seen = [], set()
+    for (name, labels), v in items:
+        _header(lines, seen, name, "counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {v:g}")
+    for (name, labels), h in hists:
+        _header(lines, seen, name, "histogram")
+        acc = 0
+        for le, c in zip(h["buckets"], h["counts"]):
+            acc += c
+            lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', f'{le:g}'),))} {acc}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {h['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {h['sum']:.6g}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
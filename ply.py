@@ -0,0 +1,82 @@
+# Lector PLY mínimo para nubes de puntos: lee sólo el bloque de vértices directamente a NumPy
+# (memmap para binario, loadtxt en C para ASCII) sin construir objetos de malla.
+import io, os
+import numpy as np
+
+_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+class PLYError(ValueError):
+    pass
+
+def _parse_header(f):
+    if f.readline().strip() != b"ply": raise PLYError("no es un archivo PLY")
+    fmt, elements = None, []
+    while True:
+        line = f.readline()
+        if not line: raise PLYError("cabecera PLY incompleta")
+        parts = line.decode("ascii", "replace").split()
+        if not parts or parts[0] in ("comment", "obj_info"): continue
+        if parts[0] == "format": fmt = parts[1]
+        elif parts[0] == "element":
+            if len(parts) < 3 or not parts[2].isdigit(): raise PLYError(f"elemento mal formado: {' '.join(parts)}")
+            elements.append({"name": parts[1], "count": int(parts[2]), "props": []})
+        elif parts[0] == "property":
+            if not elements: raise PLYError("propiedad fuera de elemento")
+            if parts[1] == "list": elements[-1]["props"].append(("list", parts[-1]))
+            elif parts[1] in _TYPES and len(parts) > 2: elements[-1]["props"].append((_TYPES[parts[1]], parts[2]))
+            else: raise PLYError(f"tipo de propiedad no soportado: {' '.join(parts[1:])}")
+        elif parts[0] == "end_header":
+            return fmt, elements, f.tell()
+
+def read_header(src):
+    with _open(src) as f:
+        return _parse_header(f)
+
+def _open(src):
+    if isinstance(src, (bytes, bytearray, memoryview)): return io.BytesIO(src)
+    return open(src, "rb")
+
+def read_ply_vertices(src):
+    # Devuelve (V (N,3) float64, n_caras); src es una ruta o bytes.
+    fmt, elements, offset = read_header(src)
+    names = [e["name"] for e in elements]
+    if "vertex" not in names: raise PLYError("PLY sin elemento vertex")
+    vi = names.index("vertex"); vert = elements[vi]
+    if any(t == "list" for t, _ in vert["props"]): raise PLYError("vertex con propiedades lista")
+    pnames = [n for _, n in vert["props"]]
+    if not all(a in pnames for a in ("x", "y", "z")): raise PLYError("vertex sin x/y/z")
+    n = vert["count"]
+    faces = sum(e["count"] for e in elements if e["name"] == "face")
+    if fmt == "ascii":
+        with _open(src) as f:
+            f.seek(offset)
+            # elementos previos a vertex (raro): una línea por elemento
+            for e in elements[:vi]:
+                for _ in range(e["count"]): f.readline()
+            cols = tuple(pnames.index(a) for a in ("x", "y", "z"))
+            try: V = np.loadtxt(f, dtype=np.float64, usecols=cols, max_rows=n, ndmin=2) if n else np.zeros((0, 3))
+            except ValueError as e: raise PLYError(f"vértice ASCII inválido: {e}") from None
+        if V.shape[0] != n: raise PLYError("bloque de vértices truncado")
+        return V, faces
+    if fmt not in ("binary_little_endian", "binary_big_endian"): raise PLYError(f"formato PLY no soportado: {fmt}")
+    endian = "<" if fmt == "binary_little_endian" else ">"
+    for e in elements[:vi]:
+        if any(t == "list" for t, _ in e["props"]): raise PLYError("elemento de tamaño variable antes de vertex")
+        offset += e["count"] * np.dtype([(nm, endian + t) for t, nm in e["props"]]).itemsize
+    dt = np.dtype([(nm, endian + t) for t, nm in vert["props"]])
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        if len(src) < offset + n * dt.itemsize: raise PLYError("bloque de vértices truncado")
+        rec = np.frombuffer(src, dtype=dt, count=n, offset=offset)
+    else:
+        if os.path.getsize(src) < offset + n * dt.itemsize: raise PLYError("bloque de vértices truncado")
+        rec = np.memmap(src, dtype=dt, mode="r", offset=offset, shape=(n,)) if n else np.zeros(0, dt)
+    # única copia en memoria: (N,3) float64 construido columna a columna desde el buffer/memmap
+    V = np.empty((n, 3), dtype=np.float64)
+    for i, a in enumerate(("x", "y", "z")): V[:, i] = rec[a]
+    del rec
+    return V, faces
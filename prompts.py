@@ -1,4 +1,8 @@
 # prompts.py
+import hashlib, json
+
+import rubric
+
 JSON_GUARD = "IMPORTANTE: responde SOLO en json (application/json) sin texto adicional."
 EVALUATION_PROMPT_ES = """
 Eres un evaluador técnico de ganado. Analiza UNA imagen del animal.
@@ -36,27 +40,7 @@ EVALUATION_SCHEMA = {
         "engine":{"type":"string"},
         "mode":{"type":"string"},
         "category":{"type":"string"},
-        "rubric":{
-            "type":"object","additionalProperties":False,
-            "properties":{
-                "Condición corporal (BCS)":{"type":"number"},
-                "Conformación general":{"type":"number"},
-                "Línea dorsal":{"type":"number"},
-                "Angulación costillar":{"type":"number"},
-                "Profundidad de pecho":{"type":"number"},
-                "Aplomos (patas)":{"type":"number"},
-                "Lomo":{"type":"number"},
-                "Grupo / muscling posterior":{"type":"number"},
-                "Balance anterior–posterior":{"type":"number"},
-                "Ancho torácico":{"type":"number"},
-                "Inserción de cola":{"type":"number"}
-            },
-            "required":[
-                "Condición corporal (BCS)","Conformación general","Línea dorsal","Angulación costillar",
-                "Profundidad de pecho","Aplomos (patas)","Lomo","Grupo / muscling posterior",
-                "Balance anterior–posterior","Ancho torácico","Inserción de cola"
-            ]
-        },
+        "rubric":rubric.schema(),
         "rubric_notes":{"type":"object"},
         "decision":{
             "type":"object","additionalProperties":False,
@@ -90,28 +74,31 @@ EVALUATION_SCHEMA = {
 }
 STRICT_RUBRIC_SCHEMA = {
     "type":"object","additionalProperties":False,
-    "properties":{
-        "rubric":{
-            "type":"object","additionalProperties":False,
-            "properties":{
-                "Condición corporal (BCS)":{"type":"number"},
-                "Conformación general":{"type":"number"},
-                "Línea dorsal":{"type":"number"},
-                "Angulación costillar":{"type":"number"},
-                "Profundidad de pecho":{"type":"number"},
-                "Aplomos (patas)":{"type":"number"},
-                "Lomo":{"type":"number"},
-                "Grupo / muscling posterior":{"type":"number"},
-                "Balance anterior–posterior":{"type":"number"},
-                "Ancho torácico":{"type":"number"},
-                "Inserción de cola":{"type":"number"}
-            },
-            "required":[
-                "Condición corporal (BCS)","Conformación general","Línea dorsal","Angulación costillar",
-                "Profundidad de pecho","Aplomos (patas)","Lomo","Grupo / muscling posterior",
-                "Balance anterior–posterior","Ancho torácico","Inserción de cola"
-            ]
-        }
-    },
+    "properties":{"rubric":rubric.schema()},
     "required":["rubric"]
 }
+
+# Varias fotos del mismo animal en una sola llamada: rúbrica por vista con confianza por métrica.
+MULTIVIEW_PROMPT_ES = EVALUATION_PROMPT_ES.replace(
+    "Analiza UNA imagen del animal.",
+    "Analiza VARIAS fotos del MISMO animal tomadas desde distintos ángulos (Vista 1..N, en el orden recibido).",
+).rstrip() + """
+6) "views": una entrada por foto, en el mismo orden, con "rubric" (las 11 métricas juzgadas SOLO con esa foto)
+y "confidence" (0–1 por métrica: cuánto permite juzgarla ese ángulo; 0 si no se ve). Ej.: los aplomos se juzgan
+mejor de frente/atrás, la inserción de cola desde atrás. La "rubric" principal es tu valoración combinada.
+"""
+MULTIVIEW_SCHEMA = {
+    **EVALUATION_SCHEMA,
+    "properties": {**EVALUATION_SCHEMA["properties"], "views": {"type":"array","items":{
+        "type":"object","additionalProperties":False,
+        "properties":{"rubric":rubric.schema(),"confidence":rubric.schema()},"required":["rubric","confidence"]}}},
+    "required": EVALUATION_SCHEMA["required"] + ["views"],
+}
+
+# Cambia automáticamente al editar prompts/schemas (invalida la caché de resultados).
+PROMPT_VERSION = hashlib.sha256(json.dumps(
+    [JSON_GUARD, EVALUATION_PROMPT_ES, RUBRIC_ONLY_PROMPT_ES, STRICT_RUBRIC_PROMPT_ES, EVALUATION_SCHEMA, STRICT_RUBRIC_SCHEMA],
+    ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+# Evaluaciones multivista: versión aparte, editar su prompt no invalida las de una sola foto.
+MULTIVIEW_PROMPT_VERSION = hashlib.sha256(json.dumps(
+    [PROMPT_VERSION, MULTIVIEW_PROMPT_ES, MULTIVIEW_SCHEMA], ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:12]
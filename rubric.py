@@ -0,0 +1,135 @@
+# Rúbrica morfológica: nombres canónicos, alias, normalización memoizada y vectores en orden fijo.
+# Todo lo que depende de los 11 nombres (schemas incluidos) se construye aquí una sola vez.
+import difflib, json, re, unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+ORDER = ["Condición corporal (BCS)","Conformación general","Línea dorsal","Angulación costillar","Profundidad de pecho","Aplomos (patas)","Lomo","Grupo / muscling posterior","Balance anterior–posterior","Ancho torácico","Inserción de cola"]
+INDEX = {k: i for i, k in enumerate(ORDER)}
+N = len(ORDER)
+
+_RE_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_RE_JSON_OBJ = re.compile(r"\{.*\}", re.S)
+_RE_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+@lru_cache(maxsize=4096)
+def norm(s):
+    # separadores unicode (p.ej. "–") pasan a espacio antes de quitar acentos
+    s = "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c)).lower()
+    return _RE_NON_ALNUM.sub(" ", s).strip()
+
+# alias normalizados -> nombre canónico; variantes que el modelo devuelve a veces (sin paréntesis, en inglés...)
+_ALIASES = {
+    "Condición corporal (BCS)": ["condicion corporal", "bcs", "body condition score", "body condition"],
+    "Conformación general": ["conformacion", "general conformation", "conformation"],
+    "Línea dorsal": ["linea superior", "topline", "top line", "dorsal line"],
+    "Angulación costillar": ["angulacion de costillas", "angulacion costal", "rib angulation", "costillar"],
+    "Profundidad de pecho": ["profundidad del pecho", "profundidad pecho", "chest depth", "body depth"],
+    "Aplomos (patas)": ["aplomos", "patas", "aplomos de patas", "feet and legs", "legs"],
+    "Lomo": ["loin"],
+    "Grupo / muscling posterior": ["grupa muscling posterior", "grupa", "muscling posterior", "grupo musculatura posterior", "rump", "hindquarter muscling"],
+    "Balance anterior–posterior": ["balance", "balance anteroposterior", "front rear balance"],
+    "Ancho torácico": ["ancho de pecho", "ancho toraxico", "chest width", "thoracic width"],
+    "Inserción de cola": ["insercion cola", "insercion de la cola", "tail insertion", "tail set"],
+}
+ALIASES = {norm(k): k for k in ORDER}
+for _canon, _names in _ALIASES.items():
+    for _n in _names: ALIASES.setdefault(norm(_n), _canon)
+_ALIAS_KEYS = list(ALIASES)
+
+def _edit_distance(a, b, limit):
+    # Levenshtein con corte: devuelve limit+1 en cuanto se pasa del límite
+    if abs(len(a) - len(b)) > limit: return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit: return limit + 1
+        prev = cur
+    return prev[-1]
+
+FUZZY_MIN_LEN = 4  # "abs", "leg"...: demasiado cortos para adivinar a qué métrica se refieren
+
+@lru_cache(maxsize=4096)
+def canon_key(k, fuzzy=True):
+    n = norm(k)
+    key = ALIASES.get(n)
+    if key or not fuzzy or len(n) < FUZZY_MIN_LEN: return key
+    m = difflib.get_close_matches(n, _ALIAS_KEYS, n=1, cutoff=0.8)
+    if m: return ALIASES[m[0]]
+    # nombres cortos ("lomo" -> "loma"): ratio bajo pero a pocas ediciones; como mucho una cada 4
+    # caracteres, y solo si el alias más cercano no empata con otro de una métrica distinta
+    limit = min(2, len(n) // 4)
+    dist = {a: _edit_distance(n, a, limit) for a in _ALIAS_KEYS}
+    best = min(dist.values())
+    hits = {ALIASES[a] for a, d in dist.items() if d == best}
+    return hits.pop() if best <= limit and len(hits) == 1 else None
+
+def round05(x): return round(float(x)*2)/2.0
+
+def canonize(rub, fuzzy=True):
+    out = {}
+    if not isinstance(rub, dict): return out
+    for k, v in rub.items():
+        key = canon_key(k, fuzzy) if isinstance(k, str) else None
+        if not key or key in out: continue
+        try: out[key] = round05(v)
+        except (TypeError, ValueError): out[key] = 0.0
+    return out
+
+def vector(rub, fuzzy=True):
+    # Rúbrica -> array float64 de N en orden ORDER; NaN donde falta la métrica.
+    v = np.full(N, np.nan)
+    for k, x in canonize(rub, fuzzy).items(): v[INDEX[k]] = x
+    return v
+
+def as_dict(v):
+    return {k: float(x) for k, x in zip(ORDER, np.nan_to_num(v, nan=0.0))}
+
+def matrix(rubrics):
+    # Lista de rúbricas ya canónicas (dicts de la respuesta) -> matriz (n, N); NaN donde falta.
+    m = np.full((len(rubrics), N), np.nan)
+    for i, r in enumerate(rubrics):
+        for k, x in (r or {}).items():
+            j = INDEX.get(k)
+            if j is not None:
+                try: m[i, j] = float(x)
+                except (TypeError, ValueError): pass
+    return m
+
+def merge_views(views):
+    # Vistas [{"rubric":{...}, "confidence":{...}}] -> (vector, confianza) por métrica:
+    # media ponderada por la confianza de cada vista; NaN donde ninguna vista la juzgó.
+    S = np.full((len(views), N), np.nan)
+    C = np.full((len(views), N), np.nan)
+    for i, v in enumerate(views):
+        if not isinstance(v, dict): continue
+        S[i] = vector(v.get("rubric"))
+        for k, c in (v.get("confidence") or {}).items():
+            key = canon_key(k) if isinstance(k, str) else None
+            try:
+                if key: C[i, INDEX[key]] = float(c)
+            except (TypeError, ValueError): pass
+    C = np.clip(np.where(np.isnan(C), 0.5, C), 0.0, 1.0)  # sin confianza declarada: neutra
+    C[np.isnan(S)] = 0.0
+    w = C.sum(axis=0)
+    merged = np.divide((np.nan_to_num(S) * C).sum(axis=0), w, out=np.full(N, np.nan), where=w > 0)
+    merged = np.where(np.isnan(merged), np.nan, np.round(merged * 2) / 2)
+    # probabilidad de que al menos una vista permita juzgar la métrica
+    return merged, 1.0 - np.prod(1.0 - C, axis=0)
+
+def schema(names=ORDER):
+    return {"type":"object","additionalProperties":False,
+            "properties":{k:{"type":"number"} for k in names},"required":list(names)}
+
+def extract_relaxed(txt):
+    if not txt: return {}
+    t = txt.strip().replace('```json','```').strip('`')
+    m = _RE_JSON_OBJ.search(t)
+    if not m: return {}
+    frag = m.group(0)
+    try: return json.loads(frag)
+    except ValueError:
+        return json.loads(_RE_TRAILING_COMMA.sub(r"\1", frag))
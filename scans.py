@@ -0,0 +1,94 @@
+# Procesamiento de escaneos 3D fuera del event loop (ProcessPoolExecutor) y métricas por sid.
+import asyncio, multiprocessing, os, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cache, lidar, metrics, tracing, uploads
+
+ALLOW_3D = os.getenv("GB_ALLOW_3D_UPLOADS", "0").strip() not in ("0", "", "false", "False")
+MAX_BYTES = int(float(os.getenv("GB_SCAN_MAX_MB", "100")) * 1024 * 1024)
+TIMEOUT_S = float(os.getenv("GB_SCAN_TIMEOUT_S", "60"))
+# margen sobre TIMEOUT_S antes de dar el hijo por colgado y matarlo
+GRACE_S = 5.0
+WORKERS = int(os.getenv("GB_SCAN_WORKERS", "1"))
+SCAN_TOKEN = os.getenv("GB_SCAN_TOKEN") or None
+TMP_DIR = os.getenv("GB_SCAN_TMPDIR") or None
+
+metrics.describe("gb_scan_jobs_total", "Trabajos de métricas LiDAR por resultado.")
+
+# sid -> lidar_metrics; sólo en memoria: el escaneo llega minutos antes o después de la foto
+# (con varios workers, en el backend compartido: escaneo y foto pueden caer en procesos distintos)
+RESULTS = cache.ResultCache(max_items=int(os.getenv("GB_SCAN_CACHE_SIZE", "1024")), ttl=float(os.getenv("GB_SCAN_TTL_S", "86400")),
+                            shared=cache.shared_tier(), namespace="scan")
+
+class ScanTooLarge(uploads.TooLarge):
+    pass
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: los hijos no heredan hilos/sockets del servidor
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+async def spool_upload(upload, max_bytes=MAX_BYTES, chunk=1 << 20):
+    # Copia la subida a un archivo temporal por bloques: el proceso hijo lo lee con memmap
+    # y el servidor nunca tiene el escaneo entero en memoria.
+    suffix = os.path.splitext(upload.filename or "")[1] or ".ply"
+    fd, path = tempfile.mkstemp(prefix="gb-scan-", suffix=suffix, dir=TMP_DIR)
+    size = 0
+    try:
+        with tracing.span("scan_upload"), os.fdopen(fd, "wb") as out:
+            while True:
+                part = await upload.read(chunk)
+                if not part: return path
+                size += len(part)
+                if size > max_bytes: raise ScanTooLarge(f"archivo mayor de {max_bytes} bytes")
+                await asyncio.to_thread(out.write, part)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+def _kill(pool):
+    # SIGALRM no interrumpe los bucles en C de numpy: el hijo puede seguir ocupado y todo escaneo
+    # posterior haría cola detrás. Se matan sus procesos (lo que esperaba en ese pool recibe
+    # BrokenProcessPool) y el próximo escaneo crea un pool nuevo.
+    global _pool
+    if _pool is pool: _pool = None
+    for p in list((pool._processes or {}).values()): p.terminate()
+    pool.shutdown(wait=False)
+
+async def process(path, filename, meta):
+    # Procesa y borra el archivo temporal creado por spool_upload.
+    global _pool
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        with tracing.span("lidar"):
+            # el hijo se corta con SIGALRM a TIMEOUT_S; si no responde en GRACE_S más, se mata el pool
+            res = await asyncio.wait_for(
+                loop.run_in_executor(pool, lidar.extract_lidar_metrics_job, path, filename, meta, TIMEOUT_S),
+                TIMEOUT_S + GRACE_S)
+    except asyncio.TimeoutError:
+        _kill(pool)
+        res = {"error": "tiempo de procesamiento del escaneo agotado"}
+    except BrokenProcessPool:
+        # solo si sigue siendo el actual: otra petición puede haber creado ya el siguiente
+        if _pool is pool: _pool = None
+        res = {"error": "el proceso de escaneo terminó inesperadamente"}
+    except Exception as e:
+        # PLY/malla inválidos (PLYError, errores de trimesh...) se relanzan aquí desde el hijo:
+        # error del escaneo, no 500, y la evaluación de la foto que lo acompaña sigue adelante
+        res = {"error": f"escaneo inválido: {e}"}
+    finally:
+        try: os.unlink(path)
+        except OSError: pass
+    metrics.inc("gb_scan_jobs_total", result="error" if "error" in res else "ok")
+    return res
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True); _pool = None
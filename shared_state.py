@@ -0,0 +1,224 @@
+# Estado compartido entre workers/réplicas: caché de resultados, single-flight entre procesos y
+# presupuesto de llamadas al modelo. Backends intercambiables con la misma semántica de clave/valor
+# con TTL: memoria (un proceso), SQLite (varios workers en una máquina; también sirve en pruebas
+# como sustituto de Redis) y Redis (varias réplicas).
+#   GB_SHARED_STATE=memory | sqlite[:ruta] | redis://host:6379/0
+# Los backends son síncronos: desde el event loop se usan con call() (SQLite/Redis en un hilo).
+import asyncio, os, socket, sqlite3, threading, time
+
+import metrics
+
+DATA_DIR = os.getenv("GB_DATA_DIR", "data")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+metrics.describe("gb_llm_budget_waits_total", "Esperas por el presupuesto compartido de llamadas al modelo (rpm o enfriamiento tras 429).")
+
+class MemoryBackend:
+    name, local = "memory", True
+
+    def __init__(self):
+        self._d = {}
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def _live(self, key, now):
+        item = self._d.get(key)
+        if item is not None and item[1] <= now:
+            del self._d[key]; item = None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._live(key, time.time())
+            return item[0] if item else None
+
+    def set(self, key, value, ttl, evictable=False):
+        with self._lock:
+            self._d[key] = (value, time.time() + ttl)
+            self._ops += 1
+            if self._ops % 1000 == 0:
+                now = time.time()
+                for k in [k for k, v in self._d.items() if v[1] <= now]: del self._d[k]
+
+    def add(self, key, value, ttl):
+        # solo si no existe (o caducó): base de los leases del single-flight
+        with self._lock:
+            if self._live(key, time.time()) is not None: return False
+            self._d[key] = (value, time.time() + ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock: self._d.pop(key, None)
+
+    def renew(self, key, value, ttl):
+        # alarga el lease solo si sigue siendo de quien lo pide
+        with self._lock:
+            item = self._live(key, time.time())
+            if item is None or item[0] != value: return False
+            self._d[key] = (value, time.time() + ttl)
+            return True
+
+    def release(self, key, value):
+        with self._lock:
+            item = self._live(key, time.time())
+            if item is not None and item[0] == value: del self._d[key]
+
+    def incr(self, key, ttl):
+        with self._lock:
+            now = time.time()
+            item = self._live(key, now)
+            n = int(item[0]) + 1 if item else 1
+            self._d[key] = (str(n), item[1] if item else now + ttl)
+            return n
+
+    def ping(self):
+        return True
+
+class SQLiteBackend:
+    # WAL + busy_timeout: varios procesos escriben a la vez sin "database is locked".
+    # Solo las entradas evictable (caché) cuentan para max_items: leases, contadores y enfriamientos
+    # no se descartan por capacidad, solo al caducar.
+    name, local = "sqlite", False
+
+    def __init__(self, path, max_items=50000):
+        self.path, self.max_items = path, max_items
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, evictable INTEGER NOT NULL DEFAULT 0)")
+        if "evictable" not in {r[1] for r in self._db.execute("PRAGMA table_info(kv)")}:
+            self._db.execute("ALTER TABLE kv ADD COLUMN evictable INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv(expires)")
+        self._lock = threading.Lock()
+        self._sets = 0
+
+    def _exec(self, sql, args=()):
+        with self._lock: return self._db.execute(sql, args).fetchall()
+
+    def get(self, key):
+        rows = self._exec("SELECT value FROM kv WHERE key=? AND expires>?", (key, time.time()))
+        return rows[0][0] if rows else None
+
+    def set(self, key, value, ttl, evictable=False):
+        now = time.time()
+        self._exec("INSERT OR REPLACE INTO kv (key, value, expires, evictable) VALUES (?,?,?,?)", (key, value, now + ttl, int(evictable)))
+        self._sets += 1
+        if self._sets % 200 == 0:
+            self._exec("DELETE FROM kv WHERE expires<=?", (now,))
+            self._exec("DELETE FROM kv WHERE key IN (SELECT key FROM kv WHERE evictable=1 ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self.max_items,))
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key=? AND expires<=?", (key, now))
+            return self._db.execute("INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?,?,?)", (key, value, now + ttl)).rowcount == 1
+
+    def delete(self, key):
+        self._exec("DELETE FROM kv WHERE key=?", (key,))
+
+    def renew(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            return self._db.execute("UPDATE kv SET expires=? WHERE key=? AND value=? AND expires>?", (now + ttl, key, value, now)).rowcount == 1
+
+    def release(self, key, value):
+        self._exec("DELETE FROM kv WHERE key=? AND value=?", (key, value))
+
+    def incr(self, key, ttl):
+        # un solo UPSERT atómico; un contador caducado vuelve a empezar en 1
+        now = time.time()
+        return int(self._exec("""INSERT INTO kv (key, value, expires) VALUES (?, '1', ?)
+            ON CONFLICT(key) DO UPDATE SET value = CASE WHEN expires<=? THEN 1 ELSE CAST(value AS INTEGER) + 1 END,
+                                           expires = CASE WHEN expires<=? THEN excluded.expires ELSE expires END
+            RETURNING value""", (key, now + ttl, now, now))[0][0])
+
+    def ping(self):
+        return self._exec("SELECT 1")[0][0] == 1
+
+class RedisBackend:
+    # Cliente síncrono como el nivel SQLite de la caché: operaciones de una ida y vuelta.
+    # Redis expulsa por instancia (maxmemory-policy), no por clave: cualquier política distinta de
+    # noeviction puede tirar leases y enfriamientos. Las entradas de caché caducan solas (TTL); si la
+    # memoria aprieta, la caché compartida va mejor en SQLite aparte (GB_CACHE_DB).
+    name, local = "redis", False
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url):
+        import redis  # opcional: solo hace falta con GB_SHARED_STATE=redis://...
+        self._r = redis.Redis.from_url(url, decode_responses=True, socket_timeout=2)
+
+    def get(self, key):
+        return self._r.get(key)
+
+    def set(self, key, value, ttl, evictable=False):
+        self._r.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def add(self, key, value, ttl):
+        return bool(self._r.set(key, value, px=max(1, int(ttl * 1000)), nx=True))
+
+    def delete(self, key):
+        self._r.delete(key)
+
+    def renew(self, key, value, ttl):
+        return bool(self._r.eval(self._RENEW, 1, key, value, max(1, int(ttl * 1000))))
+
+    def release(self, key, value):
+        self._r.eval(self._RELEASE, 1, key, value)
+
+    def incr(self, key, ttl):
+        n = self._r.incr(key)
+        if n == 1: self._r.pexpire(key, max(1, int(ttl * 1000)))
+        return n
+
+    def ping(self):
+        return self._r.ping()
+
+class RateBudget:
+    # Presupuesto de llamadas al modelo común a todos los workers: ventana fija de 60 s con
+    # GB_LLM_RPM llamadas (0 = sin tope) y enfriamiento compartido cuando cualquiera recibe un 429.
+    def __init__(self, backend, rpm=0, key="llm"):
+        self.backend, self.rpm, self.key = backend, int(rpm), key
+
+    async def acquire(self):
+        waited = False
+        while True:
+            now = time.time()
+            until = float(await call(self.backend, "get", self.key + ":cooldown") or 0)
+            if until > now: delay = until - now
+            elif self.rpm <= 0 or await call(self.backend, "incr", f"{self.key}:rpm:{int(now // 60)}", 61) <= self.rpm: return
+            else: delay = 60 - now % 60
+            if not waited: metrics.inc("gb_llm_budget_waits_total"); waited = True
+            await asyncio.sleep(min(delay, 5.0))
+
+    async def cooldown(self, seconds):
+        # no acorta un enfriamiento más largo ya en curso
+        until = time.time() + seconds
+        if until > float(await call(self.backend, "get", self.key + ":cooldown") or 0):
+            await call(self.backend, "set", self.key + ":cooldown", repr(until), seconds)
+
+async def call(backend, method, *args, **kw):
+    # SQLite y Redis bloquean (disco, red): en un hilo para no parar el event loop; memoria, directo
+    fn = getattr(backend, method)
+    return fn(*args, **kw) if backend.local else await asyncio.to_thread(fn, *args, **kw)
+
+def from_env():
+    spec = (os.getenv("GB_SHARED_STATE") or "").strip()
+    if not spec:
+        # varios workers sin configurar nada: SQLite en el directorio de datos
+        spec = "sqlite" if int(os.getenv("GB_WORKERS", "1") or 1) > 1 else "memory"
+    if spec == "memory": return MemoryBackend()
+    if spec.startswith(("redis://", "rediss://", "unix://")): return RedisBackend(spec)
+    if spec == "sqlite" or spec.startswith("sqlite:"):
+        path = spec.partition(":")[2] or os.path.join(DATA_DIR, "shared.sqlite")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SQLiteBackend(path)
+    raise ValueError(f"GB_SHARED_STATE no reconocido: {spec}")
+
+_default = None
+
+def default():
+    # un backend por proceso, compartido por la caché, los flights y el presupuesto
+    global _default
+    if _default is None: _default = from_env()
+    return _default
@@ -0,0 +1,182 @@
+# Histórico de evaluaciones: SQLite (WAL) por defecto, Postgres con GB_STORE_DSN=postgresql://...
+# Las escrituras se agrupan en memoria y se insertan en bloque (executemany) cada FLUSH_S.
+import asyncio, json, os, sqlite3, threading, time
+from collections import Counter
+
+import numpy as np
+
+import metrics, rubric
+
+DATA_DIR = os.getenv("GB_DATA_DIR", "data")
+FLUSH_S = float(os.getenv("GB_STORE_FLUSH_S", "1"))
+FLUSH_ROWS = 200
+MAX_PENDING = 10000
+
+metrics.describe("gb_store_rows_total", "Evaluaciones guardadas en el histórico.")
+
+_COLS = ("created", "animal_id", "sid", "source", "category", "mode", "decision_level", "global_score", "breed_guess",
+         "engine", "rubric", "rubric_notes", "decision", "health", "breed", "lidar_metrics", "rubric_vec")
+# columnas devueltas por las consultas; rubric_vec es interna (float32 x 11 en orden rubric.ORDER, NaN = ausente)
+_OUT = _COLS[:-1]
+_JSON = ("rubric", "rubric_notes", "decision", "health", "breed", "lidar_metrics")
+
+def _ddl(pg):
+    pk = "id BIGSERIAL PRIMARY KEY" if pg else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    return [f"""CREATE TABLE IF NOT EXISTS evaluations ({pk}, created DOUBLE PRECISION NOT NULL, animal_id TEXT, sid TEXT,
+        source TEXT, category TEXT, mode TEXT, decision_level TEXT, global_score DOUBLE PRECISION, breed_guess TEXT, engine TEXT,
+        rubric TEXT, rubric_notes TEXT, decision TEXT, health TEXT, breed TEXT, lidar_metrics TEXT, rubric_vec {"BYTEA" if pg else "BLOB"})"""] + [
+        f"CREATE INDEX IF NOT EXISTS evaluations_{c} ON evaluations({c}, created)" for c in ("category", "decision_level", "animal_id", "sid")
+    ] + ["CREATE INDEX IF NOT EXISTS evaluations_created ON evaluations(created, id)"]
+
+class EvaluationStore:
+    def __init__(self, dsn):
+        self.pg = dsn.startswith(("postgres://", "postgresql://"))
+        if self.pg:
+            import psycopg  # opcional: solo hace falta con Postgres
+            self._db = psycopg.connect(dsn, autocommit=True)
+        else:
+            self._db = sqlite3.connect(dsn, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        self._pending = []
+        # lo crea run_flusher; record() lo activa al llegar a FLUSH_ROWS para no escribir en el event loop
+        self._wake = None
+        for sql in _ddl(self.pg): self._exec(sql)
+        # bases creadas antes de rubric_vec
+        if self.pg: self._exec("ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS rubric_vec BYTEA")
+        elif "rubric_vec" not in {r[1] for r in self._exec("PRAGMA table_info(evaluations)")}:
+            self._exec("ALTER TABLE evaluations ADD COLUMN rubric_vec BLOB")
+
+    def _sql(self, sql):
+        return sql.replace("?", "%s") if self.pg else sql
+
+    def _exec(self, sql, args=()):
+        with self._lock:
+            cur = self._db.execute(self._sql(sql), args)
+            return cur.fetchall() if cur.description else []
+
+    def record(self, result, animal_id=None, sid=None, source=None):
+        # No bloquea la petición: se guarda en el próximo flush del flusher (o al consultar).
+        d = result.get("decision") or {}
+        row = {"created": time.time(), "animal_id": animal_id, "sid": sid or result.get("sid"), "source": source,
+               "category": result.get("category"), "mode": result.get("mode"), "decision_level": d.get("decision_level"),
+               "global_score": d.get("global_score"), "breed_guess": (result.get("breed") or {}).get("guess"), "engine": result.get("engine")}
+        row.update({k: json.dumps(result.get(k), ensure_ascii=False) if result.get(k) is not None else None for k in _JSON})
+        row["rubric_vec"] = rubric.matrix([result.get("rubric")])[0].astype("<f4").tobytes()
+        with self._lock: self._pending.append(tuple(row[c] for c in _COLS))
+        if len(self._pending) >= FLUSH_ROWS:
+            if self._wake is not None: self._wake.set()
+            else: self.flush()  # sin flusher (scripts): en el momento
+
+    def add_many(self, rows):
+        with self._lock:
+            if not rows: return 0
+            sql = self._sql(f"INSERT INTO evaluations ({','.join(_COLS)}) VALUES ({','.join('?' * len(_COLS))})")
+            if self.pg:
+                with self._db.transaction(), self._db.cursor() as cur: cur.executemany(sql, rows)
+            else:
+                self._db.execute("BEGIN")
+                try: self._db.executemany(sql, rows)
+                except BaseException: self._db.execute("ROLLBACK"); raise
+                self._db.execute("COMMIT")
+        metrics.inc("gb_store_rows_total", len(rows))
+        return len(rows)
+
+    def flush(self):
+        with self._lock: rows, self._pending = self._pending, []
+        try: return self.add_many(rows)
+        except Exception:
+            # base de datos caída: se reintenta en el próximo flush sin crecer sin límite
+            with self._lock: self._pending = (rows + self._pending)[-MAX_PENDING:]
+            raise
+
+    async def run_flusher(self):
+        # Las escrituras van a un hilo: con Postgres o un SQLite ocupado no paran el event loop.
+        self._wake = asyncio.Event()
+        while True:
+            try: await asyncio.wait_for(self._wake.wait(), FLUSH_S)
+            except asyncio.TimeoutError: pass
+            self._wake.clear()
+            if not self._pending: continue
+            try: await asyncio.to_thread(self.flush)
+            except Exception as e: metrics.inc("gb_errors_total", type=type(e).__name__, route="store")
+
+    # Las consultas vacían antes lo pendiente y son síncronas: desde un handler async, con asyncio.to_thread.
+
+    def attach_lidar(self, sid, lidar_metrics):
+        # el escaneo puede llegar después de la foto: completa las evaluaciones de ese sid
+        self.flush()
+        self._exec("UPDATE evaluations SET lidar_metrics=? WHERE sid=? AND lidar_metrics IS NULL",
+                   (json.dumps(lidar_metrics, ensure_ascii=False), sid))
+
+    def _where(self, f):
+        conds, args = [], []
+        for c in ("category", "decision_level", "animal_id", "sid", "breed_guess"):
+            if f.get(c): conds.append(f"{c}=?"); args.append(f[c])
+        if f.get("since") is not None: conds.append("created>=?"); args.append(float(f["since"]))
+        if f.get("until") is not None: conds.append("created<?"); args.append(float(f["until"]))
+        return conds, args
+
+    def query(self, limit=50, cursor=None, **filters):
+        # Paginación por clave (created, id) descendente: estable aunque entren filas nuevas.
+        self.flush()
+        conds, args = self._where(filters)
+        if cursor:
+            c_created, c_id = cursor.split(":")
+            conds.append("(created<? OR (created=? AND id<?))"); args += [float(c_created), float(c_created), int(c_id)]
+        where = (" WHERE " + " AND ".join(conds)) if conds else ""
+        rows = self._exec(f"SELECT id,{','.join(_OUT)} FROM evaluations{where} ORDER BY created DESC, id DESC LIMIT ?", args + [int(limit) + 1])
+        items = [self._item(r) for r in rows[:limit]]
+        nxt = f"{items[-1]['created']!r}:{items[-1]['id']}" if len(rows) > limit else None
+        return {"items": items, "next_cursor": nxt}
+
+    def get(self, eval_id):
+        self.flush()
+        rows = self._exec(f"SELECT id,{','.join(_OUT)} FROM evaluations WHERE id=?", (int(eval_id),))
+        return self._item(rows[0]) if rows else None
+
+    def _item(self, row):
+        item = dict(zip(("id",) + _OUT, row))
+        for k in _JSON: item[k] = json.loads(item[k]) if item[k] else None
+        return item
+
+    def matrix(self, **filters):
+        # (filas, M): metadatos por animal y la matriz (n, 11) de la rúbrica leída de rubric_vec
+        # en bloque; solo las filas antiguas sin vector se reconstruyen desde el JSON.
+        self.flush()
+        conds, args = self._where(filters)
+        where = (" WHERE " + " AND ".join(conds)) if conds else ""
+        rows = self._exec(f"SELECT id, animal_id, sid, category, created, global_score, rubric_vec FROM evaluations{where} ORDER BY id", args)
+        width = 4 * rubric.N
+        blank = np.full(rubric.N, np.nan, dtype="<f4").tobytes()
+        old = [i for i, r in enumerate(rows) if r[6] is None or len(r[6]) != width]
+        M = np.frombuffer(b"".join(blank if r[6] is None or len(r[6]) != width else bytes(r[6]) for r in rows),
+                          dtype="<f4").reshape(len(rows), rubric.N).astype(np.float64)
+        for i in old:
+            js = self._exec("SELECT rubric FROM evaluations WHERE id=?", (rows[i][0],))[0][0]
+            M[i] = rubric.matrix([json.loads(js) if js else None])[0]
+        return [r[:6] for r in rows], M
+
+    def summary(self, **filters):
+        # Mismo formato que el resumen de lote (/api/evaluate/batch), calculado sobre el histórico.
+        self.flush()
+        conds, args = self._where(filters)
+        where = (" WHERE " + " AND ".join(conds)) if conds else ""
+        n, mean, lo, hi, animals = self._exec(f"SELECT COUNT(*), AVG(global_score), MIN(global_score), MAX(global_score), COUNT(DISTINCT animal_id) FROM evaluations{where}", args)[0]
+        levels = self._exec(f"SELECT COALESCE(decision_level,'CONSIDERAR_BAJO'), COUNT(*) FROM evaluations{where} GROUP BY 1", args)
+        breeds = self._exec(f"SELECT COALESCE(breed_guess,'Indeterminado'), COUNT(*) FROM evaluations{where} GROUP BY 1", args)
+        flags = Counter()
+        for (health,) in self._exec(f"SELECT health FROM evaluations{where}", args):
+            if health: flags.update(set((json.loads(health) or {}).get("flags") or []))
+        return {"count": n, "animals": animals, "global_score_mean": round(mean, 2) if mean is not None else None,
+                "global_score_min": lo, "global_score_max": hi, "decision_levels": dict(levels),
+                "health_flags": dict(flags), "breeds": dict(breeds)}
+
+def from_env():
+    if os.getenv("GB_STORE_ENABLED", "1").strip() in ("0", "", "false", "False"): return None
+    dsn = os.getenv("GB_STORE_DSN")
+    if not dsn:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        dsn = os.path.join(DATA_DIR, "evaluations.sqlite")
+    return EvaluationStore(dsn)
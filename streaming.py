@@ -0,0 +1,54 @@
+# Lectura incremental del JSON que el modelo va emitiendo: detecta cuándo se cierra cada clave
+# de primer nivel ("rubric", "decision", "health", ...) para poder enviarla al cliente en el acto.
+import json
+
+class SectionScanner:
+    def __init__(self):
+        self.buf = ""
+        self._i = 0
+        self._depth = 0
+        self._in_str = self._esc = False
+        self._key_start = self._val_start = None
+        self._key = None
+        self._expect_key = False
+
+    def feed(self, text):
+        # Devuelve [(clave, valor)] de las secciones de primer nivel completadas con este fragmento.
+        self.buf += text
+        out, buf = [], self.buf
+        for i in range(self._i, len(buf)):
+            c = buf[i]
+            if self._in_str:
+                if self._esc: self._esc = False
+                elif c == "\\": self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._key_start is not None:
+                        self._key, self._key_start = json.loads(buf[self._key_start:i + 1]), None
+                continue
+            if c == '"':
+                self._in_str = True
+                if self._depth == 1 and self._expect_key: self._key_start = i
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1: self._expect_key = True
+            elif c in "}]":
+                if self._depth == 1: self._emit(out, buf[self._val_start:i] if self._val_start is not None else None)
+                self._depth -= 1
+                if self._depth == 1 and self._val_start is not None: self._emit(out, buf[self._val_start:i + 1])
+            elif self._depth == 1:
+                if c == ":" and self._key is not None: self._val_start, self._expect_key = i + 1, False
+                elif c == ",":
+                    if self._val_start is not None: self._emit(out, buf[self._val_start:i])
+                    self._expect_key = True
+        self._i = len(buf)
+        return out
+
+    def _emit(self, out, frag):
+        key, self._key, self._val_start, self._expect_key = self._key, None, None, True
+        if frag is None or key is None: return
+        try: out.append((key, json.loads(frag)))
+        except ValueError: pass
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
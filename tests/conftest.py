@@ -0,0 +1,9 @@
+# main se configura al importarse: entorno de prueba antes de cualquier import de la app
+import os, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GB_DATA_DIR", tempfile.mkdtemp(prefix="gb-test-"))
+os.environ.setdefault("GB_STORE_ENABLED", "0")
+os.environ.setdefault("GB_ASSETS", "0")
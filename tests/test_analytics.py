@@ -0,0 +1,23 @@
+import numpy as np
+
+import analytics, rubric
+
+def _analyze(scores):
+    M = np.repeat(np.asarray(scores, dtype=np.float64)[:, None], rubric.N, axis=1)
+    return analytics.analyze(M, np.ones(rubric.N), k=2)
+
+def test_percentile_ties_share_mid_rank():
+    a = _analyze([6.0, 6.0, 6.0, 6.0])
+    assert a["percentile"].tolist() == [50.0] * 4
+
+def test_percentile_ties_independent_of_order():
+    a = _analyze([4.0, 7.0, 7.0, 5.0, 7.0])
+    assert a["percentile"].tolist() == [0.0, 75.0, 75.0, 25.0, 75.0]
+    pct = a["percentile"]
+    assert all(pct[i] == 75.0 for i in a["top"])
+
+def test_percentile_missing_scores_rank_lowest():
+    M = np.full((3, rubric.N), np.nan)
+    M[1], M[2] = 5.0, 8.0
+    a = analytics.analyze(M, np.ones(rubric.N), k=1)
+    assert a["percentile"].tolist() == [0.0, 50.0, 100.0] and a["top"].tolist() == [2]
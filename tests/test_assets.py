@@ -0,0 +1,36 @@
+import gzip
+
+from starlette.requests import Request
+
+import assets
+
+def _req(**headers):
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+def test_minify_keeps_template_literals_verbatim():
+    js = ("  // comentario\n  const r = /`/.test(s), q = '`';\n"
+          "  el.innerHTML = `\n    <pre>\n    // no es comentario\n\n    ${a ? `<b>\n  x</b>` : ''}\n  `;  \n"
+          "    f();\n")
+    assert assets.minify_js(js) == (
+        "const r = /`/.test(s), q = '`';\n"
+        "el.innerHTML = `\n    <pre>\n    // no es comentario\n\n    ${a ? `<b>\n  x</b>` : ''}\n  `;\n"
+        "f();")
+
+def test_etag_304_and_encoding(tmp_path):
+    src = tmp_path / "index.html"
+    src.write_text("<html><style> a { color: red; } </style><script>\n  const t = `\n  //x`;\n</script></html>")
+    m = assets.build(str(src), str(tmp_path / "dist"))
+    a = assets.Assets(str(tmp_path / "dist"))
+    js = m["files"][1]
+    plain = a.response(_req(), js)
+    assert plain.body == b"const t = `\n  //x`;" and "content-encoding" not in plain.headers
+    gz = a.response(_req(accept_encoding="gzip, br;q=0"), js)
+    assert gz.headers["content-encoding"] == "gzip" and gzip.decompress(gz.body) == plain.body
+    assert gz.headers["etag"] != plain.headers["etag"] and gz.headers["vary"] == "Accept-Encoding"
+    hit = a.response(_req(accept_encoding="gzip", if_none_match=f'W/{gz.headers["etag"]}'), js)
+    assert hit.status_code == 304 and hit.body == b""
+    # el ETag de otra codificación no vale: se envía el cuerpo
+    assert a.response(_req(if_none_match=gz.headers["etag"]), js).status_code == 200
+    shell = a.shell(_req())
+    assert shell.headers["cache-control"] == "no-cache" and f"{assets.PREFIX}{js}".encode() in shell.body
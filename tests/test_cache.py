@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import cache
+
+def test_single_flight_coalesces_and_copies_for_every_caller():
+    sf, calls = cache.SingleFlight("t"), []
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"score": 7, "extra": {}}
+    async def caller(sid):
+        res = await sf.do("k", factory)
+        # como _attach_scan: solo la petición con escaneo añade sid y métricas
+        if sid: res["sid"], res["extra"]["lidar"] = sid, {"sid": sid}
+        await asyncio.sleep(0)
+        return res
+    async def go():
+        return await asyncio.gather(caller("a"), caller(None), caller("c"))
+    out = asyncio.run(go())
+    assert len(calls) == 1 and len(sf) == 0
+    assert [r.get("sid") for r in out] == ["a", None, "c"]
+    assert [r["extra"].get("lidar") for r in out] == [{"sid": "a"}, None, {"sid": "c"}]
+
+def test_result_cache_lru_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    c = cache.ResultCache(max_items=2, ttl=10)
+    c.put("a", {"v": 1}); c.put("b", {"v": 2})
+    assert c.get("a") == {"v": 1}  # "a" pasa a ser el más reciente
+    c.put("c", {"v": 3})
+    assert c.get("b") is None and c.get("a") == {"v": 1} and c.get("c") == {"v": 3}
+    got = c.get("a"); got["v"] = 99
+    assert c.get("a") == {"v": 1}
+    now[0] += 10
+    assert c.get("a") is None and c.stats()["memory_items"] == 1
+
+def test_result_cache_shared_tier_fills_memory(tmp_path):
+    shared = cache.shared_state.SQLiteBackend(str(tmp_path / "c.db"))
+    cache.ResultCache(shared=shared, namespace="t").put("k", {"v": 1})
+    other = cache.ResultCache(shared=shared, namespace="t")
+    assert other.get("k") == {"v": 1} and other.stats()["memory_items"] == 1
+    assert cache.ResultCache(shared=shared, namespace="u").get("k") is None
+
+def test_single_flight_across_workers_waits_for_the_leader(tmp_path):
+    path = str(tmp_path / "s.db")
+    def worker():
+        shared = cache.shared_state.SQLiteBackend(path)
+        results = cache.ResultCache(shared=shared)
+        return cache.SingleFlight("t", shared=shared, lookup=results.peek, poll_s=0.02), results
+    (a, ra), (b, _) = worker(), worker()
+    calls = []
+    def factory(results, fail=False):
+        async def run():
+            calls.append(fail)
+            await asyncio.sleep(0.1)
+            if fail: raise RuntimeError("x")
+            results.put("k", {"v": len(calls)})
+            return {"v": len(calls)}
+        return run
+    async def go():
+        first = asyncio.ensure_future(a.do("k", factory(ra)))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(first, b.do("k", factory(ra)))
+    assert asyncio.run(go()) == [{"v": 1}, {"v": 1}] and calls == [False]
+    # si el líder falla, libera el lease y el otro worker calcula
+    async def failover():
+        first = asyncio.ensure_future(a.do("j", factory(ra, fail=True)))
+        await asyncio.sleep(0.02)
+        second = await b.do("j", factory(ra))
+        with pytest.raises(RuntimeError): await first
+        return second
+    calls.clear()
+    assert asyncio.run(failover()) == {"v": 2} and calls == [True, False]
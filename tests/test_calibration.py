@@ -0,0 +1,46 @@
+import math
+
+import numpy as np
+import pytest
+
+import calibration
+
+def _metrics(g, L, H):
+    return {"heart_girth_m": g, "body_length_m": L, "withers_height_m": H}
+
+def _truth(g, L, H):
+    # peso real con otro exponente que el prior (perímetro²·largo): el RLS tiene que corregirlo
+    return 95.0 * g ** 2.4 * L ** 0.8 * H ** 0.3
+
+def _samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        g, L, H = rng.uniform(1.5, 2.4), rng.uniform(1.2, 1.9), rng.uniform(1.1, 1.5)
+        yield _metrics(g, L, H), _truth(g, L, H)
+
+def test_rls_converges_to_the_true_model():
+    m = calibration.RLS()
+    for met, w in _samples(400):
+        m.update(calibration.features(met), w)
+    x = calibration.features(_metrics(2.0, 1.6, 1.3))
+    # el prior se queda un 30 % corto; tras 400 pesadas, menos del 1 %
+    assert calibration.RLS().estimate(x)["weight_kg"] < 0.75 * _truth(2.0, 1.6, 1.3)
+    assert m.estimate(x)["weight_kg"] == pytest.approx(_truth(2.0, 1.6, 1.3), rel=0.01)
+    assert m.theta[1] == pytest.approx(2.4, abs=0.15)
+
+def test_prior_is_the_girth_formula():
+    est = calibration.RLS().estimate(calibration.features(_metrics(2.0, 1.6, 1.3)))
+    assert est["weight_kg"] == pytest.approx(200 ** 2 * 160 / 11877.0, rel=1e-3)
+
+def test_workers_share_samples_through_snapshots(tmp_path):
+    db = str(tmp_path / "calib.sqlite")
+    a, b = calibration.Calibrator(db), calibration.Calibrator(db)
+    for met, w in _samples(calibration.MIN_N, seed=1): a.add(met, w, breed="Brahman")
+    before = b.models
+    assert b.estimate(_metrics(2.0, 1.6, 1.3), "Brahman")["model"] == "formula"
+    # estimate() no consulta la base: las pesadas de otro worker llegan con sync (run_syncer)
+    b.sync(force=True)
+    assert b.models is not before and before == {}
+    est = b.estimate(_metrics(2.0, 1.6, 1.3), "brahman")
+    assert est["model"] == "raza" and est["n"] == calibration.MIN_N
+    assert math.isclose(est["weight_kg"], a.estimate(_metrics(2.0, 1.6, 1.3), "Brahman")["weight_kg"])
@@ -0,0 +1,42 @@
+import asyncio, time
+
+import jobs
+
+def _queue(tmp_path, **kw):
+    return jobs.JobQueue(str(tmp_path / "jobs.sqlite"), str(tmp_path / "spool"), workers=1, **kw)
+
+def _running(q, job_id, owner, beat):
+    q._exec("INSERT INTO jobs (id, status, priority, created, attempts, owner, heartbeat) VALUES (?,?,?,?,?,?,?)",
+            (job_id, "running", 0, time.time(), 1, owner, beat))
+
+def test_expired_lease_is_reclaimed_even_if_owner_looks_alive(tmp_path):
+    q = _queue(tmp_path, lease_s=30)
+    now = time.time()
+    # otra máquina: el PID no se puede comprobar, decide el latido
+    _running(q, "fresh", "otra-maquina:123", now)
+    _running(q, "stale", "otra-maquina:456", now - 60)
+    assert [j[0] for j in q._recover()] == ["stale"]
+    assert dict(q._exec("SELECT id, status FROM jobs")) == {"fresh": "running", "stale": "queued"}
+
+def test_worker_runs_job_and_keeps_heartbeat(tmp_path):
+    q = _queue(tmp_path, lease_s=0.3)
+    beats = []
+    async def run(job, img):
+        for _ in range(3):
+            await asyncio.sleep(0.15)
+            beats.append(q._exec("SELECT heartbeat FROM jobs WHERE id=?", (job["id"],))[0][0])
+        return {"ok": img.decode()}
+    async def go():
+        await q.start(run)
+        job = await q.submit(b"img", "levante", "standard")
+        assert job["status"] == "queued" and job["queue_position"] == 0
+        for _ in range(50):
+            await asyncio.sleep(0.05)
+            job = await q.get(job["id"])
+            if job["status"] == "done": break
+        # mientras corre, el reaper de este mismo proceso no lo reencola
+        await q.stop()
+        return job
+    job = asyncio.run(go())
+    assert job["status"] == "done" and job["result"] == {"ok": "img"} and job["attempts"] == 1
+    assert beats[-1] > beats[0]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import lidar, synthetic
+
+def _box(L=2.0, W=0.6, H=1.0, n=40000, seed=0):
+    # superficie de una caja L×W×H apoyada en un suelo más grande que ella
+    rng = np.random.default_rng(seed)
+    P = rng.uniform([-L/2, 0, -W/2], [L/2, H, W/2], (n, 3))
+    face = rng.integers(0, 5, n)
+    for i, (ax, v) in enumerate([(0, -L/2), (0, L/2), (1, H), (2, -W/2), (2, W/2)]): P[face == i, ax] = v
+    G = np.c_[rng.uniform(-2, 2, n//2), rng.normal(0, 0.002, n//2), rng.uniform(-1.5, 1.5, n//2)]
+    return np.vstack([P, G])
+
+def _rot_x(deg):
+    t = np.radians(deg)
+    return np.array([[1, 0, 0], [0, np.cos(t), -np.sin(t)], [0, np.sin(t), np.cos(t)]])
+
+def _measure(V):
+    return lidar._metrics_from_vertices(np.asarray(V, dtype=float), None)
+
+def test_box_dimensions():
+    m = _measure(_box())
+    assert m["withers_height_m"] == pytest.approx(1.0, rel=0.02)
+    assert m["body_length_m"] == pytest.approx(2.0, rel=0.03)
+    assert m["hip_width_m"] == pytest.approx(0.6, rel=0.03)
+    # sección por encima de LEG_FRAC de la altura: cuadrado 0,6 × 0,6
+    assert m["heart_girth_m"] == pytest.approx(2.4, rel=0.03)
+    assert m["chest_depth_m"] == pytest.approx(0.6, rel=0.03)
+
+def test_ground_inliers_do_not_inflate_height():
+    # suelo inclinado 20° y con la mitad de los puntos: la altura se mide sobre su normal
+    m = _measure(_box() @ _rot_x(20).T)
+    assert m["withers_height_m"] == pytest.approx(1.0, rel=0.02)
+    assert m["body_length_m"] == pytest.approx(2.0, rel=0.03)
+
+def test_synthetic_cow_within_tolerance():
+    m = _measure(synthetic.cattle_cloud(60000))
+    for key, (truth, tol) in synthetic.cattle_truth().items():
+        assert m[key] == pytest.approx(truth, rel=tol), key
+    assert 500 < m["weight_est_kg"] < 1000
+
+def test_cow_orientation_does_not_change_measurements():
+    P = synthetic.cattle_cloud(60000)
+    a, b = _measure(P), _measure(P * [-1, 1, 1])
+    for key in ("withers_height_m", "body_length_m", "heart_girth_m", "chest_depth_m"):
+        assert b[key] == pytest.approx(a[key], rel=0.01), key
+
+def test_ground_only_is_an_error():
+    rng = np.random.default_rng(0)
+    G = np.c_[rng.uniform(-2, 2, 5000), rng.normal(0, 0.002, 5000), rng.uniform(-2, 2, 5000)]
+    assert "error" in _measure(G)
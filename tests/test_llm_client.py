@@ -0,0 +1,149 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import llm_client as lc
+
+def _caller(threshold=2, cooldown=0.2):
+    br = lc.CircuitBreaker(threshold=threshold, cooldown=cooldown)
+    return lc.ResilientCaller(lc.AIMDLimiter(), br, max_retries=3, base_delay=0.01), br
+
+def _server_error():
+    return openai.InternalServerError("x", response=httpx.Response(500, request=httpx.Request("POST", "http://x")), body=None)
+
+async def _bad():
+    raise ValueError("salida no JSON")
+
+async def _slow():
+    await asyncio.sleep(5)
+
+async def _cancelled(c):
+    t = asyncio.ensure_future(c.call(_slow))
+    await asyncio.sleep(0.01)
+    t.cancel()
+    with pytest.raises(asyncio.CancelledError): await t
+
+def test_fallback_and_cancel_leave_breaker_alone():
+    c, br = _caller()
+    async def go():
+        br.failures = 1
+        with pytest.raises(ValueError): await c.call(_bad)
+        await _cancelled(c)
+    asyncio.run(go())
+    assert br.failures == 1 and br.state == "closed"
+
+def test_breaker_checked_on_every_attempt():
+    c, br = _caller()
+    calls = []
+    async def fail():
+        calls.append(1)
+        br.failures = br.threshold
+        br.failure()
+        raise _server_error()
+    async def go():
+        with pytest.raises(lc.CircuitOpenError): await c.call(fail)
+    asyncio.run(go())
+    assert len(calls) == 1
+
+def test_half_open_probe_is_single_attempt():
+    c, br = _caller()
+    calls = []
+    async def fail():
+        calls.append(1)
+        raise _server_error()
+    async def ok():
+        return 1
+    async def go():
+        br.failures = br.threshold - 1
+        br.failure()
+        await asyncio.sleep(0.25)
+        with pytest.raises(openai.InternalServerError): await c.call(fail)
+        assert len(calls) == 1 and br.state == "open"
+        # una sonda cancelada no deja el circuito bloqueado
+        await asyncio.sleep(0.25)
+        await _cancelled(c)
+        assert await c.call(ok) == 1
+    asyncio.run(go())
+    assert br.state == "closed"
+
+def _rate_limited():
+    return openai.RateLimitError("x", response=httpx.Response(429, request=httpx.Request("POST", "http://x")), body=None)
+
+def _chunks(n, fail=None):
+    async def gen():
+        for i in range(n):
+            await asyncio.sleep(0)
+            yield i
+        if fail is not None: raise fail
+    async def make():
+        return gen()
+    return make
+
+def test_stream_holds_limiter_slot_until_fully_read():
+    c, br = _caller()
+    async def go():
+        seen = []
+        async for i in c.stream(_chunks(3)):
+            seen.append((i, c.limiter.inflight))
+        return seen
+    assert asyncio.run(go()) == [(0, 1), (1, 1), (2, 1)]
+    assert c.limiter.inflight == 0 and br.failures == 0
+
+def test_stream_error_midway_counts_and_is_not_retried():
+    c, br = _caller(threshold=5)
+    limit = c.limiter.limit
+    makes = []
+    make = _chunks(2, _rate_limited())
+    async def counted():
+        makes.append(1)
+        return await make()
+    async def go():
+        got = []
+        with pytest.raises(openai.RateLimitError):
+            async for i in c.stream(counted): got.append(i)
+        return got
+    assert asyncio.run(go()) == [0, 1]
+    assert len(makes) == 1 and br.failures == 1
+    assert c.limiter.inflight == 0 and c.limiter.limit < limit
+
+def test_stream_retries_before_the_first_chunk():
+    c, br = _caller()
+    makes = []
+    async def flaky():
+        makes.append(1)
+        if len(makes) == 1: raise _server_error()
+        return await _chunks(2)()
+    async def go():
+        return [i async for i in c.stream(flaky)]
+    assert asyncio.run(go()) == [0, 1] and len(makes) == 2 and br.failures == 0
+
+def test_stream_closed_early_releases_slot():
+    c, br = _caller()
+    async def go():
+        s = c.stream(_chunks(5))
+        assert await s.__anext__() == 0
+        await s.aclose()
+    asyncio.run(go())
+    assert c.limiter.inflight == 0 and br.state == "closed"
+
+def test_api_path_counts_changes_not_records(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lc.time, "time", lambda: now[0])
+    paths = lc.ApiPathCache(reprobe_s=100)
+    changes = lambda: lc.metrics.value("gb_llm_api_path_changes_total", path="chat")
+    before = changes()
+    paths.record("u", "m", "chat", reason="NotFoundError")
+    for _ in range(3): paths.record("u", "m", "chat", reason="NotFoundError")
+    assert changes() == before + 1
+    assert paths.choose("u", "m") == "chat"
+    now[0] += 100
+    # sondeo de responses; vuelve a fallar: el próximo, reprobe_s después de este, no del cambio
+    assert paths.choose("u", "m") == "responses"
+    paths.record("u", "m", "chat", reason="NotFoundError")
+    now[0] += 50
+    assert paths.choose("u", "m") == "chat"
+    now[0] += 50
+    assert paths.choose("u", "m") == "responses"
+    assert paths.state()[0]["since"] == 1000.0 and changes() == before + 1
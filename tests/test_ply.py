@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import ply
+from synthetic import write_ply
+
+P = np.array([[0.0, 1.0, 2.0], [1.5, -2.0, 0.25], [3.0, 4.0, 5.0]])
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_reads_ascii_and_binary_from_path_and_bytes(tmp_path, binary):
+    path = tmp_path / "c.ply"
+    write_ply(P, str(path), binary=binary)
+    for src in (str(path), path.read_bytes()):
+        V, faces = ply.read_ply_vertices(src)
+        assert V.dtype == np.float64 and faces == 0
+        np.testing.assert_allclose(V, P, atol=1e-5)
+
+def test_extra_props_big_endian_and_faces():
+    head = (b"ply\nformat binary_big_endian 1.0\ncomment x\nelement vertex 2\nproperty uchar red\n"
+            b"property double z\nproperty double y\nproperty double x\nelement face 1\n"
+            b"property list uchar int vertex_indices\nend_header\n")
+    rec = np.array([(7, 3.0, 2.0, 1.0), (8, 6.0, 5.0, 4.0)], dtype=[("r", "u1"), ("z", ">f8"), ("y", ">f8"), ("x", ">f8")])
+    V, faces = ply.read_ply_vertices(head + rec.tobytes() + b"\x03" + b"\x00" * 12)
+    assert faces == 1 and V.tolist() == [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_truncated_vertex_block(tmp_path, binary):
+    path = tmp_path / "c.ply"
+    write_ply(P, str(path), binary=binary)
+    data = path.read_bytes()[:-8]
+    path.write_bytes(data)
+    for src in (str(path), data):
+        with pytest.raises(ply.PLYError): ply.read_ply_vertices(src)
+
+@pytest.mark.parametrize("data", [b"obj\n", b"ply\nformat ascii 1.0\nelement vertex 3\n",
+                                  b"ply\nformat ascii 1.0\nelement vertex 1\nproperty float x\nend_header\n1\n",
+                                  b"ply\nformat ascii 1.0\nelement vertex 1\nproperty float x\nproperty float y\n"
+                                  b"property float z\nend_header\n1 a 2\n"])
+def test_malformed_inputs(data):
+    with pytest.raises(ply.PLYError): ply.read_ply_vertices(data)
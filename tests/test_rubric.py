@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+
+import main, rubric
+from rubric import ORDER
+
+def test_canon_key_aliases_and_near_misses():
+    assert rubric.canon_key("condicion corporal") == rubric.canon_key("BCS") == ORDER[0]
+    assert rubric.canon_key("Profundida de pecho") == "Profundidad de pecho"
+    assert rubric.canon_key("loma") == "Lomo" and rubric.canon_key("chest widht") == "Ancho torácico"
+    assert rubric.canon_key("loma", fuzzy=False) is None
+
+def test_short_or_ambiguous_keys_are_not_guessed():
+    for k in ("abs", "leg", "bc", "cola", "lino", "x"):
+        assert rubric.canon_key(k) is None, k
+
+def test_canonize_first_key_wins_and_rounds():
+    out = rubric.canonize({"Lomo": 7.3, "loin": 2, "Grupa": "x", 3: 1, "abs": 9})
+    assert out == {"Lomo": 7.5, "Grupo / muscling posterior": 0.0}
+    v = rubric.vector({"topline": 6})
+    assert v[rubric.INDEX["Línea dorsal"]] == 6 and np.isnan(v).sum() == rubric.N - 1
+
+def _repairs(tier):
+    return main.metrics.value("gb_rubric_repairs_total", tier=tier)
+
+def _ensure(monkeypatch, data, followup=None, vision=None, ctx={"transcript": []}):
+    calls = []
+    async def run_followup(ctx, prompt, schema=None):
+        calls.append("followup")
+        if isinstance(followup, Exception): raise followup
+        return followup
+    async def run_prompt(prompt, image_b64, schema=None, mime="image/jpeg"):
+        calls.append("vision")
+        return vision
+    monkeypatch.setattr(main, "run_followup", run_followup)
+    monkeypatch.setattr(main, "run_prompt", run_prompt)
+    return asyncio.run(main.ensure_rubric("b64", data, ctx=ctx)), calls
+
+def test_repair_tiers(monkeypatch):
+    full = {k: 5 for k in ORDER}
+    before = {t: _repairs(t) for t in ("none", "fuzzy", "followup", "vision", "zero_fill")}
+    # nombres casi correctos: se arreglan sin llamar al modelo
+    near = dict(full); near["Loma"] = near.pop("Lomo")
+    out, calls = _ensure(monkeypatch, {"rubric": near})
+    assert calls == [] and out["Lomo"] == 5
+    # faltan dos: un seguimiento solo-texto con las que faltan
+    part = {k: 6 for k in ORDER[:-2]}
+    out, calls = _ensure(monkeypatch, {"rubric": part}, followup={"rubric": {k: 4 for k in ORDER[-2:]}})
+    assert calls == ["followup"] and out[ORDER[0]] == 6 and out[ORDER[-1]] == 4
+    # seguimiento fallido: una llamada con imagen que solo rellena huecos
+    out, calls = _ensure(monkeypatch, {"rubric": part}, followup=RuntimeError("x"), vision={"rubric": {ORDER[-1]: 3}})
+    assert calls == ["followup", "vision"] and out[ORDER[0]] == 6 and out[ORDER[-1]] == 3 and out[ORDER[-2]] == 0.0
+    # rúbrica vacía: directamente la llamada con imagen
+    out, calls = _ensure(monkeypatch, {}, vision={"rubric": full})
+    assert calls == ["vision"] and out == {k: 5.0 for k in ORDER}
+    assert [_repairs(t) - before[t] for t in ("none", "fuzzy", "followup", "vision", "zero_fill")] == [0, 1, 1, 2, 1]
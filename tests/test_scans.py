@@ -0,0 +1,37 @@
+import asyncio, time
+
+import scans
+
+# en el proceso hijo (spawn importa este módulo por nombre)
+def _stuck(path, filename, meta, timeout_s):
+    # bucle que SIGALRM no corta: ni siquiera se arma
+    time.sleep(30)
+
+def _quick(path, filename, meta, timeout_s):
+    return {"withers_height_m": 1.3}
+
+def _tmp(tmp_path, name):
+    p = tmp_path / name
+    p.write_bytes(b"ply\n")
+    return str(p)
+
+def test_timeout_kills_the_runaway_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(scans, "TIMEOUT_S", 0.5)
+    monkeypatch.setattr(scans, "GRACE_S", 0.5)
+    async def go():
+        monkeypatch.setattr(scans.lidar, "extract_lidar_metrics_job", _stuck)
+        stuck = asyncio.ensure_future(scans.process(_tmp(tmp_path, "a.ply"), "a.ply", {}))
+        await asyncio.sleep(0.3)
+        procs = list(scans._pool._processes.values())
+        assert procs and "error" in await stuck
+        assert scans._pool is None
+        monkeypatch.setattr(scans.lidar, "extract_lidar_metrics_job", _quick)
+        t0 = time.monotonic()
+        res = await scans.process(_tmp(tmp_path, "b.ply"), "b.ply", {})
+        return procs, res, time.monotonic() - t0
+    try:
+        procs, res, elapsed = asyncio.run(go())
+    finally:
+        scans.shutdown()
+    assert res == {"withers_height_m": 1.3} and elapsed < 20
+    for p in procs: p.join(5); assert not p.is_alive()
@@ -0,0 +1,49 @@
+import pytest
+
+import shared_state
+
+@pytest.fixture(params=["memory", "sqlite"])
+def pair(request, tmp_path, monkeypatch):
+    # dos "workers" sobre el mismo estado; el reloj lo controla la prueba
+    now = [1000.0]
+    monkeypatch.setattr(shared_state.time, "time", lambda: now[0])
+    if request.param == "memory":
+        b = shared_state.MemoryBackend()
+        return b, b, now
+    path = str(tmp_path / "s.db")
+    return shared_state.SQLiteBackend(path), shared_state.SQLiteBackend(path), now
+
+def test_lease_add_renew_release(pair):
+    a, b, now = pair
+    assert a.add("lease:k", "w1", 10)
+    assert not b.add("lease:k", "w2", 10) and b.get("lease:k") == "w1"
+    # solo el dueño renueva o libera
+    assert not b.renew("lease:k", "w2", 10)
+    now[0] += 8
+    assert a.renew("lease:k", "w1", 10)
+    now[0] += 8
+    assert not b.add("lease:k", "w2", 10)
+    b.release("lease:k", "w2")
+    assert a.get("lease:k") == "w1"
+    a.release("lease:k", "w1")
+    assert b.add("lease:k", "w2", 10)
+
+def test_expired_lease_is_taken_over(pair):
+    a, b, now = pair
+    assert a.add("lease:k", "w1", 5)
+    now[0] += 5
+    assert not a.renew("lease:k", "w1", 5) and a.get("lease:k") is None
+    assert b.add("lease:k", "w2", 5) and a.get("lease:k") == "w2"
+
+def test_incr_restarts_after_ttl(pair):
+    a, b, now = pair
+    assert [a.incr("rpm", 60), b.incr("rpm", 60), a.incr("rpm", 60)] == [1, 2, 3]
+    now[0] += 60
+    assert b.incr("rpm", 60) == 1
+
+def test_sqlite_evicts_only_cache_entries(tmp_path):
+    s = shared_state.SQLiteBackend(str(tmp_path / "s.db"), max_items=5)
+    assert s.add("lease:k", "w1", 3600)
+    for i in range(200): s.set(f"c{i}", "x", 3600 + i, evictable=True)
+    assert s.get("lease:k") == "w1" and s.get("c199") == "x" and s.get("c0") is None
+    assert s._exec("SELECT COUNT(*) FROM kv WHERE evictable=1")[0][0] == 5
@@ -0,0 +1,48 @@
+import numpy as np
+
+import store
+from rubric import ORDER
+
+def _result(i, category):
+    return {"category": category, "mode": "standard", "rubric": {k: (i % 10) + 0.5 for k in ORDER},
+            "decision": {"decision_level": "COMPRAR" if i % 2 else "CONSIDERAR", "global_score": float(i % 10)},
+            "health": {"flags": ["cojera"] if i % 3 == 0 else []}, "breed": {"guess": "Brahman"}}
+
+def _store(tmp_path, monkeypatch, n, now=1000.0):
+    monkeypatch.setattr(store.time, "time", lambda: now)  # created repetido: desempata el id
+    s = store.EvaluationStore(str(tmp_path / "e.db"))
+    for i in range(n): s.record(_result(i, "levante" if i % 2 else "cria"), animal_id=f"a{i}")
+    return s
+
+def _pages(s, limit, **filters):
+    ids, cursor = [], None
+    while True:
+        page = s.query(limit=limit, cursor=cursor, **filters)
+        ids += [it["id"] for it in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None: return ids
+
+def test_keyset_pages_cover_everything_once(tmp_path, monkeypatch):
+    s = _store(tmp_path, monkeypatch, 23)
+    assert _pages(s, 5) == list(range(23, 0, -1))
+    assert _pages(s, 4, category="levante") == [i + 1 for i in range(22, -1, -1) if i % 2]
+    assert s.query(limit=23)["next_cursor"] is None
+
+def test_new_rows_do_not_shift_later_pages(tmp_path, monkeypatch):
+    s = _store(tmp_path, monkeypatch, 10)
+    first = s.query(limit=4)
+    monkeypatch.setattr(store.time, "time", lambda: 2000.0)
+    s.record(_result(99, "cria"))
+    rest = s.query(limit=100, cursor=first["next_cursor"])
+    assert [it["id"] for it in first["items"] + rest["items"]] == list(range(10, 0, -1))
+    assert s.query(limit=1)["items"][0]["id"] == 11
+
+def test_matrix_and_summary(tmp_path, monkeypatch):
+    s = _store(tmp_path, monkeypatch, 6)
+    item = s.get(1)
+    assert item["rubric"]["Lomo"] == 0.5 and item["decision"]["global_score"] == 0.0
+    rows, M = s.matrix(category="levante")
+    assert [r[1] for r in rows] == ["a1", "a3", "a5"] and M.shape == (3, len(ORDER))
+    np.testing.assert_array_equal(M[:, 0], [1.5, 3.5, 5.5])
+    summ = s.summary()
+    assert summ["count"] == 6 and summ["health_flags"] == {"cojera": 2} and summ["breeds"] == {"Brahman": 6}
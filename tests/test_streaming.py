@@ -0,0 +1,57 @@
+import asyncio, json
+
+import httpx
+
+import main, streaming
+
+def _asgi_post(path, files, data):
+    # petición ASGI a mano: tras el cuerpo, receive() solo devuelve la desconexión del cliente
+    req = httpx.Request("POST", "http://test" + path, files=files, data=data, headers={"accept": "text/event-stream"})
+    body = req.read()
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in req.headers.items()], "server": ("test", 80), "client": ("c", 1)}
+    msgs = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    async def receive():
+        if msgs: return msgs.pop(0)
+        return {"type": "http.disconnect"}
+    async def send(msg):
+        # como un servidor real, enviar cede el control: la desconexión llega antes del primer fragmento
+        await asyncio.sleep(0)
+        sent.append(msg)
+    return scope, receive, send, sent
+
+def test_sse_cleanup_runs_when_client_leaves_before_streaming(monkeypatch):
+    closed, started = [], []
+    monkeypatch.setattr(main.uploads, "close_all", lambda views: closed.extend(views))
+    async def never(*a, **kw):
+        started.append(1)
+        await asyncio.sleep(10)
+        yield "result", {}
+    monkeypatch.setattr(main, "evaluate_bytes_stream", never)
+    scope, receive, send, _ = _asgi_post("/api/evaluate", [("file", ("a.jpg", b"\xff\xd8jpeg", "image/jpeg"))], {"category": "levante"})
+    asyncio.run(asyncio.wait_for(main.app(scope, receive, send), 5))
+    assert len(closed) == 1 and not started
+
+DOC = {"category": "levante", "rubric": {"Lomo": 7.5, "nota": 'a}b,"c"'}, "flags": [1, [2, {"x": 3}]], "score": 8}
+
+def _scan(chunks):
+    sc, out = streaming.SectionScanner(), []
+    for ch in chunks: out.extend(sc.feed(ch))
+    return out
+
+def test_section_scanner_is_chunk_boundary_independent():
+    text = "```json\n" + json.dumps(DOC, ensure_ascii=False, indent=1) + "\n```"
+    whole = _scan([text])
+    assert whole == list(DOC.items())
+    # cualquier corte, incluso dentro de claves, cadenas con escapes o números
+    for cut in range(1, len(text)):
+        assert _scan([text[:cut], text[cut:]]) == whole, cut
+    assert _scan(list(text)) == whole
+
+def test_section_scanner_emits_each_section_once_when_complete():
+    sc = streaming.SectionScanner()
+    assert sc.feed('{"a": {"b": 1}, "c": 2') == [("a", {"b": 1})]
+    assert sc.feed("0") == []
+    assert sc.feed("}") == [("c", 20)]
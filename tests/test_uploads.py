@@ -0,0 +1,51 @@
+import base64, io, tempfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+Image = pytest.importorskip("PIL.Image")
+
+import imaging, main, uploads
+from mock_openai import MockAsyncOpenAI
+
+def _small_jpeg():
+    # con textura y calidad baja: recomprimir a GB_IMG_QUALITY la agranda y se envía tal cual
+    buf = io.BytesIO()
+    Image.effect_noise((160, 120), 64).convert("RGB").save(buf, "JPEG", quality=30)
+    return buf.getvalue()
+
+def test_passthrough_from_spooled_upload(monkeypatch):
+    monkeypatch.setattr(main, "client", MockAsyncOpenAI(latency_s=0.0, jitter_s=0.0))
+    monkeypatch.setattr(main, "RESULTS", None)
+    raw = _small_jpeg()
+    with TestClient(main.app) as c:
+        r = c.post("/api/evaluate", data={"category": "levante"}, files=[("file", ("s.jpg", raw, "image/jpeg"))])
+    assert r.status_code == 200, r.text
+    info = r.json()["image"]
+    assert info["processed"] is False and info["out_bytes"] == info["orig_bytes"] == len(raw)
+
+def test_passthrough_keeps_file_and_encodes_in_chunks():
+    raw = _small_jpeg()
+    f = io.BytesIO(raw)
+    out, mime, info = imaging.normalize_image(f)
+    assert out is f and mime == "image/jpeg" and not info["processed"] and info["out_bytes"] == len(raw)
+    assert imaging.b64encode(out, chunk=3 * 1024) == base64.b64encode(raw).decode("ascii")
+
+def test_upload_resident_bytes():
+    f = tempfile.SpooledTemporaryFile(max_size=1024)
+    f.write(b"x" * 100)
+    u = uploads.Upload(f, "a.jpg", 100, "")
+    assert u.resident() == 100
+    f.write(b"x" * 2000)
+    assert u.resident() == 0
+    u.close()
+
+def test_prepare_hit_reports_its_own_timing():
+    raw = _small_jpeg() + b"prepare-hit"
+    b64, mime, first = imaging.prepare(raw)
+    again = imaging.prepare(raw)
+    assert again[:2] == (b64, mime) and "cached" not in first
+    info = again[2]
+    assert info["cached"] is True and info["ms"] < 5 and info["orig_bytes"] == first["orig_bytes"]
+    first["ms"] = -1
+    assert imaging.prepare(raw)[2]["ms"] >= 0
@@ -0,0 +1,86 @@
+# Trazas ligeras por petición: spans por etapa en un contextvar, histograma por etapa en /metrics
+# y cabecera Server-Timing opcional. Sin dependencias: middleware ASGI puro.
+import contextvars, os, time
+from contextlib import contextmanager
+
+import metrics
+
+SERVER_TIMING = os.getenv("GB_SERVER_TIMING", "0").strip() not in ("0", "", "false", "False")
+
+metrics.describe("gb_stage_seconds", "Duración de cada etapa de la evaluación (lectura, imagen, modelo, rúbrica, LiDAR...).")
+metrics.describe("gb_http_request_seconds", "Duración de las peticiones HTTP por ruta, método y código.")
+metrics.describe("gb_request_peak_bytes", "Pico de bytes de payload retenidos por petición (subida, base64 de las imágenes).")
+BYTES_BUCKETS = tuple(2 ** i for i in range(14, 31, 2))  # 16 KB .. 1 GB
+
+_trace = contextvars.ContextVar("gb_trace", default=None)
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []  # (etapa, segundos) en orden de finalización
+        self.held = self.peak_bytes = 0
+
+    def totals(self):
+        out = {}
+        for name, dur in self.spans: out[name] = out.get(name, 0.0) + dur
+        return out
+
+    def server_timing(self, total=None):
+        parts = [f"{name};dur={dur * 1000:.1f}" for name, dur in self.totals().items()]
+        if total is not None: parts.append(f"total;dur={total * 1000:.1f}")
+        if self.peak_bytes: parts.append(f'payload;desc="peak_bytes={self.peak_bytes}"')
+        return ", ".join(parts)
+
+def current():
+    return _trace.get()
+
+@contextmanager
+def span(name):
+    # Sirve alrededor de código síncrono o de un await; las tareas hijas heredan la traza
+    # (el contextvar se copia al crearlas y la lista de spans es compartida).
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dur = time.perf_counter() - t0
+        metrics.observe("gb_stage_seconds", dur, stage=name)
+        tr = _trace.get()
+        if tr is not None: tr.spans.append((name, dur))
+
+def hold(n):
+    # Contabilidad de buffers grandes de la petición (no es RSS): hold al crearlos, release al soltarlos.
+    tr = _trace.get()
+    if tr is not None:
+        tr.held += n
+        if tr.held > tr.peak_bytes: tr.peak_bytes = tr.held
+
+def release(n):
+    tr = _trace.get()
+    if tr is not None: tr.held -= n
+
+class TracingMiddleware:
+    def __init__(self, app, server_timing=SERVER_TIMING):
+        self.app, self.server_timing = app, server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        tr = Trace()
+        token = _trace.set(tr)
+        status = [500]
+
+        async def send_wrapper(msg):
+            if msg["type"] == "http.response.start":
+                status[0] = msg["status"]
+                if self.server_timing:
+                    msg = {**msg, "headers": list(msg.get("headers", [])) +
+                           [(b"server-timing", tr.server_timing(time.perf_counter() - tr.start).encode("latin-1"))]}
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.observe("gb_http_request_seconds", time.perf_counter() - tr.start,
+                            route=route, method=scope.get("method", ""), status=status[0])
+            if tr.peak_bytes: metrics.observe("gb_request_peak_bytes", tr.peak_bytes, BYTES_BUCKETS, route=route)
@@ -0,0 +1,110 @@
+# Subidas sin el cuerpo entero en memoria: límite de bytes por endpoint aplicado mientras llega el
+# cuerpo (413 antes de parsear el multipart) y lectura por bloques de los UploadFile, que Starlette
+# ya vuelca a disco por encima de 1 MB. La imagen viaja como archivo hasta la normalización.
+import hashlib, io, json, os
+
+import tracing
+
+MB = 1024 * 1024
+IMAGE_MAX_BYTES = int(float(os.getenv("GB_UPLOAD_MAX_MB", "25")) * MB)
+BATCH_MAX_BYTES = int(float(os.getenv("GB_BATCH_MAX_MB", "500")) * MB)
+CHUNK = 1 << 20
+# campos de texto y cabeceras multipart
+FORM_SLACK = 64 * 1024
+
+class TooLarge(Exception):
+    pass
+
+class Upload:
+    # Archivo subido ya contado y con su sha256; .file es el temporal de Starlette (memoria o disco)
+    # y pasa a ser nuestro: FastAPI cierra los UploadFile al volver del endpoint, antes que los streams.
+    __slots__ = ("file", "filename", "size", "digest")
+
+    def __init__(self, file, filename, size, digest):
+        self.file, self.filename, self.size, self.digest = file, filename, size, digest
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def resident(self):
+        # bytes en memoria: SpooledTemporaryFile aún no volcado a disco o BytesIO
+        f = self.file
+        return self.size if isinstance(f, io.BytesIO) or getattr(f, "_rolled", True) is False else 0
+
+    def close(self):
+        try: self.file.close()
+        except Exception: pass
+
+async def spool(upload, max_bytes=IMAGE_MAX_BYTES, chunk=CHUNK):
+    # Una pasada por bloques: tamaño + sha256 sin juntar el archivo en un bytes.
+    h, size = hashlib.sha256(), 0
+    await upload.seek(0)
+    with tracing.span("upload_read"):
+        while True:
+            part = await upload.read(chunk)
+            if not part: break
+            size += len(part)
+            if size > max_bytes: raise TooLarge(f"{upload.filename or 'archivo'}: mayor de {max_bytes} bytes")
+            tracing.hold(len(part)); h.update(part); tracing.release(len(part))
+    fh, upload.file = upload.file, io.BytesIO()
+    fh.seek(0)
+    return Upload(fh, upload.filename, size, h.hexdigest())
+
+async def spool_all(files, max_bytes=IMAGE_MAX_BYTES):
+    out = []
+    try:
+        for f in files: out.append(await spool(f, max_bytes))
+    except BaseException:
+        close_all(out)
+        raise
+    return out
+
+def close_all(uploads):
+    for u in uploads: u.close()
+
+def read_capped(f, max_bytes=IMAGE_MAX_BYTES, name=None):
+    # lectura síncrona (en hilo) de un archivo del lote sin pasar del límite por imagen
+    data = f.read(max_bytes + 1)
+    if len(data) > max_bytes: raise TooLarge(f"{name or 'archivo'}: mayor de {max_bytes} bytes")
+    return data
+
+class BodyLimitMiddleware:
+    # limits: {ruta: bytes}. Con Content-Length se corta sin leer nada; sin él (chunked) se cuenta
+    # lo recibido y, al pasarse, se descarta la respuesta de la app y se devuelve 413.
+    def __init__(self, app, limits):
+        self.app, self.limits = app, limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None: return await self.app(scope, receive, send)
+        length = dict(scope.get("headers") or []).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            return await _too_large(send, limit)
+        state = {"received": 0, "over": False, "started": False}
+
+        async def receive_wrapper():
+            msg = await receive()
+            if msg["type"] == "http.request":
+                state["received"] += len(msg.get("body", b""))
+                if state["received"] > limit:
+                    state["over"] = True
+                    raise TooLarge(f"cuerpo mayor de {limit} bytes")
+            return msg
+
+        async def send_wrapper(msg):
+            if state["over"]: return
+            if msg["type"] == "http.response.start": state["started"] = True
+            await send(msg)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception:
+            if not state["over"]: raise
+        if state["over"] and not state["started"]: await _too_large(send, limit)
+
+async def _too_large(send, limit):
+    body = json.dumps({"error": "subida_demasiado_grande", "max_bytes": limit}).encode("utf-8")
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")]})
+    await send({"type": "http.response.body", "body": body})